@@ -16,12 +16,14 @@
 """
 from __future__ import print_function
 
+import gzip
 import os.path
 import h5py
 import pytest  # pylint: disable=unused-import
 
 from basic_modules.metadata import Metadata
 
+from mg_process_files.tool.gff3_reader import gff3_batches
 from mg_process_files.tool.gff3_sorter import gff3SortTool
 from mg_process_files.tool.gff3_indexer import gff3IndexerTool
 
@@ -92,3 +94,302 @@ def test_gff3_02_indexer():
     assert os.path.getsize(resource_path + "sample.gff3.gz") > 0
     assert os.path.isfile(resource_path + "sample.gff3.gz.tbi") is True
     assert os.path.getsize(resource_path + "sample.gff3.gz.tbi") > 0
+
+    with gzip.open(resource_path + "sample.gff3.gz", "rb") as f_in:
+        with open(resource_path + "sample.sorted.gff3", "rb") as f_sorted:
+            assert f_in.read() == f_sorted.read()
+
+    with gzip.open(resource_path + "sample.gff3.gz.tbi", "rb") as f_in:
+        assert f_in.read(4) == b"TBI\x01"
+
+
+@pytest.mark.gff3
+def test_gff3_03_feature_types():
+    """
+    Function to test the per feature type presence datasets
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    f_check = h5py.File(resource_path + "file_index.hdf5", "a")
+    f_check.close()
+
+    input_files = {
+        "gff3": resource_path + "sample.sorted.gff3",
+        "chrom_file": resource_path + "chrom_GRCh38.size",
+        "hdf5_file": resource_path + "file_index.hdf5"
+    }
+
+    output_files = {
+        "gz_file": resource_path + "sample.types.gff3.gz",
+        "tbi_file": resource_path + "sample.types.gff3.gz.tbi"
+    }
+
+    metadata = {
+        "gff3": Metadata(
+            "data_rnaseq", "gff3", "test_gff3_location", [], {'assembly': 'test_types'}),
+        "hdf5_file": Metadata(
+            "data_file", "hdf5", "test_location", [], {}
+        )
+    }
+
+    gi_handle = gff3IndexerTool({"gff3_feature_types": ["ChIP_seq_region", "gene"]})
+    gi_handle.run(input_files, metadata, output_files)
+
+    f_check = h5py.File(resource_path + "file_index.hdf5", "r")
+    tgrp = f_check["test_types"]["feature_types"]
+    assert sorted(tgrp.keys()) == ["ChIP_seq_region", "gene"]
+    # sample.gff3 has a peak at chr22:10729209-10729307
+    assert tgrp["ChIP_seq_region"][0, 0, 10729] == 1
+    assert tgrp["gene"][0, 0, :].sum() == 0
+    f_check.close()
+
+
+@pytest.mark.gff3
+def test_gff3_04_attribute_lookup():
+    """
+    Function to test the attribute lookup table built by the GFF3 indexer
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    locations = gff3IndexerTool.get_attribute_locations(
+        resource_path + "file_index.hdf5", "test", "DRR000150.bam_peak_989")
+
+    assert len(locations) == 1
+    assert locations[0]["chrom"] == "chr22"
+    assert locations[0]["start"] == 10729209
+    assert locations[0]["end"] == 10729307
+
+    with open(resource_path + "sample.sorted.gff3", "rb") as f_in:
+        f_in.seek(locations[0]["offset"])
+        assert b"ID=DRR000150.bam_peak_989" in f_in.readline()
+
+    locations = gff3IndexerTool.get_attribute_locations(
+        resource_path + "file_index.hdf5", "test", "DRR000150.bam_peak_99", prefix=True)
+    assert len(locations) > 1
+    assert all(loc["key"].startswith("DRR000150.bam_peak_99") for loc in locations)
+
+
+@pytest.mark.gff3
+def test_gff3_05_bgzf_threads():
+    """
+    Function to test that the multithreaded BGZF compression generates the
+    same files as the single threaded compression
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    gi_handle = gff3IndexerTool({"bgzf_threads": 4})
+    gi_handle.gff32tabix(
+        resource_path + "sample.sorted.gff3",
+        resource_path + "sample.threads.gff3.gz",
+        resource_path + "sample.threads.gff3.gz.tbi",
+        4)
+
+    for suffix in ("gff3.gz", "gff3.gz.tbi"):
+        with open(resource_path + "sample." + suffix, "rb") as f_single:
+            with open(resource_path + "sample.threads." + suffix, "rb") as f_threads:
+                assert f_single.read() == f_threads.read()
+
+
+@pytest.mark.gff3
+def test_gff3_06_gene_models():
+    """
+    Function to test the gene model hierarchy built by the GFF3 indexer
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    gff3_lines = [
+        "##gff-version 3",
+        "chr1\t.\tgene\t100\t900\t.\t+\t.\tID=gene1;Name=G1",
+        "chr1\t.\tmRNA\t100\t900\t.\t+\t.\tID=tx1;Parent=gene1",
+        "chr1\t.\texon\t100\t200\t.\t+\t.\tID=ex1;Parent=tx1,tx2",
+        "chr1\t.\tmRNA\t100\t700\t.\t+\t.\tID=tx2;Parent=gene1",
+        "chr1\t.\texon\t600\t700\t.\t+\t.\tID=ex2;Parent=tx2",
+        "chr1\t.\texon\t800\t900\t.\t+\t.\tID=ex3;Parent=tx1",
+        "chr1\t.\tgene\t2000\t3000\t.\t-\t.\tID=gene2",
+        "chr2\t.\tChIP_seq_region\t50\t80\t.\t.\t.\tName=peak1",
+    ]
+    with open(resource_path + "sample.models.gff3", "w") as f_out:
+        f_out.write("\n".join(gff3_lines) + "\n")
+
+    gi_handle = gff3IndexerTool()
+    gi_handle.gff32hdf5(
+        "models", "test", resource_path + "sample.models.gff3",
+        resource_path + "gene_models.hdf5")
+
+    model = gff3IndexerTool.get_gene_model(
+        resource_path + "gene_models.hdf5", "test", "models", "gene1")
+
+    assert [feature["id"] for feature in model] == [
+        "gene1", "tx1", "ex1", "ex3", "tx2", "ex1", "ex2"]
+    assert [feature["parent"] for feature in model] == [-1, 0, 1, 1, 0, 4, 4]
+    assert model[0]["children"] == [1, 4]
+    assert model[1]["children"] == [2, 3]
+    assert model[4]["children"] == [5, 6]
+    assert model[3]["start"] == 800 and model[3]["end"] == 900
+    assert model[0]["strand"] == "+"
+
+    with open(resource_path + "sample.models.gff3", "rb") as f_in:
+        f_in.seek(model[6]["offset"])
+        assert b"ID=ex2;" in f_in.readline()
+
+    model = gff3IndexerTool.get_gene_model(
+        resource_path + "gene_models.hdf5", "test", "models", "tx2")
+    assert [feature["id"] for feature in model] == ["tx2", "ex1", "ex2"]
+
+    model = gff3IndexerTool.get_gene_model(
+        resource_path + "gene_models.hdf5", "test", "models", "gene2")
+    assert len(model) == 1 and model[0]["chrom"] == "chr1" and model[0]["strand"] == "-"
+
+    assert gff3IndexerTool.get_gene_model(
+        resource_path + "gene_models.hdf5", "test", "models", "gene3") == []
+
+
+@pytest.mark.gff3
+def test_gff3_07_feature_counts():
+    """
+    Function to test the per bin feature counts built by the GFF3 indexer
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    starts = []
+    with open(resource_path + "sample.sorted.gff3", "r") as f_in:
+        for line in f_in:
+            sline = line.split("\t")
+            if line[0] != "#" and sline[0] == "chr22" and sline[2] == "ChIP_seq_region":
+                starts.append(int(sline[3]))
+
+    for bin_size in (10000, 100000, 1000000):
+        file_ids, bin_starts, counts = gff3IndexerTool.get_feature_counts(
+            resource_path + "file_index.hdf5", "test_types", "chr22", "ChIP_seq_region",
+            bin_size)
+
+        assert file_ids == [resource_path + "sample.sorted.gff3"]
+        assert counts.shape == (1, len(bin_starts))
+        assert counts.sum() == len(starts)
+        assert counts[0, (starts[0] - 1) // bin_size] > 0
+        assert bin_starts[1] - bin_starts[0] == bin_size
+
+    file_ids, bin_starts, counts = gff3IndexerTool.get_feature_counts(
+        resource_path + "file_index.hdf5", "test_types", "chr22", "gene", 1000000)
+    assert counts.sum() == 0
+
+
+@pytest.mark.gff3
+def test_gff3_08_reader():
+    """
+    Function to test the batched GFF3 record reader
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    with open(resource_path + "sample.models.gff3", "rb") as f_in:
+        batches = list(gff3_batches(f_in, batch_size=3))
+
+    assert [len(batch) for batch in batches] == [3, 3, 2]
+    assert batches[0].headers == [b"##gff-version 3\n"]
+    assert batches[0].types.tolist() == [b"gene", b"mRNA", b"exon"]
+    assert batches[0].starts.tolist() == [100, 100, 100]
+    assert batches[2].seqid_blocks() == [("chr1", 0, 1), ("chr2", 1, 2)]
+
+    assert batches[0].attribute(2, b"Parent") == [b"tx1", b"tx2"]
+    assert batches[0].attribute(2, b"Name") == []
+    assert batches[2].attribute(1, b"Name") == [b"peak1"]
+    assert batches[0].attributes(2, (b"ID", b"Name", b"Parent")) == [
+        batches[0].attribute(2, b"ID"), [], [b"tx1", b"tx2"]]
+
+    with open(resource_path + "sample.models.gff3", "rb") as f_in:
+        f_in.seek(batches[1].offsets[2])
+        assert f_in.readline() == batches[1].lines[2]
+
+
+@pytest.mark.gff3
+def test_gff3_09_reindex():
+    """
+    Function to test that loading a file into the GFF3 index again replaces
+    the previous load in place
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    gi_handle = gff3IndexerTool()
+    for file_id in ("models_a", "models_b"):
+        gi_handle.gff32hdf5(
+            file_id, "test", resource_path + "sample.models.gff3",
+            resource_path + "reindex.hdf5")
+    file_size = os.path.getsize(resource_path + "reindex.hdf5")
+
+    for _ in range(3):
+        gi_handle.gff32hdf5(
+            "models_a", "test", resource_path + "sample.models.gff3",
+            resource_path + "reindex.hdf5")
+    assert os.path.getsize(resource_path + "reindex.hdf5") == file_size
+
+    model = gff3IndexerTool.get_gene_model(
+        resource_path + "reindex.hdf5", "test", "models_a", "tx2")
+    assert [feature["id"] for feature in model] == ["tx2", "ex1", "ex2"]
+
+    with h5py.File(resource_path + "reindex.hdf5", "r") as f_check:
+        assert sorted(f_check["test/attributes"]) == ["0", "1"]
+        assert len(f_check["test/attributes/0/key"]) == 9
+
+    locations = gff3IndexerTool.get_attribute_locations(
+        resource_path + "reindex.hdf5", "test", "ex")
+    assert locations == []
+
+    locations = gff3IndexerTool.get_attribute_locations(
+        resource_path + "reindex.hdf5", "test", "ex", prefix=True)
+    assert [(loc["key"], loc["file_id"]) for loc in locations] == [
+        ("ex1", "models_a"), ("ex1", "models_b"), ("ex2", "models_a"), ("ex2", "models_b"),
+        ("ex3", "models_a"), ("ex3", "models_b")]
+
+    with open(resource_path + "sample.models.gff3", "r") as f_in:
+        gff3_lines = [line for line in f_in if "gene2" not in line and "peak1" not in line]
+    with open(resource_path + "sample.models.short.gff3", "w") as f_out:
+        f_out.writelines(gff3_lines)
+
+    # gene2 covers 2000 to 3000 and the peak is the only feature on chr2, so
+    # the reload has to clear them from the presence index and the counts
+    for gff3_file in ("sample.models.gff3", "sample.models.short.gff3"):
+        gi_handle.gff32hdf5(
+            "models_a", "test", resource_path + gff3_file, resource_path + "reindex.hdf5",
+            count_bin_sizes=[1000])
+        _, _, counts = gff3IndexerTool.get_feature_counts(
+            resource_path + "reindex.hdf5", "test", "chr1", "gene", 1000)
+    assert counts[0].tolist() == [1, 0, 0]
+
+    with h5py.File(resource_path + "reindex.hdf5", "r") as f_check:
+        dset = f_check["test"]["data"]
+        assert dset[0, 0, 100:901].all()
+        assert not dset[0, 0, 901:4000].any()
+        assert not dset[1, 0, 0:4000].any()
+        assert dset[0, 1, 2000:3001].all()
+        assert f_check["test"]["feature_types"]["gene"][0, 0, :4].tolist() == [
+            True, False, False, False]
+
+
+@pytest.mark.gff3
+def test_gff3_10_bin_boundary():
+    """
+    Function to test that features on a bin boundary are in the same bin in
+    the feature type presence and the feature count datasets
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    gff3_lines = [
+        "##gff-version 3",
+        "chr1\t.\tgene\t1000\t1000\t.\t+\t.\tID=gene1",
+        "chr1\t.\tgene\t1001\t2000\t.\t+\t.\tID=gene2",
+    ]
+    with open(resource_path + "sample.boundary.gff3", "w") as f_out:
+        f_out.write("\n".join(gff3_lines) + "\n")
+
+    gi_handle = gff3IndexerTool()
+    gi_handle.gff32hdf5(
+        "boundary", "test", resource_path + "sample.boundary.gff3",
+        resource_path + "boundary.hdf5", feature_types=["gene"], count_bin_sizes=[1000])
+
+    _, _, counts = gff3IndexerTool.get_feature_counts(
+        resource_path + "boundary.hdf5", "test", "chr1", "gene", 1000)
+    assert counts[0].tolist() == [1, 1]
+
+    with h5py.File(resource_path + "boundary.hdf5", "r") as f_check:
+        assert f_check["test"]["feature_types"]["gene"][0, 0, :3].tolist() == [
+            True, True, False]
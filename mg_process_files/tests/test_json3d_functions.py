@@ -16,12 +16,22 @@
 """
 from __future__ import print_function
 
+import io
+import json
 import os.path
+import shutil
+import tarfile
+import h5py
+import numpy as np
 import pytest  # pylint: disable=unused-import
 
 from basic_modules.metadata import Metadata
 
 from mg_process_files.tool.json_3d_indexer import json3dIndexerTool
+from mg_process_files.tool.json_3d_reader import json3dReader
+from mg_process_files.tool.model_utils import (
+    downsample_models, ensemble_maps, square_map, superimpose_models)
+from mg_process_files.tool.tadbit_json import decode_region, model_block, stream_region
 
 
 @pytest.mark.json3d
@@ -44,8 +54,493 @@ def test_json3d_indexer():
             "data_rnaseq", "gff3", "test_gff3_location", [], {'assembly': 'test'})
     }
 
-    j3d_handle = json3dIndexerTool()
+    j3d_handle = json3dIndexerTool({"align_models": True, "contact_threshold": 200.0})
     j3d_handle.run(input_files, metadata, output_files)
 
+    # The archive is streamed rather than extracted next to it
+    assert os.path.isdir(resource_path + "sample_3D_models") is False
+
+    hdf5_in = h5py.File(resource_path + "sample.models.hdf5", "r")
+    attrs = hdf5_in["2000"]["meta"]["model_params"]["unique_id_1234567890"].attrs
+    assert attrs["models"] == 10
+    assert attrs["beads"] == 7
+    assert hdf5_in["2000"]["models"].shape == (70, 3)
+    hdf5_in.close()
+
+    with tarfile.open(resource_path + "sample_3D_models.tar.gz", "r:gz") as tar_in:
+        models = json.loads(tar_in.extractfile(
+            "sample_3D_models/sample_3D_models.json").read().decode("utf-8"))
+
+    coords = json3dIndexerTool.get_model(
+        resource_path + "sample.models.hdf5", 2000, "unique_id_1234567890", 3)
+    assert coords.reshape(-1).tolist() == models["models"][3]["data"]
+
     # assert os.path.isfile(resource_path + "sample.gff3.gz") is True
     # assert os.path.getsize(resource_path + "sample.gff3.gz") > 0
+
+
+@pytest.mark.json3d
+def test_json3d_model_block():
+    """
+    Function to test the conversion of the models into a coordinate block
+    """
+    models = [
+        {"ref": 3, "data": [0, 1, 2, 3, 4, 5]},
+        {"ref": 7, "data": [6, 7, 8, 9, 10, 11]},
+        {"ref": 8, "data": [12, 13, 14, 15, 16, 17]}
+    ]
+    coords, model_params = model_block(models, [[7], [3, 7]])
+
+    assert coords.shape == (2, 3, 3)
+    assert coords[1, 0, :].tolist() == [3, 4, 5]
+    assert coords[0, 2, :].tolist() == [12, 13, 14]
+    np.testing.assert_array_equal(model_params, [[3, 1], [7, 0], [8, 2]])
+
+
+@pytest.mark.json3d
+def test_json3d_processes():
+    """
+    Function to test that decoding the JSON files in a process pool
+    generates the same index
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    j3d_handle = json3dIndexerTool({"json_processes": 2})
+    j3d_handle.json2hdf5(
+        resource_path + "sample_3D_models.tar.gz",
+        resource_path + "sample.models.processes.hdf5", 2)
+
+    hdf5_single = h5py.File(resource_path + "sample.models.hdf5", "r")
+    hdf5_pool = h5py.File(resource_path + "sample.models.processes.hdf5", "r")
+    np.testing.assert_array_equal(hdf5_single["2000"]["models"][:], hdf5_pool["2000"]["models"][:])
+    hdf5_single.close()
+    hdf5_pool.close()
+
+
+@pytest.mark.json3d
+def test_json3d_region_index():
+    """
+    Function to test the region interval index
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    with tarfile.open(resource_path + "sample_3D_models.tar.gz", "r:gz") as tar_in:
+        models = json.loads(tar_in.extractfile(
+            "sample_3D_models/sample_3D_models.json").read().decode("utf-8"))
+
+    # Regions of different lengths, added out of order
+    locations = [
+        ("region_c", "chr2R", 3000, 4000), ("region_a", "chr2R", 1000, 9000),
+        ("region_b", "chr2R", 2000, 2500), ("region_d", "chr3L", 1000, 2000)]
+
+    with tarfile.open(resource_path + "sample_3D_regions.tar.gz", "w:gz") as tar_out:
+        for uuid, chrom, start, end in locations:
+            models["object"].update(
+                {"uuid": uuid, "chrom": [chrom], "chromStart": [start], "chromEnd": [end]})
+            json_data = json.dumps(models).encode("utf-8")
+            tar_info = tarfile.TarInfo("sample_3D_regions/" + uuid + ".json")
+            tar_info.size = len(json_data)
+            tar_out.addfile(tar_info, io.BytesIO(json_data))
+
+    j3d_handle = json3dIndexerTool()
+    j3d_handle.json2hdf5(
+        resource_path + "sample_3D_regions.tar.gz", resource_path + "sample.regions.hdf5")
+
+    def region_uuids(chrom, start, end):
+        regions = json3dIndexerTool.get_regions(
+            resource_path + "sample.regions.hdf5", 2000, chrom, start, end)
+        return [region["uuid"] for region in regions]
+
+    assert region_uuids("chr2R", 0, 10000) == ["region_a", "region_b", "region_c"]
+    assert region_uuids("chr2R", 2600, 2900) == ["region_a"]
+    assert region_uuids("chr2R", 2400, 3001) == ["region_a", "region_b", "region_c"]
+    assert region_uuids("chr2R", 9000, 9500) == []
+    assert region_uuids("chr3L", 1999, 2000) == ["region_d"]
+    assert region_uuids("chrX", 0, 10000) == []
+
+    regions = json3dIndexerTool.get_regions(
+        resource_path + "sample.regions.hdf5", 2000, "chr2R", 3500, 3600)
+    hdf5_in = h5py.File(resource_path + "sample.regions.hdf5", "r")
+    attrs = hdf5_in["2000"]["meta"]["model_params"]["region_c"].attrs
+    assert regions[-1]["offset"] == attrs["i"]
+    hdf5_in.close()
+
+
+@pytest.mark.json3d
+def test_json3d_hic_data():
+    """
+    Function to test the storage of the Hi-C contacts, TADs and restraints
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    with tarfile.open(resource_path + "sample_3D_models.tar.gz", "r:gz") as tar_in:
+        models = json.loads(tar_in.extractfile(
+            "sample_3D_models/sample_3D_models.json").read().decode("utf-8"))
+
+    n_bins = models["hic_data"]["n"]
+    matrix = np.zeros((n_bins, n_bins))
+    for position, value in models["hic_data"]["data"].items():
+        matrix[int(position) // n_bins, int(position) % n_bins] = value
+
+    rows, cols, values = json3dIndexerTool.get_contacts(
+        resource_path + "sample.models.hdf5", 2000, "unique_id_1234567890", 5, 9)
+    assert len(rows) == 16
+    assert rows.min() == 5 and rows.max() == 8 and cols.min() == 5 and cols.max() == 8
+    np.testing.assert_array_equal(values, matrix[rows, cols])
+
+    hdf5_in = h5py.File(resource_path + "sample.models.hdf5", "r")
+    tads = hdf5_in["2000"]["meta"]["tads"]["unique_id_1234567890"][:]
+    assert tads["start"].tolist() == [20420000, 20430000]
+    assert tads["end"].tolist() == [20430000, 20440000]
+    assert len(hdf5_in["2000"]["meta"]["restraints"]["unique_id_1234567890"]) == 0
+    hdf5_in.close()
+
+
+@pytest.mark.json3d
+def test_json3d_coord_encoding():
+    """
+    Function to test the float32 and fixed point coordinate encodings
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    j3d_handle = json3dIndexerTool()
+    j3d_handle.json2hdf5(
+        resource_path + "sample_3D_models.tar.gz",
+        resource_path + "sample.models.fixed.hdf5", 1, "fixed", 100)
+
+    hdf5_in = h5py.File(resource_path + "sample.models.hdf5", "r")
+    assert hdf5_in["2000"]["models"].dtype == np.float32
+    assert hdf5_in["2000"]["models"].shuffle is True
+    hdf5_in.close()
+
+    hdf5_in = h5py.File(resource_path + "sample.models.fixed.hdf5", "r")
+    assert hdf5_in["2000"]["models"].dtype == np.int32
+    assert hdf5_in["2000"]["models"].attrs["scale_factor"] == 100
+    hdf5_in.close()
+
+    for model_id in range(10):
+        np.testing.assert_array_equal(
+            json3dIndexerTool.get_model(
+                resource_path + "sample.models.hdf5", 2000, "unique_id_1234567890", model_id),
+            json3dIndexerTool.get_model(
+                resource_path + "sample.models.fixed.hdf5", 2000, "unique_id_1234567890", model_id))
+
+
+@pytest.mark.json3d
+def test_json3d_reader():
+    """
+    Function to test the 3D model reader and its cache
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+    uuid = "unique_id_1234567890"
+
+    with json3dReader(resource_path + "sample.models.hdf5") as reader:
+        refs, coords = reader.get_models(2000, uuid)
+        assert coords.shape == (10, 7, 3)
+        for model_id in range(10):
+            np.testing.assert_array_equal(
+                coords[model_id],
+                json3dIndexerTool.get_model(
+                    resource_path + "sample.models.hdf5", 2000, uuid, model_id))
+        assert reader.get_models(2000, uuid)[1] is coords
+
+        cluster_refs, cluster_coords = reader.get_cluster(2000, uuid, 0)
+        assert cluster_refs.tolist() == [1, 3, 5, 7, 9]
+        np.testing.assert_array_equal(cluster_coords[1], coords[refs.tolist().index(3)])
+
+    with json3dReader(resource_path + "sample.models.hdf5") as reader:
+        centroid_refs, centroid_coords = reader.get_centroids(2000, uuid)
+        assert centroid_refs.tolist() == [1, 6]
+        np.testing.assert_array_equal(centroid_coords[1], coords[refs.tolist().index(6)])
+
+    # Only room for the models of one region
+    with json3dReader(
+            resource_path + "sample.regions.hdf5", cache_size=coords.nbytes + 100) as reader:
+        regions = reader.get_region_models(2000, "chr2R", 2400, 3001)
+        assert [region["uuid"] for region in regions] == ["region_a", "region_b", "region_c"]
+        assert all(region["coords"].shape == (10, 7, 3) for region in regions)
+        assert reader.cache_used <= reader.cache_size
+        assert reader.get_models(2000, "region_c")[1] is regions[2]["coords"]
+        assert reader.get_models(2000, "region_a")[1] is not regions[0]["coords"]
+
+        regions = reader.get_region_models(2000, "chr3L", 0, 5000, centroids_only=True)
+        assert regions[0]["coords"].shape == (2, 7, 3)
+
+
+@pytest.mark.json3d
+def test_json3d_lod():
+    """
+    Function to test the downsampled models
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+    uuid = "unique_id_1234567890"
+
+    coords = np.arange(7 * 2 * 3, dtype='f8').reshape(7, 2, 3)
+    lod_coords = downsample_models(coords, 4)
+    assert lod_coords.shape == (2, 2, 3)
+    np.testing.assert_allclose(lod_coords[0], coords[0:4].mean(axis=0))
+    np.testing.assert_allclose(lod_coords[1], coords[4:7].mean(axis=0))
+
+    with json3dReader(resource_path + "sample.models.hdf5") as reader:
+        refs, coords = reader.get_models(2000, uuid)
+        for lod in (2, 4, 8):
+            lod_refs, lod_coords = reader.get_models(2000, uuid, lod)
+            assert lod_refs.tolist() == refs.tolist()
+            np.testing.assert_allclose(
+                lod_coords,
+                downsample_models(coords.transpose(1, 0, 2), lod).transpose(1, 0, 2),
+                rtol=1e-5)
+
+        centroid_refs, centroid_coords = reader.get_centroids(2000, uuid, 2)
+        assert centroid_refs.tolist() == [1, 6]
+        assert centroid_coords.shape == (2, 4, 3)
+        np.testing.assert_array_equal(
+            centroid_coords[1], reader.get_models(2000, uuid, 2)[1][refs.tolist().index(6)])
+
+        with pytest.raises(ValueError):
+            reader.get_models(2000, uuid, 3)
+
+
+@pytest.mark.json3d
+def test_json3d_superposition():
+    """
+    Function to test the superposition of the models onto the centroids
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+    uuid = "unique_id_1234567890"
+
+    reference = np.random.RandomState(0).randn(12, 3)
+    rotation = np.array([[0.0, -1.0, 0.0], [1.0, 0.0, 0.0], [0.0, 0.0, 1.0]])
+    coords = np.stack((reference.dot(rotation) + 5, -reference), axis=1)
+    aligned, rmsd = superimpose_models(coords, reference)
+    np.testing.assert_allclose(aligned[:, 0, :], reference, atol=1e-10)
+    assert rmsd[0] < 1e-10
+    assert rmsd[1] > 0.1  # a reflection can not be superimposed
+
+    with json3dReader(resource_path + "sample.models.hdf5") as reader:
+        refs, coords = reader.get_models(2000, uuid)
+        _, aligned = reader.get_models(2000, uuid, aligned=True)
+        _, centroid_refs, rmsd = reader.get_rmsd(2000, uuid)
+        assert centroid_refs.tolist() == [1, 6]
+        assert rmsd.shape == (10, 2)
+
+        for i, centroid_ref in enumerate(centroid_refs):
+            centroid_id = refs.tolist().index(centroid_ref)
+            assert rmsd[centroid_id, i] < 1e-3
+            cluster_refs, cluster_aligned = reader.get_cluster(2000, uuid, i, aligned=True)
+            for ref, model in zip(cluster_refs, cluster_aligned):
+                model_id = refs.tolist().index(ref)
+                dist = np.sqrt(((model - coords[centroid_id]) ** 2).sum(axis=1).mean())
+                np.testing.assert_allclose(dist, rmsd[model_id, i], rtol=1e-3, atol=1e-3)
+                # Superposition keeps the distances between the beads
+                np.testing.assert_allclose(
+                    np.linalg.norm(model[1:] - model[:-1], axis=1),
+                    np.linalg.norm(coords[model_id][1:] - coords[model_id][:-1], axis=1),
+                    rtol=1e-4)
+
+        with pytest.raises(ValueError):
+            reader.get_models(2000, uuid, 2, aligned=True)
+
+
+@pytest.mark.json3d
+def test_json3d_ensemble_maps():
+    """
+    Function to test the mean distance and contact frequency maps
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+    uuid = "unique_id_1234567890"
+
+    coords = np.random.RandomState(1).randn(9, 7, 3) * 10
+    pairwise = np.linalg.norm(coords[:, np.newaxis] - coords[np.newaxis], axis=3)
+    distances, contacts = ensemble_maps(coords, 12.0, chunk_size=1)
+    np.testing.assert_allclose(square_map(distances, 9), pairwise.mean(axis=2))
+    np.testing.assert_allclose(square_map(contacts, 9, 1), (pairwise < 12.0).mean(axis=2))
+
+    with json3dReader(resource_path + "sample.models.hdf5") as reader:
+        _, coords = reader.get_models(2000, uuid)
+        pairwise = np.linalg.norm(coords[:, :, np.newaxis] - coords[:, np.newaxis], axis=3)
+        distances, contacts = reader.get_ensemble_maps(2000, uuid)
+        assert distances.shape == (7, 7)
+        np.testing.assert_allclose(distances, distances.T)
+        np.testing.assert_allclose(distances, pairwise.mean(axis=0), rtol=1e-4, atol=1e-3)
+        np.testing.assert_allclose(contacts, (pairwise < 200.0).mean(axis=0))
+
+
+@pytest.mark.json3d
+def test_json3d_stream():
+    """
+    Function to test the incremental reading of the JSON files
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    with tarfile.open(resource_path + "sample_3D_models.tar.gz") as tar_in:
+        member = [m for m in tar_in.getmembers() if m.name.endswith('.json')][0]
+        json_data = tar_in.extractfile(member).read()
+
+    expected = json.loads(json_data.decode('utf-8'))
+    models = expected.pop('models')
+
+    for read_size in (1, 7, 65536):
+        region, refs, block = stream_region(io.BytesIO(json_data), read_size)
+        assert region == expected
+        assert refs == [model['ref'] for model in models]
+        np.testing.assert_array_equal(block, [model['data'] for model in models])
+
+    region, refs, block = stream_region(io.BytesIO(b'{"clusters": [], "models": []}'))
+    assert region == {"clusters": []}
+    assert refs == []
+
+    with pytest.raises(ValueError):
+        stream_region(io.BytesIO(b'{"clusters": [], "models": [{"ref": 1'), 4)
+
+
+@pytest.mark.json3d
+def test_json3d_catalog():
+    """
+    Function to test the listing of the regions in an archive
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    regions = json3dIndexerTool.catalog(resource_path + "sample_3D_models.tar.gz")
+    assert regions == [{
+        "name": "sample_3D_models/sample_3D_models.json",
+        "uuid": "unique_id_1234567890",
+        "resolution": 2000,
+        "chrom": "chr2R",
+        "start": 20420000,
+        "end": 20440000,
+        "models": 10,
+        "beads": 7
+    }]
+
+    regions = json3dIndexerTool.catalog(resource_path + "sample_3D_regions.tar.gz")
+    assert [(region["uuid"], region["chrom"], region["start"]) for region in regions] == [
+        ("region_c", "chr2R", 3000), ("region_a", "chr2R", 1000),
+        ("region_b", "chr2R", 2000), ("region_d", "chr3L", 1000)]
+
+
+@pytest.mark.json3d
+def test_json3d_append():
+    """
+    Function to test adding archives to an existing index
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+    hdf5_file = resource_path + "sample.append.hdf5"
+    shutil.copyfile(resource_path + "sample.regions.hdf5", hdf5_file)
+
+    with tarfile.open(resource_path + "sample_3D_models.tar.gz", "r:gz") as tar_in:
+        models = json.loads(tar_in.extractfile(
+            "sample_3D_models/sample_3D_models.json").read().decode("utf-8"))
+
+    # region_a is already indexed and region_f is in the archive twice
+    locations = [
+        ("region_e", "chr2R", 500, 600), ("region_a", "chr2R", 1000, 9000),
+        ("region_f", "chr2R", 9500, 9800), ("region_f", "chr2R", 9500, 9800),
+        ("region_g_with_a_longer_uuid", "chr3L", 1500, 1600)]
+
+    with tarfile.open(resource_path + "sample_3D_append.tar.gz", "w:gz") as tar_out:
+        for i, (uuid, chrom, start, end) in enumerate(locations):
+            models["object"].update(
+                {"uuid": uuid, "chrom": [chrom], "chromStart": [start], "chromEnd": [end]})
+            json_data = json.dumps(models).encode("utf-8")
+            tar_info = tarfile.TarInfo("sample_3D_append/" + str(i) + ".json")
+            tar_info.size = len(json_data)
+            tar_out.addfile(tar_info, io.BytesIO(json_data))
+
+    j3d_handle = json3dIndexerTool()
+    for _ in range(2):
+        j3d_handle.json2hdf5(resource_path + "sample_3D_append.tar.gz", hdf5_file)
+
+        with h5py.File(hdf5_file, "r") as hdf5_in:
+            assert sorted(hdf5_in["2000"]["meta"]["model_params"]) == [
+                "region_a", "region_b", "region_c", "region_d", "region_e", "region_f",
+                "region_g_with_a_longer_uuid"]
+            assert hdf5_in["2000"]["models"].shape == (7 * 70, 3)
+            assert hdf5_in["2000"]["regions"]["chr2R"]["max_end"][:].tolist() == [
+                600, 9000, 9000, 9000, 9800]
+
+        def region_uuids(chrom, start, end):
+            regions = json3dIndexerTool.get_regions(hdf5_file, 2000, chrom, start, end)
+            return [region["uuid"] for region in regions]
+
+        assert region_uuids("chr2R", 0, 10000) == [
+            "region_e", "region_a", "region_b", "region_c", "region_f"]
+        assert region_uuids("chr2R", 9600, 9700) == ["region_f"]
+        assert region_uuids("chr3L", 0, 5000) == ["region_d", "region_g_with_a_longer_uuid"]
+
+    with json3dReader(hdf5_file) as reader:
+        np.testing.assert_array_equal(
+            reader.get_models(2000, "region_f")[1], reader.get_models(2000, "region_a")[1])
+
+    # A region that fails part way through leaves rows in the coordinate
+    # datasets, which are removed before the next region is written
+    models["object"].update(
+        {"uuid": "region_h", "chrom": ["chr2R"], "chromStart": [100], "chromEnd": [200]})
+    json_data = json.dumps(models).encode("utf-8")
+    region = decode_region(json_data, lod_factors=(2,))
+    del region["centroid_ids"]
+    with h5py.File(hdf5_file, "a") as hdf5_in:
+        with pytest.raises(KeyError):
+            json3dIndexerTool._region2hdf5(hdf5_in, region)  # pylint: disable=protected-access
+        assert hdf5_in["2000"]["models"].shape == (8 * 70, 3)
+
+    with tarfile.open(resource_path + "sample_3D_append.tar.gz", "w:gz") as tar_out:
+        tar_info = tarfile.TarInfo("sample_3D_append/region_h.json")
+        tar_info.size = len(json_data)
+        tar_out.addfile(tar_info, io.BytesIO(json_data))
+    j3d_handle.json2hdf5(resource_path + "sample_3D_append.tar.gz", hdf5_file)
+
+    with h5py.File(hdf5_file, "r") as hdf5_in:
+        assert hdf5_in["2000"]["models"].shape == (8 * 70, 3)
+        assert hdf5_in["2000"]["lod"]["2"].shape == (8 * 40, 3)
+        assert "pending_uuid" not in hdf5_in["2000"].attrs
+
+    with json3dReader(hdf5_file) as reader:
+        np.testing.assert_array_equal(
+            reader.get_models(2000, "region_h")[1], reader.get_models(2000, "region_a")[1])
+        np.testing.assert_array_equal(
+            reader.get_models(2000, "region_h", lod=2)[1],
+            reader.get_models(2000, "region_a", lod=2)[1])
+
+
+@pytest.mark.json3d
+def test_json3d_resume():
+    """
+    Function to test loading an archive again after a load that stopped part
+    way through
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+    hdf5_file = resource_path + "sample.resume.hdf5"
+
+    with tarfile.open(resource_path + "sample_3D_models.tar.gz", "r:gz") as tar_in:
+        models = json.loads(tar_in.extractfile(
+            "sample_3D_models/sample_3D_models.json").read().decode("utf-8"))
+
+    def write_archive(file_targz, truncate):
+        with tarfile.open(file_targz, "w:gz") as tar_out:
+            for i, start in enumerate((1000, 3000, 5000, 7000)):
+                models["object"].update({
+                    "uuid": "region_" + str(i), "chrom": ["chr2R"], "chromStart": [start],
+                    "chromEnd": [start + 1000]})
+                json_data = json.dumps(models).encode("utf-8")
+                if i == truncate:
+                    json_data = json_data[:len(json_data) // 2]
+                tar_info = tarfile.TarInfo("sample_3D_resume/" + str(i) + ".json")
+                tar_info.size = len(json_data)
+                tar_out.addfile(tar_info, io.BytesIO(json_data))
+
+    # The third file is cut short, so the load stops after two regions
+    write_archive(resource_path + "sample_3D_resume.tar.gz", 2)
+    j3d_handle = json3dIndexerTool()
+    with pytest.raises(ValueError):
+        j3d_handle.json2hdf5(resource_path + "sample_3D_resume.tar.gz", hdf5_file)
+
+    with h5py.File(hdf5_file, "r") as hdf5_in:
+        assert sorted(hdf5_in["2000"]["meta"]["model_params"]) == ["region_0", "region_1"]
+
+    write_archive(resource_path + "sample_3D_resume.tar.gz", None)
+    j3d_handle.json2hdf5(resource_path + "sample_3D_resume.tar.gz", hdf5_file)
+
+    regions = json3dIndexerTool.get_regions(hdf5_file, 2000, "chr2R", 0, 10000)
+    assert [region["uuid"] for region in regions] == [
+        "region_0", "region_1", "region_2", "region_3"]
@@ -0,0 +1,151 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+from __future__ import print_function
+
+import filecmp
+import os.path
+import numpy as np
+import pytest  # pylint: disable=unused-import
+
+from mg_process_files.tool.sample_data import (
+    make_genome, write_chrom_sizes, generate_bed, generate_gff3, generate_wig,
+    generate_bedgraph, generate_tadbit_archive)
+from mg_process_files.tool.gff3_indexer import gff3IndexerTool
+from mg_process_files.tool.gff3_reader import gff3_batches
+from mg_process_files.tool.json_3d_indexer import json3dIndexerTool
+from mg_process_files.tool.json_3d_reader import json3dReader
+from mg_process_files.tool.wig_reader import bedgraph_runs, wig_runs
+
+
+@pytest.mark.sample_data
+def test_sample_data_reproducible():
+    """
+    Function to test that the generated files only depend on the seed
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    genome = make_genome(4, 2000000, 7)
+    assert genome == make_genome(4, 2000000, 7)
+    assert sum(length for _, length in genome) <= 2000000
+    write_chrom_sizes(resource_path + "synthetic.size", genome)
+
+    for seed, suffix in ((1, "a"), (1, "b"), (2, "c")):
+        generate_bed(resource_path + "synthetic." + suffix + ".bed", genome, seed=seed)
+        generate_gff3(resource_path + "synthetic." + suffix + ".gff3", genome, seed=seed)
+        generate_tadbit_archive(
+            resource_path + "synthetic_3D_" + suffix + ".tar.gz", genome, 2, 5, 20, seed=seed)
+
+    for name in ("synthetic.{}.bed", "synthetic.{}.gff3", "synthetic_3D_{}.tar.gz"):
+        assert filecmp.cmp(
+            resource_path + name.format("a"), resource_path + name.format("b"), shallow=False)
+        assert not filecmp.cmp(
+            resource_path + name.format("a"), resource_path + name.format("c"), shallow=False)
+
+
+@pytest.mark.sample_data
+def test_sample_data_signal():
+    """
+    Function to test that the WIG and bedGraph files hold the same signal
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+    genome = make_genome(3, 3000000, 0)
+
+    n_fixed = generate_wig(resource_path + "synthetic.fixed.wig", genome, "fixed", span=5)
+    n_variable = generate_wig(resource_path + "synthetic.variable.wig", genome, "variable", span=5)
+    n_bedgraph = generate_bedgraph(resource_path + "synthetic.bedgraph", genome, span=5)
+    assert n_fixed == n_variable == n_bedgraph > 0
+
+    tracks = zip(
+        wig_runs(resource_path + "synthetic.fixed.wig"),
+        wig_runs(resource_path + "synthetic.variable.wig"),
+        bedgraph_runs(resource_path + "synthetic.bedgraph"))
+    n_chroms = 0
+    for fixed, variable, bedgraph in tracks:
+        assert fixed[0] == variable[0] == bedgraph[0]
+        for i in range(1, 4):
+            np.testing.assert_array_equal(fixed[i], variable[i])
+            np.testing.assert_array_equal(fixed[i], bedgraph[i])
+        assert (np.diff(fixed[1]) > 0).all()
+        n_chroms += 1
+    assert n_chroms == 3
+
+
+@pytest.mark.sample_data
+def test_sample_data_gff3():
+    """
+    Function to test that the generated GFF3 file is sorted and can be indexed
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+    genome = make_genome(2, 2000000, 0)
+    n_lines = generate_gff3(resource_path + "synthetic.genes.gff3", genome, seed=3)
+
+    n_features = 0
+    with open(resource_path + "synthetic.genes.gff3", "rb") as f_in:
+        for batch in gff3_batches(f_in):
+            n_features += len(batch)
+            for _, first, last in batch.seqid_blocks():
+                assert (np.diff(batch.starts[first:last]) >= 0).all()
+    assert n_features == n_lines
+
+    gff3_handle = gff3IndexerTool({"gff3_count_bin_sizes": [100000]})
+    gff3_handle.gff32hdf5(
+        "synthetic", "synthetic", resource_path + "synthetic.genes.gff3",
+        resource_path + "synthetic.genes.hdf5")
+
+    model = gff3IndexerTool.get_gene_model(
+        resource_path + "synthetic.genes.hdf5", "synthetic", "synthetic", "gene0")
+    assert model[0]["id"] == "gene0"
+    assert set(feature["type"] for feature in model) >= set(["gene", "mRNA", "exon", "CDS"])
+
+
+@pytest.mark.sample_data
+def test_sample_data_tadbit():
+    """
+    Function to test that the generated 3D model archive can be indexed
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+    genome = make_genome(2, 5000000, 0)
+    uuids = generate_tadbit_archive(
+        resource_path + "synthetic_3D_models.tar.gz", genome, n_regions=3, n_models=12,
+        n_beads=30, n_clusters=3, seed=5)
+
+    regions = json3dIndexerTool.catalog(resource_path + "synthetic_3D_models.tar.gz")
+    assert [region["uuid"] for region in regions] == uuids
+    assert all(region["models"] == 12 and region["beads"] == 30 for region in regions)
+
+    j3d_handle = json3dIndexerTool()
+    j3d_handle.json2hdf5(
+        resource_path + "synthetic_3D_models.tar.gz", resource_path + "synthetic_3D_models.hdf5",
+        align_models=True)
+
+    with json3dReader(resource_path + "synthetic_3D_models.hdf5") as reader:
+        for uuid in uuids:
+            refs, coords = reader.get_models(10000, uuid)
+            assert coords.shape == (12, 30, 3)
+
+            # The models of a cluster are noisy rotations of the same walk
+            _, centroid_refs, rmsd = reader.get_rmsd(10000, uuid)
+            assert len(centroid_refs) == 3
+            for i, centroid_ref in enumerate(centroid_refs):
+                cluster_refs, _ = reader.get_cluster(10000, uuid, i)
+                in_cluster = np.isin(refs, cluster_refs)
+                assert rmsd[in_cluster, i].max() < rmsd[~in_cluster, i].min()
+                assert rmsd[refs.tolist().index(centroid_ref), i] < 1e-3
+
+            # The ensemble maps are only stored when a contact threshold is set
+            with pytest.raises(ValueError):
+                reader.get_ensemble_maps(10000, uuid)
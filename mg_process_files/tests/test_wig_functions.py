@@ -18,11 +18,13 @@ from __future__ import print_function
 
 import os.path
 import h5py
+import numpy as np
 import pytest  # pylint: disable=unused-import
 
 from basic_modules.metadata import Metadata
 
 from mg_process_files.tool.wig_indexer import wigIndexerTool
+from mg_process_files.tool.wig_reader import bedgraph_runs, wig_runs
 
 
 @pytest.mark.wig
@@ -58,3 +60,145 @@ def test_wig_indexer():
 
     assert os.path.isfile(resource_path + "sample.bw") is True
     assert os.path.getsize(resource_path + "sample.bw") > 0
+
+
+@pytest.mark.wig
+def test_bedgraph_indexer():
+    """
+    Function to test the bedGraph input to the WIG indexer
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    f_check = h5py.File(resource_path + "file_index.hdf5", "a")
+    f_check.close()
+
+    input_files = {
+        "wig": resource_path + "sample.bedgraph",
+        "chrom_file": resource_path + "chrom_GRCh38.size",
+        "hdf5_file": resource_path + "file_index.hdf5"
+    }
+
+    output_files = {
+        "bw_file": resource_path + "sample.bedgraph.bw"
+    }
+
+    metadata = {
+        "wig": Metadata(
+            "data_rnaseq", "bedgraph", "test_bedgraph_location", [], {'assembly': 'test_bg'}),
+        "hdf5_file": Metadata(
+            "data_file", "hdf5", "test_location", [], {}
+        )
+    }
+
+    bw_handle = wigIndexerTool()
+    bw_handle.run(input_files, metadata, output_files)
+
+    assert os.path.isfile(resource_path + "sample.bedgraph.bw") is True
+    assert os.path.getsize(resource_path + "sample.bedgraph.bw") > 0
+
+    f_check = h5py.File(resource_path + "file_index.hdf5", "r")
+    dset = f_check["test_bg"]["data"]
+    assert dset[0, 0, 12692000] == 1
+    assert dset[0, 0, 12691999] == 0
+    f_check.close()
+
+
+@pytest.mark.wig
+def test_wig_runs():
+    """
+    Function to test that the WIG and bedGraph readers generate the same
+    run-length encoded runs
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    wig_chroms = list(wig_runs(resource_path + "sample.wig", chunk_size=100))
+    bg_chroms = list(bedgraph_runs(resource_path + "sample.bedgraph", chunk_size=100))
+
+    assert len(wig_chroms) == 1
+    assert len(bg_chroms) == 1
+
+    chrom, starts, ends, values = wig_chroms[0]
+    assert chrom == "chr22"
+    assert starts[0] == 12691999
+    assert (ends - starts).sum() == 1000
+    assert len(starts) < 1000
+    assert (starts == bg_chroms[0][1]).all()
+    assert (ends == bg_chroms[0][2]).all()
+    assert (values == bg_chroms[0][3]).all()
+
+
+@pytest.mark.wig
+def test_wig_signal_matrix():
+    """
+    Function to test the cross-sample signal matrix
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    f_check = h5py.File(resource_path + "file_index.hdf5", "a")
+    f_check.close()
+
+    input_files = {
+        "wig": resource_path + "sample.wig",
+        "chrom_file": resource_path + "chrom_GRCh38.size",
+        "hdf5_file": resource_path + "file_index.hdf5"
+    }
+
+    output_files = {
+        "bw_file": resource_path + "sample.signal.bw"
+    }
+
+    metadata = {
+        "wig": Metadata(
+            "data_rnaseq", "wig", "test_wig_location", [], {'assembly': 'test_signal'}),
+        "hdf5_file": Metadata(
+            "data_file", "hdf5", "test_location", [], {}
+        )
+    }
+
+    bw_handle = wigIndexerTool({"signal_matrix": True, "signal_bin_sizes": [1000, 10000]})
+    bw_handle.run(input_files, metadata, output_files)
+
+    # sample.wig has single base values on chr22 from 12692000 to 12692999
+    positions, values = np.loadtxt(resource_path + "sample.wig", skiprows=1, unpack=True)
+    assert positions[0] == 12692000 and positions[-1] == 12692999
+
+    file_ids, bin_starts, matrix = wigIndexerTool.get_signal_matrix(
+        resource_path + "file_index.hdf5", "test_signal", "chr22", 12680000, 12710000, 10000)
+
+    assert file_ids == [resource_path + "sample.wig"]
+    assert list(bin_starts) == [12680000, 12690000, 12700000]
+    np.testing.assert_allclose(matrix, [[np.nan, values.mean(), np.nan]], rtol=1e-6)
+
+    # The first value is the only one in its 1kb bin, the rest fill most of
+    # the next bin and the bins after that are empty
+    file_ids, bin_starts, matrix = wigIndexerTool.get_signal_matrix(
+        resource_path + "file_index.hdf5", "test_signal", "chr22", 12690000, 12695000, 1000)
+
+    assert list(bin_starts) == [12690000, 12691000, 12692000, 12693000, 12694000]
+    np.testing.assert_allclose(
+        matrix, [[np.nan, values[0], values[1:].mean(), np.nan, np.nan]], rtol=1e-6)
+
+
+@pytest.mark.wig
+def test_wig_reindex():
+    """
+    Function to test that loading a file into the WIG presence index again
+    clears the positions from the previous load
+    """
+    resource_path = os.path.join(os.path.dirname(__file__), "data/")
+
+    with open(resource_path + "sample.reindex.wig", "w") as f_out:
+        f_out.write("variableStep chrom=chr1\n100\t1.0\n101\t2.0\n5000\t1.0\n")
+        f_out.write("variableStep chrom=chr2\n50\t1.0\n")
+    with open(resource_path + "sample.reindex.short.wig", "w") as f_out:
+        f_out.write("variableStep chrom=chr1\n200\t1.0\n")
+
+    wi_handle = wigIndexerTool()
+    for file_wig in ("sample.reindex.wig", "sample.reindex.short.wig"):
+        wi_handle.wig2hdf5(
+            "reindex", "test", resource_path + file_wig, resource_path + "wig_reindex.hdf5")
+
+    with h5py.File(resource_path + "wig_reindex.hdf5", "r") as f_check:
+        dset = f_check["test"]["data"]
+        assert np.flatnonzero(dset[0, 0, 0:10000]).tolist() == [200]
+        assert not dset[1, 0, 0:10000].any()
@@ -0,0 +1,558 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import struct
+import zlib
+
+from functools import partial
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+# ------------------------------------------------------------------------------
+
+# Maximum amount of uncompressed data in a block, as used by htslib
+BGZF_BLOCK_SIZE = 0xff00
+
+BGZF_EOF = (
+    b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43\x02\x00"
+    b"\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+)
+
+# Size of the linear index windows used by tabix
+TBI_LINEAR_SHIFT = 14
+
+
+def compress_block(data, level=6):
+    """
+    Compresses a block of up to ``BGZF_BLOCK_SIZE`` bytes into a complete
+    BGZF block with the gzip header, BC extra field and footer.
+
+    Parameters
+    ----------
+    data : bytes
+        Uncompressed data
+    level : int
+        zlib compression level
+
+    Returns
+    -------
+    bytes
+        BGZF block
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    cdata = compressor.compress(data) + compressor.flush()
+
+    header = struct.pack(
+        '<BBBBIBBHBBHH', 31, 139, 8, 4, 0, 0, 255, 6, 66, 67, 2, len(cdata) + 25)
+    footer = struct.pack('<II', zlib.crc32(data) & 0xffffffff, len(data))
+
+    return header + cdata + footer
+
+
+class _BlockCompressor(object):
+    """
+    Compresses full BGZF blocks in batches. With more than one thread a batch
+    is compressed by a pool of threads while the next batch is filled, with
+    only one batch in flight at a time. The compressed blocks are always
+    returned in the order that the blocks were added.
+    """
+
+    def __init__(self, level=6, threads=1):
+        """
+        Init function
+
+        Parameters
+        ----------
+        level : int
+            zlib compression level
+        threads : int
+            Number of threads to use for compressing the blocks
+        """
+        self.level = level
+        self.pending = []
+        self.in_flight = None
+
+        self.pool = None
+        self.batch_size = 1
+        if threads > 1:
+            self.pool = ThreadPool(threads)
+            self.batch_size = 4 * threads
+
+    def add(self, data):
+        """
+        Adds a full block to the batch waiting to be compressed
+
+        Parameters
+        ----------
+        data : bytes
+            Uncompressed data
+
+        Returns
+        -------
+        list
+            Compressed blocks that are ready to be written, if any
+        """
+        self.pending.append(data)
+        if len(self.pending) < self.batch_size:
+            return []
+        return self._compress_pending()
+
+    def _compress_pending(self):
+        """
+        Starts the compression of the pending blocks, after collecting the
+        previous batch so that there is only one batch in flight at a time.
+
+        Returns
+        -------
+        list
+            Compressed blocks that are ready to be written
+        """
+        done = self._collect_in_flight()
+
+        blocks = self.pending
+        self.pending = []
+        if self.pool is None:
+            done.extend([compress_block(block, self.level) for block in blocks])
+        else:
+            self.in_flight = self.pool.map_async(
+                partial(compress_block, level=self.level), blocks)
+        return done
+
+    def _collect_in_flight(self):
+        """
+        Waits for the batch being compressed by the pool
+
+        Returns
+        -------
+        list
+            Compressed blocks of the batch
+        """
+        if self.in_flight is None:
+            return []
+        blocks = self.in_flight.get()
+        self.in_flight = None
+        return blocks
+
+    def flush(self):
+        """
+        Compresses all of the remaining blocks
+
+        Returns
+        -------
+        list
+            Compressed blocks that have not been returned yet
+        """
+        blocks = self._compress_pending()
+        return blocks + self._collect_in_flight()
+
+    def close(self):
+        """
+        Stops the thread pool
+        """
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+
+class BGZFWriter(object):
+    """
+    Writes a BGZF compressed file that can be indexed by tabix, keeping track
+    of the virtual file offsets of the data that has been written.
+
+    Blocks are independent so they can be compressed in parallel. When more
+    than one thread is requested full blocks are handed to a pool of threads
+    in batches while the next batch is filled, and the compressed blocks are
+    written out in order. The output is the same whatever the number of
+    threads.
+
+    As the size of a compressed block is only known once it has been
+    compressed, :meth:`tell` returns offsets based on the index of the block.
+    These are converted to the virtual file offsets used by tabix with
+    :meth:`virtual_offset` once the file has been closed.
+    """
+
+    def __init__(self, file_out, level=6, threads=1):
+        """
+        Init function
+
+        Parameters
+        ----------
+        file_out : str
+            Location of the BGZF file to write
+        level : int
+            zlib compression level
+        threads : int
+            Number of threads to use for compressing the blocks
+        """
+        self.f_out = open(file_out, 'wb')
+        self.buffer = []
+        self.buffer_size = 0
+
+        self.block_count = 0
+        self.block_addresses = [0]
+        self.compressor = _BlockCompressor(level, threads)
+
+    def write(self, data):
+        """
+        Adds data to the file, passing on each block as it fills
+
+        Parameters
+        ----------
+        data : bytes
+            Uncompressed data
+        """
+        self.buffer.append(data)
+        self.buffer_size += len(data)
+        if self.buffer_size < BGZF_BLOCK_SIZE:
+            return
+
+        data = b''.join(self.buffer)
+        while len(data) >= BGZF_BLOCK_SIZE:
+            self._queue_block(data[:BGZF_BLOCK_SIZE])
+            data = data[BGZF_BLOCK_SIZE:]
+        self.buffer = [data]
+        self.buffer_size = len(data)
+
+    def _queue_block(self, data):
+        """
+        Passes a block on to be compressed, writing out any blocks that have
+        finished compressing
+
+        Parameters
+        ----------
+        data : bytes
+            Uncompressed data
+        """
+        self.block_count += 1
+        self._write_blocks(self.compressor.add(data))
+
+    def _write_blocks(self, blocks):
+        """
+        Writes compressed blocks in order, recording the address of each
+
+        Parameters
+        ----------
+        blocks : list
+            Compressed BGZF blocks
+        """
+        for block in blocks:
+            self.f_out.write(block)
+            self.block_addresses.append(self.block_addresses[-1] + len(block))
+
+    def tell(self):
+        """
+        Offset of the next byte to be written
+
+        Returns
+        -------
+        int
+            Index of the current block shifted 16 bits plus the offset within
+            the uncompressed block. Use :meth:`virtual_offset` to convert this
+            to a virtual file offset after the file has been closed.
+        """
+        return (self.block_count << 16) | self.buffer_size
+
+    def virtual_offset(self, offset):
+        """
+        Converts an offset from :meth:`tell` to a virtual file offset
+
+        Parameters
+        ----------
+        offset : int
+            Offset returned by :meth:`tell`
+
+        Returns
+        -------
+        int
+            Compressed offset of the block shifted 16 bits plus the offset
+            within the uncompressed block
+        """
+        return (self.block_addresses[offset >> 16] << 16) | (offset & 0xffff)
+
+    def close(self):
+        """
+        Writes any remaining data and the BGZF end of file marker
+        """
+        if self.buffer_size:
+            self._queue_block(b''.join(self.buffer))
+            self.buffer = []
+            self.buffer_size = 0
+        self._write_blocks(self.compressor.flush())
+        self.compressor.close()
+
+        self.f_out.write(BGZF_EOF)
+        self.f_out.close()
+
+
+def reg2bin(beg, end):
+    """
+    Calculates the bin in the UCSC binning scheme for a 0-based half-open
+    interval, as used by tabix.
+
+    Parameters
+    ----------
+    beg : int
+        Start of the interval
+    end : int
+        End of the interval
+
+    Returns
+    -------
+    int
+        Bin number
+    """
+    end -= 1
+    if beg >> 14 == end >> 14:
+        return ((1 << 15) - 1) // 7 + (beg >> 14)
+    if beg >> 17 == end >> 17:
+        return ((1 << 12) - 1) // 7 + (beg >> 17)
+    if beg >> 20 == end >> 20:
+        return ((1 << 9) - 1) // 7 + (beg >> 20)
+    if beg >> 23 == end >> 23:
+        return ((1 << 6) - 1) // 7 + (beg >> 23)
+    if beg >> 26 == end >> 26:
+        return ((1 << 3) - 1) // 7 + (beg >> 26)
+    return 0
+
+
+class TabixIndexBuilder(object):
+    """
+    Builds a tabix (.tbi) index from the virtual offsets of the records as
+    they are written to a BGZF file.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+            self, col_seq, col_beg, col_end, meta=b'#', skip=0, tbi_format=0):
+        """
+        Init function
+
+        Parameters
+        ----------
+        col_seq : int
+            Column holding the sequence name (1-based)
+        col_beg : int
+            Column holding the start position (1-based)
+        col_end : int
+            Column holding the end position (1-based)
+        meta : bytes
+            Character used to mark header lines
+        skip : int
+            Number of lines to skip at the start of the file
+        tbi_format : int
+            Format code stored in the index, 0 for generic files
+        """
+        self.header = (tbi_format, col_seq, col_beg, col_end, ord(meta), skip)
+        self.names = []
+        self.refs = []
+
+    def add(self, seq, beg, end, voffset_beg, voffset_end):  # pylint: disable=too-many-arguments
+        """
+        Adds a record to the index. Records need to be added in the order that
+        they are written and grouped by sequence.
+
+        Parameters
+        ----------
+        seq : bytes
+            Sequence name
+        beg : int
+            Start of the record (0-based)
+        end : int
+            End of the record (exclusive)
+        voffset_beg : int
+            Virtual offset of the start of the record
+        voffset_end : int
+            Virtual offset of the end of the record
+        """
+        if not self.names or self.names[-1] != seq:
+            self.names.append(seq)
+            self.refs.append(({}, []))
+
+        bins, linear = self.refs[-1]
+
+        bin_id = reg2bin(beg, end)
+        chunks = bins.setdefault(bin_id, [])
+        if chunks and chunks[-1][1] == voffset_beg:
+            chunks[-1][1] = voffset_end
+        else:
+            chunks.append([voffset_beg, voffset_end])
+
+        # Records arrive sorted by start with increasing offsets, so only the
+        # windows that have not been reached yet need to be set
+        first_window = beg >> TBI_LINEAR_SHIFT
+        last_window = (end - 1) >> TBI_LINEAR_SHIFT
+        if len(linear) < first_window:
+            linear.extend([-1] * (first_window - len(linear)))
+        if len(linear) <= last_window:
+            linear.extend([voffset_beg] * (last_window + 1 - len(linear)))
+
+    def write(self, file_tbi, resolve=None):
+        """
+        Writes the BGZF compressed index
+
+        Parameters
+        ----------
+        file_tbi : str
+            Location of the tabix index file
+        resolve : function
+            Converts the offsets that were added into virtual file offsets,
+            for example :meth:`BGZFWriter.virtual_offset`
+        """
+        if resolve is None:
+            resolve = int
+
+        names = b''.join(name + b'\x00' for name in self.names)
+
+        data = [b'TBI\x01', struct.pack('<i', len(self.names))]
+        data.append(struct.pack('<6i', *self.header))
+        data.append(struct.pack('<i', len(names)))
+        data.append(names)
+
+        for bins, linear in self.refs:
+            data.append(struct.pack('<i', len(bins)))
+            for bin_id in sorted(bins):
+                chunks = bins[bin_id]
+                data.append(struct.pack('<Ii', bin_id, len(chunks)))
+                for chunk in chunks:
+                    data.append(struct.pack('<QQ', resolve(chunk[0]), resolve(chunk[1])))
+
+            # Empty windows take the offset of the next window, as in htslib
+            for window in range(len(linear) - 2, -1, -1):
+                if linear[window] < 0:
+                    linear[window] = linear[window + 1]
+
+            data.append(struct.pack('<i', len(linear)))
+            data.append(struct.pack(
+                '<' + str(len(linear)) + 'Q', *[resolve(ioff) for ioff in linear]))
+
+        bgzf_out = BGZFWriter(file_tbi)
+        bgzf_out.write(b''.join(data))
+        bgzf_out.close()
+
+
+def bgzip_tabix(  # pylint: disable=too-many-arguments
+        lines, file_gz, file_tbi, col_seq, col_beg, col_end, meta=b'#', threads=1):
+    """
+    Compresses a sorted stream of tab separated lines into a BGZF file and
+    builds the tabix index for it in the same pass. Lines starting with the
+    meta character are written but not indexed. Start positions are 1-based
+    as for GFF3, VCF and SAM files.
+
+    Parameters
+    ----------
+    lines : iterable
+        Lines (bytes) sorted by sequence and start
+    file_gz : str
+        Location of the BGZF file to write
+    file_tbi : str
+        Location of the tabix index file to write
+    col_seq : int
+        Column holding the sequence name (1-based)
+    col_beg : int
+        Column holding the start position (1-based)
+    col_end : int
+        Column holding the end position (1-based)
+    meta : bytes
+        Character used to mark header lines
+    threads : int
+        Number of threads to use for compressing the BGZF blocks
+
+    Example
+    -------
+    .. code-block:: python
+       :linenos:
+
+       with open(gff3_file, 'rb') as f_in:
+           bgzip_tabix(f_in, gff3_file + '.gz', gff3_file + '.gz.tbi', 1, 4, 5)
+    """
+    bgzf_out = BGZFWriter(file_gz, threads=threads)
+    tbi = TabixIndexBuilder(col_seq, col_beg, col_end, meta)
+    last_col = max(col_seq, col_beg, col_end)
+
+    for line in lines:
+        voffset_beg = bgzf_out.tell()
+        bgzf_out.write(line)
+
+        if line[0:1] == meta or not line.strip():
+            continue
+
+        sline = line.rstrip(b'\r\n').split(b'\t', last_col)
+        beg = int(sline[col_beg - 1]) - 1
+        end = max(int(sline[col_end - 1]), beg + 1)
+
+        tbi.add(sline[col_seq - 1], beg, end, voffset_beg, bgzf_out.tell())
+
+    bgzf_out.close()
+    tbi.write(file_tbi, bgzf_out.virtual_offset)
+
+
+def bgzip_tabix_batches(  # pylint: disable=too-many-arguments
+        batches, file_gz, file_tbi, col_seq, col_beg, col_end, threads=1):
+    """
+    Compresses a sorted stream of record batches into a BGZF file and builds
+    the tabix index for it in the same pass, as for :func:`bgzip_tabix`. The
+    coordinates are taken from the batches, such as
+    :class:`mg_process_files.tool.gff3_reader.GFF3Records`, so the lines are
+    not split again.
+
+    Parameters
+    ----------
+    batches : iterable
+        Batches with ``headers``, ``lines``, ``seqids``, ``starts`` (1-based)
+        and ``ends`` sorted by sequence and start
+    file_gz : str
+        Location of the BGZF file to write
+    file_tbi : str
+        Location of the tabix index file to write
+    col_seq : int
+        Column holding the sequence name (1-based)
+    col_beg : int
+        Column holding the start position (1-based)
+    col_end : int
+        Column holding the end position (1-based)
+    threads : int
+        Number of threads to use for compressing the BGZF blocks
+
+    Example
+    -------
+    .. code-block:: python
+       :linenos:
+
+       with open(gff3_file, 'rb') as f_in:
+           bgzip_tabix_batches(
+               gff3_batches(f_in), gff3_file + '.gz', gff3_file + '.gz.tbi', 1, 4, 5)
+    """
+    bgzf_out = BGZFWriter(file_gz, threads=threads)
+    tbi = TabixIndexBuilder(col_seq, col_beg, col_end)
+
+    for batch in batches:
+        for line in batch.headers:
+            bgzf_out.write(line)
+
+        begs = batch.starts - 1
+        ends = np.maximum(batch.ends, begs + 1)
+
+        for i, line in enumerate(batch.lines):
+            voffset_beg = bgzf_out.tell()
+            bgzf_out.write(line)
+            tbi.add(
+                bytes(batch.seqids[i]), int(begs[i]), int(ends[i]), voffset_beg, bgzf_out.tell())
+
+    bgzf_out.close()
+    tbi.write(file_tbi, bgzf_out.virtual_offset)
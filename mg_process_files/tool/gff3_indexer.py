@@ -20,7 +20,6 @@ from __future__ import print_function
 import sys
 import numpy as np
 import h5py
-import pysam
 
 from utils import logger
 
@@ -40,8 +39,140 @@ except ImportError:
 
 from basic_modules.tool import Tool
 
+from mg_process_files.tool.bgzf import bgzip_tabix_batches
+from mg_process_files.tool.gff3_reader import gff3_batches
+from mg_process_files.tool.index_utils import add_chromosome, extend_mask, intervals_to_mask
+from mg_process_files.tool.index_utils import bisect_left, decode_names, open_assembly_index
+from mg_process_files.tool.index_utils import read_spans, write_column, write_span
+
 # ------------------------------------------------------------------------------
 
+# ID, Name and gene_name are the keys of the attribute lookup table, ID and
+# Parent build the gene models
+INDEXED_ATTRIBUTES = (b'ID', b'Name', b'gene_name', b'Parent')
+
+
+def _span_bins(first, last, bin_size):
+    """
+    Converts a span of positions in the presence index to the span of the
+    bins covering it. Bins are 0-based, so position p (1-based) is in bin
+    (p - 1) // bin_size, the same for the presence and the count datasets.
+
+    Parameters
+    ----------
+    first : int
+        First position of the span
+    last : int
+        Position after the end of the span
+    bin_size : int
+        Width of the bins
+
+    Returns
+    -------
+    tuple
+        first and last bins, empty if the span is empty
+    """
+    if last <= first:
+        return (0, 0)
+    return (max(first - 1, 0) // bin_size, (last - 2) // bin_size + 1)
+
+
+def _concat_blocks(blocks):
+    """
+    Joins the blocks of records that were read for a single chromosome.
+
+    Parameters
+    ----------
+    blocks : list
+        List of (starts, ends, types) tuples of numpy arrays
+
+    Returns
+    -------
+    tuple
+        starts : numpy.ndarray
+        ends : numpy.ndarray
+        types : numpy.ndarray
+            Type of each feature as str
+    """
+    starts, ends, types = zip(*blocks)
+    return (
+        np.concatenate(starts), np.concatenate(ends),
+        np.char.decode(np.concatenate(types), 'utf-8'))
+
+
+def _feature_tree(feature_ids, feature_parents):  # pylint: disable=too-many-locals
+    """
+    Resolves the Parent attributes of a set of features into a tree laid out
+    in pre-order, so that each feature is followed directly by all of its
+    descendants. A feature with several parents, such as an exon shared by
+    transcripts, is repeated under each of them so that every subtree stays
+    contiguous. Features without a resolvable parent are roots. Where several
+    lines share an ID the first is used as the parent.
+
+    Parameters
+    ----------
+    feature_ids : list
+        ID of each feature, or None
+    feature_parents : list
+        List of the parent IDs of each feature
+
+    Returns
+    -------
+    tuple
+        features : numpy.ndarray
+            Feature for each row of the tree
+        parents : numpy.ndarray
+            Row of the parent of each row, -1 for roots
+        subtree_ends : numpy.ndarray
+            Row after the last descendant of each row
+    """
+    first_feature = {}
+    for i, feature_id in enumerate(feature_ids):
+        if feature_id is not None and feature_id not in first_feature:
+            first_feature[feature_id] = i
+
+    children = [[] for _ in feature_ids]
+    roots = []
+    for i, parent_ids in enumerate(feature_parents):
+        resolved = [
+            first_feature[p] for p in parent_ids
+            if p in first_feature and first_feature[p] != i]
+        for parent in resolved:
+            children[parent].append(i)
+        if not resolved:
+            roots.append(i)
+
+    features = []
+    parents = []
+    depths = []
+    for root in roots:
+        stack = [(root, -1, 0)]
+        while stack:
+            feature, parent_row, depth = stack.pop()
+
+            # Guard against cycles in the Parent attributes
+            ancestor = parent_row
+            while ancestor != -1 and features[ancestor] != feature:
+                ancestor = parents[ancestor]
+            if ancestor != -1:
+                continue
+
+            features.append(feature)
+            parents.append(parent_row)
+            depths.append(depth)
+            row = len(features) - 1
+            stack.extend((child, row, depth + 1) for child in reversed(children[feature]))
+
+    subtree_ends = np.full(len(features), len(features), dtype='i8')
+    open_rows = []
+    for row, depth in enumerate(depths):
+        while open_rows and depths[open_rows[-1]] >= depth:
+            subtree_ends[open_rows.pop()] = row
+        open_rows.append(row)
+
+    return (
+        np.array(features, dtype='i8'), np.array(parents, dtype='i8'), subtree_ends)
+
 
 class gff3IndexerTool(Tool):
     """
@@ -61,14 +192,23 @@ class gff3IndexerTool(Tool):
         self.configuration.update(configuration)
 
     @task(returns=bool, file_sorted_gff3=FILE_IN, file_sorted_gz_gff3=FILE_OUT,
-          file_gff3_tbi=FILE_OUT)
-    def gff32tabix(self, file_sorted_gff3, file_sorted_gz_gff3, file_gff3_tbi):  # pylint: disable=no-self-use,unused-argument
+          file_gff3_tbi=FILE_OUT, threads=IN)
+    def gff32tabix(  # pylint: disable=no-self-use
+            self, file_sorted_gff3, file_sorted_gz_gff3, file_gff3_tbi, threads=1):
         """
         GFF3 to Tabix
 
         Compresses the sorted GFF3 file and then uses Tabix to generate an index
         of the GFF3 file.
 
+        This is done as a single streaming stage. The file, as sorted by
+        :class:`mg_process_files.tool.gff3_sorter.gff3SortTool`, is read once
+        and grouped into record batches by
+        :func:`mg_process_files.tool.gff3_reader.gff3_batches`. These are
+        written as BGZF blocks while the tabix index is built from the
+        coordinates and offsets of each line by
+        :func:`mg_process_files.tool.bgzf.bgzip_tabix_batches`.
+
         Parameters
         ----------
         file_sorted_gff3 : str
@@ -77,6 +217,8 @@ class gff3IndexerTool(Tool):
             Location of the bgzip compressed GFF3 file
         file_gff3_tbi : str
             Location of the Tabix index file
+        threads : int
+            Number of threads to use for the BGZF compression
 
         Example
         -------
@@ -88,12 +230,562 @@ class gff3IndexerTool(Tool):
                    Exception(
                        "gff32tabix: Could not process files {}, {}.".format(*input_files)))
         """
-        pysam.tabix_compress(file_sorted_gff3, file_sorted_gz_gff3)  # pylint: disable=no-member
-        pysam.tabix_index(file_sorted_gz_gff3, preset='gff')  # pylint: disable=no-member
+        with open(file_sorted_gff3, "rb") as f_in:
+            bgzip_tabix_batches(
+                gff3_batches(f_in), file_sorted_gz_gff3, file_gff3_tbi,
+                col_seq=1, col_beg=4, col_end=5, threads=threads)
         return True
 
-    @task(returns=bool, file_id=IN, assembly=IN, file_sorted_gff3=FILE_IN, file_hdf5=FILE_INOUT)
-    def gff32hdf5(self, file_id, assembly, file_sorted_gff3, file_hdf5):  # pylint: disable=no-self-use,too-many-locals,too-many-statements
+    @staticmethod
+    def _open_feature_type_index(grp, feature_types, n_chroms, n_files):
+        """
+        Opens the per feature type presence datasets for an assembly, creating
+        any that are not already present and resizing them to match the
+        chromosomes and files in the main presence index.
+
+        Each feature type has a (chromosomes x files x bins) boolean dataset
+        recording which 1kb bins of each chromosome contain at least one
+        feature of that type.
+
+        Parameters
+        ----------
+        grp : h5py.Group
+            Assembly group within the HDF5 index file
+        feature_types : list
+            Feature types to maintain presence datasets for
+        n_chroms : int
+            Number of chromosomes in the main presence index
+        n_files : int
+            Number of files in the main presence index
+
+        Returns
+        -------
+        dict
+            Feature type to h5py.Dataset
+        """
+        max_files = 1024
+        max_chromosomes = 1024
+        max_chromosome_size = 2000000000
+        bin_size = 1000
+
+        tgrp = grp.require_group('feature_types')
+
+        tsets = {}
+        for feature_type in feature_types:
+            if feature_type in tgrp:
+                tset = tgrp[feature_type]
+            else:
+                tset = tgrp.create_dataset(
+                    feature_type, (0, 0, int(max_chromosome_size / bin_size)),
+                    maxshape=(max_chromosomes, max_files, int(max_chromosome_size / bin_size)),
+                    dtype='bool', chunks=True, compression="gzip")
+                tset.attrs['bin_size'] = bin_size
+
+            if tset.shape[0] < n_chroms or tset.shape[1] < n_files:
+                tset.resize((
+                    max(tset.shape[0], n_chroms), max(tset.shape[1], n_files), tset.shape[2]))
+
+            tsets[feature_type] = tset
+
+        return tsets
+
+    @staticmethod
+    def _open_feature_count_index(  # pylint: disable=too-many-arguments
+            grp, feature_types, bin_sizes, n_chroms, n_files):
+        """
+        Opens the per feature type count datasets for an assembly, creating
+        any that are not already present and resizing them to match the
+        chromosomes and files in the main presence index.
+
+        The counts are stored in the ``feature_counts/<bin size>`` groups with
+        a (chromosomes x files x bins) dataset for each feature type holding
+        the number of features that start within each bin. The furthest
+        feature end seen on each chromosome is kept in the ``extent`` dataset
+        of the ``feature_counts`` group so that readers only need to read the
+        bins that are in use.
+
+        Parameters
+        ----------
+        grp : h5py.Group
+            Assembly group within the HDF5 index file
+        feature_types : list
+            Feature types to maintain count datasets for
+        bin_sizes : list
+            Widths of the bins
+        n_chroms : int
+            Number of chromosomes in the main presence index
+        n_files : int
+            Number of files in the main presence index
+
+        Returns
+        -------
+        tuple
+            extent : h5py.Dataset
+                Furthest feature end for each chromosome
+            csets : dict
+                (bin size, feature type) to h5py.Dataset
+        """
+        max_files = 1024
+        max_chromosomes = 1024
+        max_chromosome_size = 2000000000
+
+        fgrp = grp.require_group('feature_counts')
+        if 'extent' not in fgrp:
+            fgrp.create_dataset('extent', (max_chromosomes,), dtype='i8')
+
+        csets = {}
+        for bin_size in bin_sizes:
+            cgrp = grp.require_group('feature_counts/' + str(bin_size))
+            n_bins = int(np.ceil(float(max_chromosome_size) / bin_size))
+
+            for feature_type in feature_types:
+                if feature_type in cgrp:
+                    cset = cgrp[feature_type]
+                else:
+                    cset = cgrp.create_dataset(
+                        feature_type, (0, 0, n_bins),
+                        maxshape=(max_chromosomes, max_files, n_bins),
+                        dtype='int32', chunks=True, compression="gzip")
+                    cset.attrs['bin_size'] = bin_size
+
+                if cset.shape[0] < n_chroms or cset.shape[1] < n_files:
+                    cset.resize((
+                        max(cset.shape[0], n_chroms), max(cset.shape[1], n_files), cset.shape[2]))
+
+                csets[(bin_size, feature_type)] = cset
+
+        return (fgrp['extent'], csets)
+
+    def _gff3_chrom2hdf5(  # pylint: disable=too-many-arguments
+            self, hdf5_idx, file_pos, chrom, starts, ends, feature_types):
+        """
+        Writes the features for a single chromosome to the presence index, to
+        the presence datasets for each of the tracked feature types and to
+        the feature count datasets.
+
+        Parameters
+        ----------
+        hdf5_idx : dict
+            grp, dset, cset, chrom_idx, feature_types and count_bin_sizes for
+            the assembly index, and the spans from the previous load of the
+            file, which are removed as they are cleared
+        file_pos : int
+            Position of the file within the index
+        chrom : str
+            Chromosome name
+        starts : numpy.ndarray
+            Start of each feature (1-based, sorted)
+        ends : numpy.ndarray
+            End of each feature (1-based, inclusive)
+        feature_types : numpy.ndarray
+            Type of each feature
+        """
+        chrom_pos = add_chromosome(
+            hdf5_idx["dset"], hdf5_idx["cset"], hdf5_idx["chrom_idx"], chrom)
+
+        # Each dataset is written once, covering both the new features and
+        # the span from any previous load of the file so that it is cleared
+        first, last = hdf5_idx["spans"].pop(chrom_pos, (0, 0))
+
+        offset, dnp = intervals_to_mask(starts, ends + 1)
+        write_span(hdf5_idx["grp"], chrom_pos, file_pos, offset, offset + len(dnp))
+        offset, dnp = extend_mask(offset, dnp, first, last)
+        hdf5_idx["dset"][chrom_pos, file_pos, offset:offset + len(dnp)] = dnp
+
+        tsets = self._open_feature_type_index(
+            hdf5_idx["grp"], hdf5_idx["feature_types"], len(hdf5_idx["chrom_idx"]),
+            file_pos + 1)
+        for feature_type, tset in tsets.items():
+            selected = feature_types == feature_type
+            bin_size = tset.attrs['bin_size']
+            first_bin, last_bin = _span_bins(first, last, bin_size)
+            if not selected.any():
+                # Only cleared if set, so types without features on the
+                # chromosome do not allocate chunks
+                if tset[chrom_pos, file_pos, first_bin:last_bin].any():
+                    tset[chrom_pos, file_pos, first_bin:last_bin] = False
+                continue
+            offset, dnp = intervals_to_mask(
+                (starts[selected] - 1) // bin_size, (ends[selected] - 1) // bin_size + 1)
+            offset, dnp = extend_mask(offset, dnp, first_bin, last_bin)
+            tset[chrom_pos, file_pos, offset:offset + len(dnp)] = dnp
+
+        extent, csets = self._open_feature_count_index(
+            hdf5_idx["grp"], hdf5_idx["feature_types"], hdf5_idx["count_bin_sizes"],
+            len(hdf5_idx["chrom_idx"]), file_pos + 1)
+        extent[chrom_pos] = max(int(extent[chrom_pos]), int(ends.max()))
+        for (bin_size, feature_type), cset in csets.items():
+            counts = np.bincount((starts[feature_types == feature_type] - 1) // bin_size)
+            first_bin, last_bin = _span_bins(first, last, bin_size)
+            if not counts.size:
+                if cset[chrom_pos, file_pos, first_bin:last_bin].any():
+                    cset[chrom_pos, file_pos, first_bin:last_bin] = 0
+                continue
+            counts = np.pad(counts, (0, max(last_bin - len(counts), 0)), 'constant')
+            cset[chrom_pos, file_pos, 0:len(counts)] = counts
+
+    def _clear_span(self, hdf5_idx, file_pos, chrom_pos, first, last):
+        """
+        Clears the span of a chromosome that was written by the previous load
+        of a file from the presence index, the feature type presence datasets
+        and the feature counts, so that nothing is left behind when the file
+        has fewer or shorter features than before.
+
+        Parameters
+        ----------
+        hdf5_idx : dict
+            grp, dset, feature_types and count_bin_sizes for the assembly
+            index
+        file_pos : int
+            Position of the file within the index
+        chrom_pos : int
+            Position of the chromosome within the index
+        first : int
+            First position of the span
+        last : int
+            Position after the end of the span
+        """
+        hdf5_idx["dset"][chrom_pos, file_pos, first:last] = False
+
+        tsets = self._open_feature_type_index(
+            hdf5_idx["grp"], hdf5_idx["feature_types"], len(hdf5_idx["chrom_idx"]),
+            file_pos + 1)
+        for tset in tsets.values():
+            first_bin, last_bin = _span_bins(first, last, tset.attrs['bin_size'])
+            tset[chrom_pos, file_pos, first_bin:last_bin] = False
+
+        _, csets = self._open_feature_count_index(
+            hdf5_idx["grp"], hdf5_idx["feature_types"], hdf5_idx["count_bin_sizes"],
+            len(hdf5_idx["chrom_idx"]), file_pos + 1)
+        for (bin_size, _), cset in csets.items():
+            first_bin, last_bin = _span_bins(first, last, bin_size)
+            cset[chrom_pos, file_pos, first_bin:last_bin] = 0
+
+    @staticmethod
+    def _update_attribute_index(hdf5_idx, file_pos, attribute_rows):
+        """
+        Writes the attribute values for a file as a table sorted by ``key`` in
+        the ``attributes/<file position>`` group of the assembly. Loading the
+        same file again overwrites its table in place, so the cost of a load
+        only depends on the size of the file and not on the rest of the
+        index. The tables of the files are merged when they are queried.
+
+        Parameters
+        ----------
+        hdf5_idx : dict
+            grp and chrom_idx for the assembly index
+        file_pos : int
+            Position of the file within the index
+        attribute_rows : list
+            List of (key, chrom, start, end, offset) tuples
+        """
+        chrom_pos = dict((chrom, i) for i, chrom in enumerate(hdf5_idx["chrom_idx"]))
+
+        keys, chroms, starts, ends, offsets = ((), (), (), (), ())
+        if attribute_rows:
+            keys, chroms, starts, ends, offsets = zip(*attribute_rows)
+
+        keys = np.array(keys, dtype='S')
+        order = np.argsort(keys, kind='mergesort')
+        table = {
+            'key': keys[order],
+            'chrom': np.array([chrom_pos[chrom] for chrom in chroms], dtype='i4')[order],
+            'start': np.array(starts, dtype='i8')[order],
+            'end': np.array(ends, dtype='i8')[order],
+            'offset': np.array(offsets, dtype='i8')[order]
+        }
+
+        fgrp = hdf5_idx["grp"].require_group('attributes').require_group(str(file_pos))
+        for column, values in table.items():
+            write_column(fgrp, column, values)
+
+    @staticmethod
+    def get_attribute_locations(file_hdf5, assembly, name, prefix=False):
+        """
+        Attribute lookup
+
+        Finds the features whose ID, Name or gene_name attribute matches the
+        name, or starts with the name if prefix is True. The sorted key table of
+        each file is binary searched on disk so only the matching rows are
+        read.
+
+        Parameters
+        ----------
+        file_hdf5 : str
+            Location of the HDF5 index file
+        assembly : str
+            Assembly of the genome
+        name : str
+            Attribute value to search for
+        prefix : bool
+            Match all keys that start with the name
+
+        Returns
+        -------
+        list
+            List of dicts with the file_id, chrom, start, end, offset of the
+            line in the sorted GFF3 file and the matched key
+
+        Example
+        -------
+        .. code-block:: python
+           :linenos:
+
+           locations = gff3IndexerTool.get_attribute_locations(
+               hdf5_file, "GRCh38", "BRCA2")
+        """
+        name = name.encode('utf-8') if not isinstance(name, bytes) else name
+
+        locations = []
+        with h5py.File(file_hdf5, "r") as f_h5_in:
+            grp = f_h5_in[str(assembly)]
+            if 'attributes' not in grp:
+                return []
+
+            file_idx = decode_names(grp['files'])
+            chrom_idx = decode_names(grp['chromosomes'])
+
+            for file_pos in sorted(grp['attributes'], key=int):
+                fgrp = grp['attributes'][file_pos]
+                keys = fgrp['key']
+
+                first = bisect_left(keys, name)
+                if prefix:
+                    last = bisect_left(keys, name + b'\xff', first)
+                else:
+                    last = bisect_left(keys, name + b'\x00', first)
+
+                if first == last:
+                    continue
+
+                columns = dict(
+                    (column, fgrp[column][first:last])
+                    for column in ('key', 'chrom', 'start', 'end', 'offset'))
+
+                locations.extend([
+                    {
+                        "key": columns['key'][i].decode('utf-8'),
+                        "file_id": file_idx[int(file_pos)],
+                        "chrom": chrom_idx[columns['chrom'][i]],
+                        "start": int(columns['start'][i]),
+                        "end": int(columns['end'][i]),
+                        "offset": int(columns['offset'][i])
+                    } for i in range(last - first)
+                ])
+
+        return sorted(locations, key=lambda location: location["key"])
+
+    @staticmethod
+    def get_feature_counts(file_hdf5, assembly, chrom, feature_type, bin_size=100000):
+        """
+        Feature density reader
+
+        Reads the number of features of a given type that start within each
+        bin of a chromosome across all of the files that have been indexed for
+        an assembly as a single slice of the count dataset.
+
+        Parameters
+        ----------
+        file_hdf5 : str
+            Location of the HDF5 index file
+        assembly : str
+            Assembly of the genome
+        chrom : str
+            Chromosome name
+        feature_type : str
+            Feature type, as listed in the feature_types when indexed
+        bin_size : int
+            Resolution of the counts to read
+
+        Returns
+        -------
+        tuple
+            file_ids : list
+                file_id for each row of the matrix
+            bin_starts : numpy.ndarray
+                Start position (0-based) of each column of the matrix
+            matrix : numpy.ndarray
+                (files x bins) array of the feature counts, up to the end of
+                the last feature on the chromosome in any of the files
+
+        Example
+        -------
+        .. code-block:: python
+           :linenos:
+
+           file_ids, bins, counts = gff3IndexerTool.get_feature_counts(
+               hdf5_file, "GRCh38", "chr1", "gene", 1000000)
+        """
+        with h5py.File(file_hdf5, "r") as hdf5_in:
+            grp = hdf5_in[str(assembly)]
+            cset = grp['feature_counts'][str(bin_size)][feature_type]
+
+            file_ids = [i for i in decode_names(grp['files']) if i != '']
+            chrom_pos = decode_names(grp['chromosomes']).index(chrom)
+            n_bins = int(np.ceil(
+                float(grp['feature_counts']['extent'][chrom_pos]) / bin_size))
+
+            matrix = np.zeros((len(file_ids), n_bins), dtype='int32')
+            if chrom_pos < cset.shape[0]:
+                n_files = min(len(file_ids), cset.shape[1])
+                matrix[0:n_files, :] = cset[chrom_pos, 0:n_files, 0:n_bins]
+
+        return (file_ids, np.arange(n_bins, dtype='i8') * bin_size, matrix)
+
+    @staticmethod
+    def _update_gene_models(hdf5_idx, file_pos, features):  # pylint: disable=too-many-locals
+        """
+        Stores the resolved feature hierarchy for a file in the
+        ``gene_models/<file position>`` group of the assembly, overwriting any
+        previous load of the same file in place.
+
+        The features are laid out in pre-order with column datasets for the
+        feature and the structure of the tree:
+
+        parent
+            Row of the parent feature, -1 for roots
+        subtree_end
+            Row after the last descendant, so the full model for a feature is
+            the slice ``[row:subtree_end[row]]``
+        child_offsets, children
+            Rows of the direct children of each row, with the children of row
+            ``r`` at ``children[child_offsets[r]:child_offsets[r + 1]]``
+        id_keys, id_rows
+            IDs sorted for binary searching and the first row for each
+
+        Parameters
+        ----------
+        hdf5_idx : dict
+            grp and chrom_idx for the assembly index
+        file_pos : int
+            Position of the file within the index
+        features : list
+            List of (id, parent ids, chrom, type, start, end, strand, offset)
+            tuples for each feature in the file
+        """
+        grp = hdf5_idx["grp"]
+        chrom_pos = dict((chrom, i) for i, chrom in enumerate(hdf5_idx["chrom_idx"]))
+
+        columns = ((), (), (), (), (), (), (), ())
+        if features:
+            columns = zip(*features)
+        feature_ids, feature_parents, chroms, types, starts, ends, strands, offsets = columns
+
+        rows, parents, subtree_ends = _feature_tree(feature_ids, feature_parents)
+
+        ids = np.array([i if i is not None else b'' for i in feature_ids], dtype='S')
+        model = {
+            'id': ids[rows],
+            'type': np.array(types, dtype='S')[rows],
+            'chrom': np.array([chrom_pos[c] for c in chroms], dtype='i4')[rows],
+            'start': np.array(starts, dtype='i8')[rows],
+            'end': np.array(ends, dtype='i8')[rows],
+            'strand': np.array(strands, dtype='S1')[rows],
+            'offset': np.array(offsets, dtype='i8')[rows],
+            'parent': parents,
+            'subtree_end': subtree_ends
+        }
+
+        child_rows = np.flatnonzero(parents >= 0)
+        model['children'] = child_rows[np.argsort(parents[child_rows], kind='mergesort')]
+        model['child_offsets'] = np.searchsorted(
+            parents[model['children']], np.arange(len(rows) + 1)).astype('i8')
+
+        order = np.argsort(model['id'], kind='mergesort')
+        keyed = order[model['id'][order] != b'']
+        first = np.ones(len(keyed), dtype='bool')
+        first[1:] = model['id'][keyed][1:] != model['id'][keyed][:-1]
+        model['id_keys'] = model['id'][keyed][first]
+        model['id_rows'] = keyed[first].astype('i8')
+
+        fgrp = grp.require_group('gene_models').require_group(str(file_pos))
+        for column, values in model.items():
+            write_column(fgrp, column, values)
+
+    @staticmethod
+    def get_gene_model(file_hdf5, assembly, file_id, feature_id):
+        """
+        Gene model retrieval
+
+        Returns a feature and all of its descendants, for example a gene with
+        its transcripts, exons and CDS, from the hierarchy resolved when the
+        file was indexed. The ID is binary searched on disk and the model is
+        read as a contiguous slice of each column.
+
+        Parameters
+        ----------
+        file_hdf5 : str
+            Location of the HDF5 index file
+        assembly : str
+            Assembly of the genome
+        file_id : str
+            The file_id as stored by the DMP
+        feature_id : str
+            ID attribute of the top level feature
+
+        Returns
+        -------
+        list
+            List of dicts with the id, type, chrom, start, end, strand and
+            offset of the line in the sorted GFF3 file of each feature in
+            pre-order. The parent and children are positions within the list.
+            The list is empty if the feature is not found.
+
+        Example
+        -------
+        .. code-block:: python
+           :linenos:
+
+           model = gff3IndexerTool.get_gene_model(
+               hdf5_file, "GRCh38", file_id, "gene:ENSG00000139618")
+           transcripts = [model[i] for i in model[0]["children"]]
+        """
+        feature_id = feature_id.encode('utf-8') if not isinstance(feature_id, bytes) else feature_id
+
+        with h5py.File(file_hdf5, "r") as f_h5_in:
+            grp = f_h5_in[str(assembly)]
+            file_idx = decode_names(grp['files'])
+            if file_id not in file_idx or 'gene_models' not in grp:
+                return []
+            if str(file_idx.index(file_id)) not in grp['gene_models']:
+                return []
+            fgrp = grp['gene_models'][str(file_idx.index(file_id))]
+
+            pos = bisect_left(fgrp['id_keys'], feature_id)
+            if pos == fgrp['id_keys'].shape[0] or fgrp['id_keys'][pos] != feature_id:
+                return []
+
+            first = int(fgrp['id_rows'][pos])
+            last = int(fgrp['subtree_end'][first])
+
+            columns = dict(
+                (column, fgrp[column][first:last])
+                for column in ('id', 'type', 'chrom', 'start', 'end', 'strand', 'offset', 'parent'))
+            child_offsets = fgrp['child_offsets'][first:last + 1]
+            children = fgrp['children'][child_offsets[0]:child_offsets[-1]] - first
+            child_offsets = child_offsets - child_offsets[0]
+
+            chrom_idx = decode_names(grp['chromosomes'])
+
+        return [
+            {
+                "id": columns['id'][i].decode('utf-8'),
+                "type": columns['type'][i].decode('utf-8'),
+                "chrom": chrom_idx[columns['chrom'][i]],
+                "start": int(columns['start'][i]),
+                "end": int(columns['end'][i]),
+                "strand": columns['strand'][i].decode('utf-8'),
+                "offset": int(columns['offset'][i]),
+                "parent": int(columns['parent'][i]) - first if i > 0 else -1,
+                "children": [int(c) for c in children[child_offsets[i]:child_offsets[i + 1]]]
+            } for i in range(last - first)
+        ]
+
+    @task(returns=bool, file_id=IN, assembly=IN, file_sorted_gff3=FILE_IN,
+          file_hdf5=FILE_INOUT, feature_types=IN, count_bin_sizes=IN)
+    def gff32hdf5(  # pylint: disable=too-many-arguments,too-many-locals
+            self, file_id, assembly, file_sorted_gff3, file_hdf5, feature_types=None,
+            count_bin_sizes=None):
         """
         GFF3 to HDF5 converter
 
@@ -102,6 +794,27 @@ class gff3IndexerTool(Tool):
         Overlapping regions are condensed into a single feature block rather
         than maintaining all of the detail of the original bed file.
 
+        All of the chromosomes in the file are indexed. In the same pass a
+        presence dataset at 1kb resolution is maintained for each of the
+        feature types so that files with, for example, exons in a region can be
+        found without opening the tabix files. These are stored in the
+        ``feature_types`` group of the assembly.
+
+        The number of features of each type starting within each bin is also
+        counted at several resolutions, 10kb, 100kb and 1Mb by default, so that
+        overview density tracks can be read as a single slice with
+        :meth:`get_feature_counts`.
+
+        The ID, Name and gene_name attributes are also loaded into a sorted
+        lookup table with the location of each feature and the offset of its
+        line in the sorted GFF3 file. This can be searched with
+        :meth:`get_attribute_locations`.
+
+        The Parent and ID attributes are resolved into the feature hierarchy
+        for the file, stored as parent pointer and child offset arrays in the
+        ``gene_models`` group, so that a gene with all of its transcripts and
+        exons can be read with :meth:`get_gene_model`.
+
         Parameters
         ----------
         file_id : str
@@ -114,6 +827,11 @@ class gff3IndexerTool(Tool):
             Location of the sorted GFF3 file
         file_hdf5 : str
             Location of the HDF5 index file
+        feature_types : list
+            Feature types to maintain separate presence datasets for. Defaults
+            to gene, mRNA, exon and CDS
+        count_bin_sizes : list
+            Bin sizes for the feature counts. Defaults to 10kb, 100kb and 1Mb
 
         Example
         -------
@@ -126,92 +844,68 @@ class gff3IndexerTool(Tool):
                        "gff32hdf5: Could not process files {}, {}.".format(*input_files)))
 
         """
-        max_files = 1024
-        max_chromosomes = 1024
-        max_chromosome_size = 2000000000
+        if feature_types is None:
+            feature_types = ["gene", "mRNA", "exon", "CDS"]
+        if count_bin_sizes is None:
+            count_bin_sizes = [10000, 100000, 1000000]
 
         f_h5_in = h5py.File(file_hdf5, "a")
 
-        if str(assembly) in f_h5_in:
-            grp = f_h5_in[str(assembly)]
-
-            dset = grp['data']
-            fset = grp['files']
-            cset = grp['chromosomes']
-            file_idx = [i for i in fset if i != '']
-            if file_id not in file_idx:
-                file_idx.append(file_id)
-                dset.resize((dset.shape[0], dset.shape[1] + 1, max_chromosome_size))  # pylint: disable=no-member
-            chrom_idx = [c for c in cset if c != '']
-
-        else:
-            # Create the initial dataset with minimum values
-            grp = f_h5_in.create_group(str(assembly))
-            f_h5_in.create_group('meta')
-
-            dtf = h5py.special_dtype(vlen=str)
-            dtc = h5py.special_dtype(vlen=str)
-            fset = grp.create_dataset('files', (max_files,), dtype=dtf)
-            cset = grp.create_dataset('chromosomes', (max_chromosomes,), dtype=dtc)
-
-            file_idx = [file_id]
-            chrom_idx = []
-
-            dset = grp.create_dataset(
-                'data', (0, 1, max_chromosome_size),
-                maxshape=(max_chromosomes, max_files, max_chromosome_size),
-                dtype='bool', chunks=True, compression="gzip"
-            )
-
-        # Save the list of files
-        fset[0:len(file_idx)] = file_idx
-
-        file_chrom_count = 0
-
-        dnp = np.zeros([max_chromosome_size], dtype='bool')
+        dset, cset, file_idx, chrom_idx = open_assembly_index(f_h5_in, assembly, file_id)
+        hdf5_idx = {
+            "grp": f_h5_in[str(assembly)],
+            "dset": dset,
+            "cset": cset,
+            "chrom_idx": chrom_idx,
+            "feature_types": feature_types,
+            "count_bin_sizes": count_bin_sizes
+        }
+        file_pos = file_idx.index(file_id)
+        hdf5_idx["spans"] = read_spans(hdf5_idx["grp"], file_pos)
 
         previous_chrom = ''
-        loaded = False
-
-        with open(file_sorted_gff3, 'r') as f_in:
-            for line in f_in:
-                if line[0] == '#':
-                    continue
+        blocks = []
 
-                line = line.strip()
-                sline = line.split("\t")
+        attribute_rows = []
+        features = []
 
-                chrom = str(sline[0])
-                start = int(sline[3])
-                end = int(sline[4])
+        with open(file_sorted_gff3, 'rb') as f_in:
+            for batch in gff3_batches(f_in):
+                for chrom, first, last in batch.seqid_blocks():
+                    if chrom != previous_chrom and previous_chrom != '':
+                        self._gff3_chrom2hdf5(
+                            hdf5_idx, file_pos, previous_chrom, *_concat_blocks(blocks))
+                        blocks = []
 
-                loaded = False
+                    previous_chrom = chrom
+                    blocks.append((
+                        batch.starts[first:last], batch.ends[first:last], batch.types[first:last]))
 
-                if chrom != previous_chrom and previous_chrom != '':
-                    file_chrom_count += 1
-                    if previous_chrom not in chrom_idx:
-                        chrom_idx.append(previous_chrom)
-                        cset[0:len(chrom_idx)] = chrom_idx
-                        dset.resize((dset.shape[0] + 1, dset.shape[1], max_chromosome_size))
+                    for i in range(first, last):
+                        start = int(batch.starts[i])
+                        end = int(batch.ends[i])
+                        offset = int(batch.offsets[i])
 
-                    dset[chrom_idx.index(previous_chrom), file_idx.index(file_id), :] = dnp
-                    loaded = True
+                        feature_id, name, gene_name, parent = batch.attributes(
+                            i, INDEXED_ATTRIBUTES)
+                        for key in feature_id + name + gene_name:
+                            attribute_rows.append((key, chrom, start, end, offset))
 
-                    if file_chrom_count == 5:
-                        break
+                        features.append((
+                            feature_id[0] if feature_id else None, parent,
+                            chrom, batch.types[i], start, end, batch.strands[i], offset))
 
-                    dnp = np.zeros([max_chromosome_size], dtype='bool')
+        if previous_chrom != '':
+            self._gff3_chrom2hdf5(
+                hdf5_idx, file_pos, previous_chrom, *_concat_blocks(blocks))
 
-                previous_chrom = chrom
-                dnp[start:end + 1] = 1
+        # Chromosomes that the file no longer has features on
+        for chrom_pos, span in hdf5_idx["spans"].items():
+            self._clear_span(hdf5_idx, file_pos, chrom_pos, *span)
+            write_span(hdf5_idx["grp"], chrom_pos, file_pos, 0, 0)
 
-            if loaded is False:
-                if previous_chrom not in chrom_idx:
-                    chrom_idx.append(chrom)
-                    cset[0:len(chrom_idx)] = chrom_idx
-                    dset.resize((dset.shape[0] + 1, dset.shape[1], max_chromosome_size))
-
-                dset[chrom_idx.index(previous_chrom), file_idx.index(file_id), :] = dnp
+        self._update_attribute_index(hdf5_idx, file_pos, attribute_rows)
+        self._update_gene_models(hdf5_idx, file_pos, features)
 
         f_h5_in.close()
 
@@ -222,6 +916,12 @@ class gff3IndexerTool(Tool):
         Function to run the BED file sorter and indexer so that the files can
         get searched as part of the REST API
 
+        The feature types that get separate presence datasets in the HDF5
+        index can be set with "gff3_feature_types" in the configuration and
+        the bin sizes for the feature counts with "gff3_count_bin_sizes". The
+        number of threads used to compress the bgzip file is set with
+        "bgzf_threads".
+
         Parameters
         ----------
         input_files : list
@@ -248,14 +948,16 @@ class gff3IndexerTool(Tool):
         # handle error
         results_1 = self.gff32tabix(
             input_files["gff3"], output_files["gz_file"],
-            output_files["tbi_file"])
+            output_files["tbi_file"], self.configuration.get("bgzf_threads", 1))
         results_1 = compss_wait_on(results_1)
 
         results_2 = self.gff32hdf5(
             input_files["gff3"],
             input_metadata["gff3"].meta_data["assembly"],
             input_files["gff3"],
-            input_files["hdf5_file"])
+            input_files["hdf5_file"],
+            self.configuration.get("gff3_feature_types", ["gene", "mRNA", "exon", "CDS"]),
+            self.configuration.get("gff3_count_bin_sizes", [10000, 100000, 1000000]))
         results_2 = compss_wait_on(results_2)
 
         output_generated_files = {
@@ -0,0 +1,239 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import numpy as np
+
+try:
+    from urllib.parse import unquote_to_bytes as unquote
+except ImportError:
+    from urllib import unquote  # pylint: disable=ungrouped-imports,no-name-in-module
+
+# ------------------------------------------------------------------------------
+
+
+class GFF3Records(object):  # pylint: disable=too-many-instance-attributes
+    """
+    Batch of GFF3 feature lines
+
+    The seqid, type, start, end and strand columns are parsed when the batch is
+    created and held as numpy arrays. Column 9 is kept as it is and only split
+    into its tags, and URL decoded, for the records whose attributes are
+    requested.
+
+    Attributes
+    ----------
+    headers : list
+        Header and comment lines that were read along with the batch
+    lines : list
+        Feature lines as bytes, including the line ending
+    offsets : numpy.ndarray
+        Byte offset of each line from the start of the input
+    seqids : numpy.ndarray
+        Sequence name of each feature as bytes
+    types : numpy.ndarray
+        Type of each feature as bytes
+    starts : numpy.ndarray
+        Start of each feature (1-based)
+    ends : numpy.ndarray
+        End of each feature (1-based, inclusive)
+    strands : numpy.ndarray
+        Strand of each feature as bytes
+    """
+
+    __slots__ = (
+        'headers', 'lines', 'offsets', 'seqids', 'types', 'starts', 'ends', 'strands',
+        '_attributes', '_tags'
+    )
+
+    def __init__(self, lines, offsets, headers=None):
+        """
+        Parameters
+        ----------
+        lines : list
+            Feature lines as bytes
+        offsets : list
+            Byte offset of each line
+        headers : list
+            Header lines read along with the batch
+        """
+        columns = [line.rstrip(b'\r\n').split(b'\t', 8) for line in lines]
+
+        self.headers = headers if headers is not None else []
+        self.lines = lines
+        self.offsets = np.array(offsets, dtype='i8')
+        self.seqids = np.array([c[0] for c in columns], dtype='S')
+        self.types = np.array([c[2] for c in columns], dtype='S')
+        self.starts = np.array([c[3] for c in columns], dtype='S').astype('i8')
+        self.ends = np.array([c[4] for c in columns], dtype='S').astype('i8')
+        self.strands = np.array([c[6] for c in columns], dtype='S1')
+        self._attributes = [c[8] if len(c) > 8 else b'' for c in columns]
+        self._tags = [None] * len(lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def tags(self, i):
+        """
+        Returns the tags from column 9 of a record. The values are left URL
+        encoded. The column is only split the first time that the tags for
+        the record are requested.
+
+        Parameters
+        ----------
+        i : int
+            Position of the record in the batch
+
+        Returns
+        -------
+        dict
+            Tag to value as bytes
+        """
+        if self._tags[i] is None:
+            tags = {}
+            for key_value in self._attributes[i].split(b';'):
+                key_value = key_value.strip().split(b'=', 1)
+                if len(key_value) == 2:
+                    tags[key_value[0]] = key_value[1]
+            self._tags[i] = tags
+        return self._tags[i]
+
+    def attribute(self, i, tag):
+        """
+        Returns the URL decoded values of a tag for a record.
+
+        Parameters
+        ----------
+        i : int
+            Position of the record in the batch
+        tag : bytes
+            Name of the tag, eg b'ID' or b'Parent'
+
+        Returns
+        -------
+        list
+            List of bytes, empty if the record does not have the tag
+        """
+        tags = self.tags(i)
+        if tag not in tags:
+            return []
+        return [unquote(v) for v in tags[tag].split(b',')]
+
+    def attributes(self, i, tags):
+        """
+        Returns the URL decoded values of several tags for a record. Column 9
+        is split once and only the requested tags are decoded, so this is
+        cheaper than calling :meth:`attribute` for each tag when every record
+        of a batch is visited once.
+
+        Parameters
+        ----------
+        i : int
+            Position of the record in the batch
+        tags : tuple
+            Names of the tags as bytes
+
+        Returns
+        -------
+        list
+            List of bytes for each tag, empty if the record does not have the
+            tag
+        """
+        values = [[] for _ in tags]
+        for key_value in self._attributes[i].split(b';'):
+            key, sep, value = key_value.strip().partition(b'=')
+            if sep and key in tags:
+                values[tags.index(key)] = [unquote(v) for v in value.split(b',')]
+        return values
+
+    def seqid_blocks(self):
+        """
+        Splits the batch into runs of consecutive records on the same sequence.
+
+        Returns
+        -------
+        list
+            List of (seqid, first, last) tuples with the seqid as str and the
+            records in the slice [first:last]
+        """
+        if len(self.lines) == 0:
+            return []
+
+        bounds = np.flatnonzero(self.seqids[1:] != self.seqids[:-1]) + 1
+        firsts = np.concatenate(([0], bounds))
+        lasts = np.concatenate((bounds, [len(self.lines)]))
+
+        return [
+            (self.seqids[first].decode('utf-8'), int(first), int(last))
+            for first, last in zip(firsts, lasts)
+        ]
+
+
+def gff3_batches(lines, batch_size=100000):
+    """
+    GFF3 record reader
+
+    Groups the lines of a GFF3 file into :class:`GFF3Records` batches. Header
+    and comment lines are attached to the batch that they are read with and
+    blank lines are dropped. The byte offset of each line from the start of
+    the input is tracked so that the lines can be found again in the file.
+
+    Parameters
+    ----------
+    lines : iterable
+        Lines of the GFF3 file as bytes, eg a file opened in binary mode
+    batch_size : int
+        Maximum number of feature lines in each batch
+
+    Returns
+    -------
+    generator
+        GFF3Records
+
+    Example
+    -------
+    .. code-block:: python
+       :linenos:
+
+       with open(gff3_file, 'rb') as f_in:
+           for batch in gff3_batches(f_in):
+               genes = batch.starts[batch.types == b'gene']
+    """
+    headers = []
+    features = []
+    offsets = []
+    offset = 0
+
+    for line in lines:
+        line_offset = offset
+        offset += len(line)
+
+        if line[0:1] == b'#':
+            headers.append(line)
+        elif line.strip():
+            features.append(line)
+            offsets.append(line_offset)
+
+            if len(features) >= batch_size:
+                yield GFF3Records(features, offsets, headers)
+                headers = []
+                features = []
+                offsets = []
+
+    if features or headers:
+        yield GFF3Records(features, offsets, headers)
@@ -17,9 +17,9 @@
 
 from __future__ import print_function
 
+import os
 import sys
 import subprocess
-import shlex
 
 from utils import logger
 
@@ -40,9 +40,63 @@ except ImportError:
 from basic_modules.metadata import Metadata
 from basic_modules.tool import Tool
 
+from mg_process_files.tool.gff3_reader import gff3_batches
+
 # ------------------------------------------------------------------------------
 
 
+def sort_gff3_lines(file_gff3):
+    """
+    Sorted GFF3 line generator
+
+    Reads the GFF3 file once with
+    :func:`mg_process_files.tool.gff3_reader.gff3_batches`, keeping the header
+    and comment lines and passing the feature lines to the standard Linux
+    ``sort`` to get sorted by the chromosome and start columns. The header
+    lines are generated first followed by the sorted features.
+
+    Parameters
+    ----------
+    file_gff3 : str
+        Location of the source GFF3 file
+
+    Returns
+    -------
+    generator
+        Lines of the sorted GFF3 file as bytes
+
+    Example
+    -------
+    .. code-block:: python
+       :linenos:
+
+       with open(sorted_gff3_file, 'wb') as f_out:
+           f_out.writelines(sort_gff3_lines(gff3_file))
+    """
+    sort_env = dict(os.environ)
+    sort_env['LC_ALL'] = 'C'
+
+    sort_handle = subprocess.Popen(
+        ['sort', '-t', '\t', '-k1,1', '-k4,4n'],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=sort_env)
+
+    headers = []
+    with open(file_gff3, 'rb') as f_in:
+        for batch in gff3_batches(f_in):
+            headers.extend(batch.headers)
+            sort_handle.stdin.writelines(batch.lines)
+    sort_handle.stdin.close()
+
+    for line in headers:
+        yield line
+
+    for line in sort_handle.stdout:
+        yield line
+
+    sort_handle.stdout.close()
+    sort_handle.wait()
+
+
 class gff3SortTool(Tool):
     """
     Tool for running indexers over a WIG file for use in the RESTful API
@@ -65,20 +119,19 @@ class gff3SortTool(Tool):
         """
         Sorts the GFF3 file in preparation for compression and indexing
 
-        Parameters
-        ----------
-        file_gff3 : str
-            Location of the source GFF3 file
-
         GFF3 file sorter
 
         This is a wrapper for the standard Linux ``sort`` method the sorting by
-        the chromosome and start columns in the GFF3 file.
+        the chromosome and start columns in the GFF3 file. The file is read
+        once by :func:`sort_gff3_lines` and the header lines are kept at the
+        top of the sorted file.
 
         Parameters
         ----------
         file_gff3 : str
             Location of the source GFF3 file
+        gff3_out_file : str
+            Location of the sorted GFF3 file
 
         Example
         -------
@@ -88,28 +141,8 @@ class gff3SortTool(Tool):
            results = self.gff3sorter(gff3_file)
            results = compss_wait_on(results)
         """
-        grep_comment_command = 'grep ^"#" ' + file_gff3
-        grep_gff_command = 'grep -v ^"#" ' + file_gff3
-        sort_command = 'sort -k1,1 -k4,4n'
-
-        grep_comment_args = shlex.split(grep_comment_command)
-        grep_args = shlex.split(grep_gff_command)
-        sort_args = shlex.split(sort_command)
-
-        file_sorted_gff3 = file_gff3 + '.sorted.gff3'
-
-        with open(file_sorted_gff3, "wb") as out:
-            grep = subprocess.Popen(grep_comment_args, stdout=out)
-            grep.wait()
-
-        with open(file_sorted_gff3, "a") as out:
-            grep = subprocess.Popen(grep_args, stdout=subprocess.PIPE)
-            process_handle = subprocess.Popen(sort_args, stdin=grep.stdout, stdout=out)
-            process_handle.wait()
-
         with open(gff3_out_file, "wb") as f_out:
-            with open(file_sorted_gff3, "rb") as f_in:
-                f_out.write(f_in.read())
+            f_out.writelines(sort_gff3_lines(file_gff3))
 
         return True
 
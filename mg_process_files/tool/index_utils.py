@@ -0,0 +1,366 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import numpy as np
+import h5py
+
+# ------------------------------------------------------------------------------
+
+
+def decode_names(dset):
+    """
+    Returns the values of a variable length string dataset as a list of str.
+    Newer versions of h5py return these values as bytes.
+
+    Parameters
+    ----------
+    dset : h5py.Dataset
+        Variable length string dataset
+
+    Returns
+    -------
+    list
+        List of str
+    """
+    return [n.decode('utf-8') if isinstance(n, bytes) else n for n in dset]
+
+
+def bisect_left(dset, value, low=0):
+    """
+    Binary search of a sorted dataset without reading the whole dataset into
+    memory.
+
+    Parameters
+    ----------
+    dset : h5py.Dataset
+        Sorted 1D dataset
+    value
+        Value to locate
+    low : int
+        Position to start the search from
+
+    Returns
+    -------
+    int
+        Position of the first element that is not less than the value
+    """
+    high = dset.shape[0]
+    while low < high:
+        mid = (low + high) // 2
+        if dset[mid] < value:
+            low = mid + 1
+        else:
+            high = mid
+    return low
+
+
+def write_column(grp, name, values):
+    """
+    Writes a 1D column dataset, overwriting any existing dataset of the same
+    name in place. The datasets are created resizable so that loading a file
+    again reuses the space of the previous load rather than leaving it
+    behind in the HDF5 file. A string column is only recreated if the new
+    values are longer than the existing dataset can hold.
+
+    Parameters
+    ----------
+    grp : h5py.Group
+        Group to write the column to
+    name : str
+        Name of the dataset
+    values : numpy.ndarray
+        Values of the column
+
+    Returns
+    -------
+    h5py.Dataset
+    """
+    values = np.asarray(values)
+    if name in grp:
+        dset = grp[name]
+        if dset.maxshape[0] is None and dset.dtype.itemsize >= values.dtype.itemsize:
+            dset.resize((len(values),))
+            if len(values):
+                dset[:] = values
+            return dset
+        del grp[name]
+
+    return grp.create_dataset(
+        name, data=values, chunks=True, compression="gzip", maxshape=(None,))
+
+
+def open_assembly_index(hdf5_in, assembly, file_id):
+    """
+    Opens the presence index for an assembly within the HDF5 file, creating
+    it if this is the first file for the assembly, and registers the file_id
+    as one of the files in the index.
+
+    Parameters
+    ----------
+    hdf5_in : h5py.File
+        Open handle to the HDF5 index file
+    assembly : str
+        Assembly of the genome that is getting indexed
+    file_id : str
+        The file_id as stored by the DMP
+
+    Returns
+    -------
+    tuple
+        dset : h5py.Dataset
+            Presence dataset (chromosomes x files x positions)
+        cset : h5py.Dataset
+            Dataset listing the chromosomes in the index
+        file_idx : list
+            Ordered list of the file_ids in the index
+        chrom_idx : list
+            Ordered list of the chromosomes in the index
+    """
+    max_files = 1024
+    max_chromosomes = 1024
+    max_chromosome_size = 2000000000
+
+    if str(assembly) in hdf5_in:
+        grp = hdf5_in[str(assembly)]
+
+        dset = grp['data']
+        fset = grp['files']
+        cset = grp['chromosomes']
+        file_idx = [i for i in decode_names(fset) if i != '']
+        if file_id not in file_idx:
+            file_idx.append(file_id)
+            # pylint is unable to recognise the resize and shape methods
+            dset.resize(  # pylint: disable=no-member
+                (dset.shape[0], dset.shape[1] + 1, max_chromosome_size))
+        chrom_idx = [c for c in decode_names(cset) if c != '']
+
+    else:
+        # Create the initial dataset with minimum values
+        grp = hdf5_in.create_group(str(assembly))
+        if 'meta' not in hdf5_in:
+            hdf5_in.create_group('meta')
+
+        dtf = h5py.special_dtype(vlen=str)
+        dtc = h5py.special_dtype(vlen=str)
+        fset = grp.create_dataset('files', (max_files,), dtype=dtf)
+        cset = grp.create_dataset('chromosomes', (max_chromosomes,), dtype=dtc)
+
+        file_idx = [file_id]
+        chrom_idx = []
+
+        dset = grp.create_dataset(
+            'data', (0, 1, max_chromosome_size),
+            maxshape=(max_chromosomes, max_files, max_chromosome_size),
+            dtype='bool', chunks=True, compression="gzip")
+
+    # Save the list of files
+    fset[0:len(file_idx)] = file_idx
+
+    return (dset, cset, file_idx, chrom_idx)
+
+
+def add_chromosome(dset, cset, chrom_idx, chrom):
+    """
+    Adds a chromosome to the presence index if it is not already present.
+
+    Parameters
+    ----------
+    dset : h5py.Dataset
+        Presence dataset (chromosomes x files x positions)
+    cset : h5py.Dataset
+        Dataset listing the chromosomes in the index
+    chrom_idx : list
+        Ordered list of the chromosomes in the index. This gets updated
+    chrom : str
+        Chromosome name
+
+    Returns
+    -------
+    int
+        Position of the chromosome within the index
+    """
+    if chrom not in chrom_idx:
+        chrom_idx.append(chrom)
+        cset[0:len(chrom_idx)] = chrom_idx
+        dset.resize((dset.shape[0] + 1, dset.shape[1], dset.shape[2]))
+
+    return chrom_idx.index(chrom)
+
+
+def read_spans(grp, file_pos):
+    """
+    Returns the spans of the presence index that were written for a file by
+    its previous load, so that they can be cleared before the file is
+    written again.
+
+    Parameters
+    ----------
+    grp : h5py.Group
+        Assembly group within the HDF5 index file
+    file_pos : int
+        Position of the file within the index
+
+    Returns
+    -------
+    dict
+        Chromosome position to the (first, last) positions of the span
+    """
+    if 'spans' not in grp or file_pos >= grp['spans'].shape[1]:
+        return {}
+
+    spans = grp['spans'][:, file_pos, :]
+    return dict(
+        (chrom_pos, (int(spans[chrom_pos, 0]), int(spans[chrom_pos, 1])))
+        for chrom_pos in np.flatnonzero(spans[:, 1] > spans[:, 0]))
+
+
+def write_span(grp, chrom_pos, file_pos, first, last):
+    """
+    Records the span of the presence index that has been written for a file
+    on a chromosome in the ``spans`` dataset (chromosomes x files x 2) of the
+    assembly.
+
+    Parameters
+    ----------
+    grp : h5py.Group
+        Assembly group within the HDF5 index file
+    chrom_pos : int
+        Position of the chromosome within the index
+    file_pos : int
+        Position of the file within the index
+    first : int
+        First position of the span
+    last : int
+        Position after the end of the span
+    """
+    max_files = 1024
+    max_chromosomes = 1024
+
+    if 'spans' not in grp:
+        grp.create_dataset(
+            'spans', (0, 0, 2), maxshape=(max_chromosomes, max_files, 2), dtype='i8',
+            chunks=True)
+
+    sset = grp['spans']
+    if sset.shape[0] <= chrom_pos or sset.shape[1] <= file_pos:
+        sset.resize((max(sset.shape[0], chrom_pos + 1), max(sset.shape[1], file_pos + 1), 2))
+    sset[chrom_pos, file_pos, :] = (first, last)
+
+
+def merge_intervals(starts, ends):
+    """
+    Merges intervals that touch or overlap into blocks of coverage.
+
+    Parameters
+    ----------
+    starts : numpy.ndarray
+        Start of each interval, sorted
+    ends : numpy.ndarray
+        End of each interval (exclusive)
+
+    Returns
+    -------
+    tuple
+        starts : numpy.ndarray
+            Start of each block
+        ends : numpy.ndarray
+            End of each block
+    """
+    if len(starts) == 0:
+        return (starts, ends)
+
+    ends = np.maximum.accumulate(ends)
+    breaks = np.flatnonzero(starts[1:] > ends[:-1]) + 1
+    first = np.concatenate(([0], breaks))
+    last = np.concatenate((breaks - 1, [len(ends) - 1]))
+
+    return (starts[first], ends[last])
+
+
+def intervals_to_mask(starts, ends):
+    """
+    Generates the presence mask for a set of intervals covering only the span
+    from the first start to the last end, so that only that part of the
+    index needs to be written. The span from the previous load of a file,
+    from :func:`read_spans`, needs to be cleared first.
+
+    Parameters
+    ----------
+    starts : numpy.ndarray
+        Start of each interval, sorted
+    ends : numpy.ndarray
+        End of each interval (exclusive)
+
+    Returns
+    -------
+    tuple
+        offset : int
+            Position of the first element of the mask
+        mask : numpy.ndarray
+            Boolean mask from the offset to the end of the last interval
+    """
+    block_starts, block_ends = merge_intervals(starts, ends)
+    if len(block_starts) == 0:
+        return (0, np.zeros([0], dtype='bool'))
+
+    offset = int(block_starts[0])
+    length = int(block_ends[-1]) - offset
+
+    delta = np.zeros([length + 1], dtype='int8')
+    delta[block_starts - offset] = 1
+    delta[block_ends - offset] = -1
+
+    return (offset, np.cumsum(delta[:-1], dtype='int8').astype('bool'))
+
+
+def extend_mask(offset, mask, first, last):
+    """
+    Extends a presence mask from :func:`intervals_to_mask` with False values
+    so that it also covers the span from the previous load of a file. The
+    old span is then cleared by the same write as the new mask, so each
+    chunk of the index is only rewritten once.
+
+    Parameters
+    ----------
+    offset : int
+        Position of the first element of the mask
+    mask : numpy.ndarray
+        Boolean mask
+    first : int
+        First position of the previous span
+    last : int
+        Position after the end of the previous span
+
+    Returns
+    -------
+    tuple
+        offset : int
+            Position of the first element of the extended mask
+        mask : numpy.ndarray
+            Boolean mask covering both spans
+    """
+    if last <= first:
+        return (offset, mask)
+    if len(mask) == 0:
+        return (first, np.zeros([last - first], dtype='bool'))
+
+    start = min(offset, first)
+    extended = np.zeros([max(offset + len(mask), last) - start], dtype='bool')
+    extended[offset - start:offset - start + len(mask)] = mask
+    return (start, extended)
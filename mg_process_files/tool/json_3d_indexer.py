@@ -18,13 +18,8 @@
 from __future__ import print_function
 
 import sys
-import subprocess
-import shlex
 import json
 
-from os import listdir
-from os.path import isdir
-
 import numpy as np
 import h5py
 
@@ -33,23 +28,171 @@ from utils import logger
 try:
     if hasattr(sys, '_run_from_cmdl') is True:
         raise ImportError
-    from pycompss.api.parameter import FILE_IN, FILE_OUT
+    from pycompss.api.parameter import FILE_IN, FILE_INOUT, IN
     from pycompss.api.task import task
     from pycompss.api.api import compss_wait_on
 except ImportError:
     logger.warn("[Warning] Cannot import \"pycompss\" API packages.")
     logger.warn("          Using mock decorators.")
 
-    from utils.dummy_pycompss import FILE_IN, FILE_OUT  # pylint: disable=ungrouped-imports
+    from utils.dummy_pycompss import FILE_IN, FILE_INOUT, IN  # pylint: disable=ungrouped-imports
     from utils.dummy_pycompss import task  # pylint: disable=ungrouped-imports
     from utils.dummy_pycompss import compss_wait_on  # pylint: disable=ungrouped-imports
 
 from basic_modules.metadata import Metadata
 from basic_modules.tool import Tool
 
+from mg_process_files.tool.index_utils import bisect_left
+from mg_process_files.tool.json_3d_reader import overlapping_regions
+from mg_process_files.tool.tadbit_json import (
+    archive_files, decode_coords, decode_regions, encode_coords, scan_region)
+
 # ------------------------------------------------------------------------------
 
 
+def _create_dataset(grp, name, data):
+    """
+    Creates a compressed dataset, leaving empty datasets uncompressed as they
+    cannot be chunked.
+
+    Parameters
+    ----------
+    grp : h5py.Group
+        Group to create the dataset in
+    name : str
+        Name of the dataset
+    data : numpy.ndarray
+        Values of the dataset
+
+    Returns
+    -------
+    h5py.Dataset
+    """
+    if len(data) == 0:
+        return grp.create_dataset(name, data=data)
+    return grp.create_dataset(name, data=data, chunks=True, compression="gzip")
+
+
+def _coords_dataset(grp, name, n_beads, encoding, scale_factor):
+    """
+    Returns a flat (rows x 3) coordinate dataset, creating it if it is not
+    already present. The chunks are sized to a whole number of models.
+
+    Parameters
+    ----------
+    grp : h5py.Group
+        Resolution group
+    name : str
+        Path of the dataset within the group
+    n_beads : int
+        Number of beads in each model of the first region
+    encoding : str
+        "float32" or "fixed"
+    scale_factor : int
+        Scale factor for the fixed point encoding
+
+    Returns
+    -------
+    h5py.Dataset
+    """
+    if name in grp:
+        return grp[name]
+
+    dset = grp.create_dataset(
+        name, (0, 3), maxshape=(None, 3),
+        dtype='f4' if encoding == 'float32' else 'i4',
+        chunks=(n_beads * max(1, 16384 // n_beads), 3),
+        compression="gzip", shuffle=True)
+    dset.attrs['encoding'] = encoding
+    dset.attrs['scale_factor'] = scale_factor
+    return dset
+
+
+def _append_coords(dset, coords):
+    """
+    Appends the models of a region to a flat coordinate dataset, one model
+    after another.
+
+    Parameters
+    ----------
+    dset : h5py.Dataset
+        Flat (rows x 3) coordinate dataset
+    coords : numpy.ndarray
+        (beads x models x 3) array of the coordinates
+
+    Returns
+    -------
+    int
+        First row of the region
+    """
+    current_size = len(dset)
+    n_rows = coords.shape[0] * coords.shape[1]
+
+    dset.resize((current_size + n_rows, 3))
+    dset[current_size:current_size + n_rows, :] = encode_coords(
+        coords.transpose(1, 0, 2).reshape(-1, 3),
+        dset.attrs['encoding'], dset.attrs['scale_factor'])
+
+    return current_size
+
+
+def _coords_datasets(grp):
+    """
+    Lists the flat coordinate datasets of a resolution group.
+
+    Parameters
+    ----------
+    grp : h5py.Group
+        Resolution group
+
+    Returns
+    -------
+    dict
+        Path of the dataset within the group to h5py.Dataset
+    """
+    dsets = {}
+    for name in ('models', 'aligned'):
+        if name in grp:
+            dsets[name] = grp[name]
+    for lod_name in ('lod', 'lod_centroids'):
+        if lod_name in grp:
+            for factor in grp[lod_name]:
+                dsets[lod_name + '/' + factor] = grp[lod_name][factor]
+    return dsets
+
+
+def _rollback_region(grp):
+    """
+    Removes anything left from a region that was not completely written. The
+    uuid of a region and the number of rows in each of the coordinate
+    datasets are stored as the ``pending_uuid`` and ``pending_rows``
+    attributes of the resolution group before the region is written, and
+    removed once it is complete. If they are still present the coordinate
+    datasets are cut back to the recorded number of rows, so no orphaned
+    models are left behind, and the metadata of the region is deleted.
+
+    Parameters
+    ----------
+    grp : h5py.Group
+        Resolution group
+    """
+    if 'pending_uuid' not in grp.attrs:
+        return
+
+    uuid = grp.attrs['pending_uuid']
+    rows = json.loads(grp.attrs['pending_rows'])
+    for name, dset in _coords_datasets(grp).items():
+        dset.resize((rows.get(name, 0), 3))
+
+    meta = grp['meta']
+    for meta_name in meta:
+        if uuid in meta[meta_name]:
+            del meta[meta_name][uuid]
+
+    del grp.attrs['pending_uuid']
+    del grp.attrs['pending_rows']
+
+
 class json3dIndexerTool(Tool):
     """
     Tool for running indexers over 3D JSON files for use in the RESTful API
@@ -67,190 +210,648 @@ class json3dIndexerTool(Tool):
 
         self.configuration.update(configuration)
 
-    def unzipJSON(self, file_targz):  # pylint: disable=no-self-use
+    @staticmethod
+    def _region2hdf5(  # pylint: disable=too-many-locals,too-many-statements
+            hdf5_in, region, encoding="float32", scale_factor=1000):
+        """
+        Writes the models for a single region to the HDF5 file.
+
+        The coordinates for each resolution are stored in a flat (rows x 3)
+        ``models`` dataset. The models of a region are stored one after
+        another, each as a block of rows for its beads, so regions only take
+        up the space for the models that they have. The first row (``i``),
+        the row after the last (``j``) and the number of ``models`` and
+        ``beads`` are stored as attributes of the ``meta/model_params/<uuid>``
+        dataset, so model k of a region starts at row ``i + k * beads``.
+
+        The Hi-C contacts for the region are stored as a sparse COO table in
+        ``meta/hic_data/<uuid>`` (``row``, ``col``, ``value`` and the
+        ``row_offsets`` of the first contact in each row), the TADs in
+        ``meta/tads/<uuid>`` and the restraints in ``meta/restraints/<uuid>``
+        as structured arrays.
+
+        The coordinates are stored as float32, or as int32 fixed point values
+        with the ``scale_factor`` recorded as an attribute, and compressed
+        with the shuffle filter. The chunks are sized to a whole number of
+        models of the first region so that reading a model touches as few
+        chunks as possible. The encoding of an existing resolution is kept
+        when more regions are added.
+
+        The ``meta/model_params/<uuid>`` dataset is written last, and the
+        pending attributes are then removed from the resolution group, so a
+        region is only treated as indexed once it has been completely written.
+        Regions that are already indexed are skipped. Anything left from a
+        region that was only partly written, including the rows appended to
+        the coordinate datasets, is removed by :func:`_rollback_region`
+        before the next region is written.
+
+        Downsampled copies of the models are stored in the same way in the
+        ``lod/<factor>`` datasets, and the centroid models at full resolution
+        and each of the downsampled levels in ``lod_centroids/<factor>``. The
+        first row of the region in each of these is stored in the
+        ``lod_i_<factor>`` and ``centroids_i_<factor>`` attributes, with the
+        factors that are available in ``lod_factors``. A model downsampled by
+        a factor f has ceil(beads / f) beads.
+
+        When the models have been superimposed onto the cluster centroids the
+        aligned coordinates are stored in the same way in the ``aligned``
+        dataset, starting at the row in the ``aligned_i`` attribute, and the
+        (models x centroids) RMSD matrix in ``meta/rmsd/<uuid>``.
+
+        The ensemble mean distance and contact frequency maps are symmetric,
+        so only the upper triangle above the diagonal is stored, as float32 in
+        ``meta/distances/<uuid>`` and ``meta/contacts/<uuid>``. The number of
+        beads and the contact threshold are stored as attributes.
+
+        Parameters
+        ----------
+        hdf5_in : h5py.File
+            Open handle to the HDF5 index file
+        region : dict
+            Region as generated by
+            :func:`mg_process_files.tool.tadbit_json.decode_region`
+        encoding : str
+            Encoding of the coordinates for a new resolution, "float32" or
+            "fixed"
+        scale_factor : int
+            Scale factor for the fixed point encoding
+
+        Returns
+        -------
+        tuple
+            resolution, chromosome, start, end, first row and uuid of the
+            region for the region index, or None if the uuid is already in the
+            index at that resolution
+        """
+        metadata = region['metadata']
+        objectdata = region['object']
+        clusters = region['clusters']
+
+        resolution = objectdata['resolution']
+
+        uuid = objectdata['uuid']
+
+        if str(resolution) in hdf5_in:
+            grp = hdf5_in[str(resolution)]
+            dset = grp['models']
+
+            meta = grp['meta']
+            mpgrp = meta['model_params']
+            clustersgrp = meta['clusters']
+            centroidsgrp = meta['centroids']
+
+            _rollback_region(grp)
+
+            if str(uuid) in mpgrp:
+                logger.warn("Region {} is already indexed at {}, skipping".format(uuid, resolution))
+                return None
+        else:
+            # Create the initial dataset with minimum values
+            grp = hdf5_in.create_group(str(resolution))
+            meta = grp.create_group('meta')
+
+            mpgrp = meta.create_group('model_params')
+            clustersgrp = meta.create_group('clusters')
+            centroidsgrp = meta.create_group('centroids')
+
+            dset = _coords_dataset(
+                grp, 'models', region['coords'].shape[0], encoding, scale_factor)
+
+            dset.attrs['title'] = objectdata['title']
+            dset.attrs['experimentType'] = objectdata['experimentType']
+            dset.attrs['species'] = objectdata['species']
+            dset.attrs['project'] = objectdata['project']
+            dset.attrs['identifier'] = objectdata['identifier']
+            dset.attrs['assembly'] = objectdata['assembly']
+            dset.attrs['cellType'] = objectdata['cellType']
+            dset.attrs['resolution'] = objectdata['resolution']
+            dset.attrs['datatype'] = objectdata['datatype']
+            dset.attrs['components'] = objectdata['components']
+            dset.attrs['source'] = objectdata['source']
+            dset.attrs['TADbit_meta'] = json.dumps(metadata)
+            dset.attrs['dependencies'] = json.dumps(objectdata['dependencies'])
+
+        grp.attrs['pending_uuid'] = str(uuid)
+        grp.attrs['pending_rows'] = json.dumps(dict(
+            (name, len(coords_ds)) for name, coords_ds in _coords_datasets(grp).items()))
+
+        clustergrps = clustersgrp.create_group(str(uuid))
+        cluster_size = len(clusters)
+        for cluster_id in range(cluster_size):
+            clustergrps.create_dataset(
+                str(cluster_id), data=clusters[cluster_id],
+                chunks=True, compression="gzip")
+
+        centroidsgrp.create_dataset(
+            str(uuid), data=region['centroids'],
+            chunks=True, compression="gzip")
+
+        _create_dataset(meta.require_group('restraints'), str(uuid), region['restraints'])
+
+        if 'hic_data' in region:
+            hic_data = region['hic_data']
+            _create_dataset(meta.require_group('tads'), str(uuid), hic_data['tads'])
+
+            hicgrp = meta.require_group('hic_data').create_group(str(uuid))
+            hicgrp.attrs['n'] = hic_data['n']
+            for column in ('row', 'col', 'value', 'row_offsets'):
+                _create_dataset(hicgrp, column, hic_data[column])
+
+        coords = region['coords']
+        model_param = region['model_params']
+        n_beads, n_models = coords.shape[0:2]
+
+        current_size = _append_coords(dset, coords)
+        model_attrs = {}
+
+        lod = dict(region['lod'])
+        lod[1] = coords
+        for factor, lod_coords in sorted(lod.items()):
+            if factor != 1:
+                model_attrs['lod_i_' + str(factor)] = _append_coords(
+                    _coords_dataset(
+                        grp, 'lod/' + str(factor), lod_coords.shape[0],
+                        dset.attrs['encoding'], dset.attrs['scale_factor']),
+                    lod_coords)
+            model_attrs['centroids_i_' + str(factor)] = _append_coords(
+                _coords_dataset(
+                    grp, 'lod_centroids/' + str(factor), lod_coords.shape[0],
+                    dset.attrs['encoding'], dset.attrs['scale_factor']),
+                lod_coords[:, region['centroid_ids'], :])
+        model_attrs['lod_factors'] = sorted(lod.keys())
+
+        if 'aligned' in region:
+            model_attrs['aligned_i'] = _append_coords(
+                _coords_dataset(
+                    grp, 'aligned', n_beads, dset.attrs['encoding'], dset.attrs['scale_factor']),
+                region['aligned'])
+            _create_dataset(meta.require_group('rmsd'), str(uuid), region['rmsd'])
+
+        if 'distances' in region:
+            for name in ('distances', 'contacts'):
+                map_ds = _create_dataset(
+                    meta.require_group(name), str(uuid), region[name].astype('f4'))
+                map_ds.attrs['beads'] = n_beads
+                map_ds.attrs['threshold'] = region['contact_threshold']
+
+        # The model parameters are written last to mark the region as complete
+        model_param_ds = mpgrp.create_dataset(
+            str(uuid), data=model_param, chunks=True, compression="gzip")
+        for name, value in model_attrs.items():
+            model_param_ds.attrs[name] = value
+        model_param_ds.attrs['i'] = current_size
+        model_param_ds.attrs['j'] = current_size + n_beads * n_models
+        model_param_ds.attrs['models'] = n_models
+        model_param_ds.attrs['beads'] = n_beads
+        model_param_ds.attrs['chromosome'] = objectdata['chrom'][0]
+        model_param_ds.attrs['start'] = int(objectdata['chromStart'][0])
+        model_param_ds.attrs['end'] = int(objectdata['chromEnd'][0])
+
+        del grp.attrs['pending_uuid']
+        del grp.attrs['pending_rows']
+
+        return (
+            str(resolution), objectdata['chrom'][0], int(objectdata['chromStart'][0]),
+            int(objectdata['chromEnd'][0]), current_size, str(uuid))
+
+    def _update_region_index(self, grp, rows):
         """
-        Unzips the zipped folder containing all the models for regions of the
-        genome based on the information within the adjacency matrixes generated
-        by TADbit.
+        Merges regions into the region index for a resolution.
+
+        Each chromosome has a group within the ``regions`` group of the
+        resolution with column datasets for the ``start``, ``end``, first row
+        of the models (``offset``) and ``uuid`` of each region, sorted by start
+        and end. ``max_end`` holds the largest end up to and including each
+        row, so that it is also sorted and the regions overlapping a location
+        can be found by binary searching both columns.
+
+        The index is updated in place. Only the rows from the first new start
+        onwards are read, merged with the new regions and written back, so
+        adding regions after the existing ones only touches the end of the
+        index.
 
         Parameters
         ----------
-        archive_location : str
-            Location of archived JSON files
+        grp : h5py.Group
+            Resolution group within the HDF5 file
+        rows : list
+            List of (chromosome, start, end, offset, uuid) tuples
+        """
+        rgrp = grp.require_group('regions')
+
+        chrom_rows = {}
+        for chrom, start, end, offset, uuid in rows:
+            chrom_rows.setdefault(chrom, []).append((start, end, offset, uuid))
+
+        for chrom, new_rows in chrom_rows.items():
+            starts, ends, offsets, uuids = zip(*new_rows)
+            table = {
+                'start': np.array(starts, dtype='i8'),
+                'end': np.array(ends, dtype='i8'),
+                'offset': np.array(offsets, dtype='i8'),
+                'uuid': np.array(uuids, dtype='S')
+            }
+
+            first = 0
+            if chrom in rgrp:
+                first = self._merge_region_rows(rgrp, chrom, table)
+
+            order = np.lexsort((table['end'], table['start']))
+            for column in table:
+                table[column] = table[column][order]
+            table['max_end'] = np.maximum.accumulate(table['end'])
+
+            if chrom in rgrp:
+                cgrp = rgrp[chrom]
+                if first > 0:
+                    table['max_end'] = np.maximum(table['max_end'], cgrp['max_end'][first - 1])
+                for column in ('start', 'end', 'max_end', 'offset', 'uuid'):
+                    cgrp[column].resize((first + len(table[column]),))
+                    cgrp[column][first:] = table[column]
+            else:
+                cgrp = rgrp.create_group(chrom)
+                for column in ('start', 'end', 'max_end', 'offset', 'uuid'):
+                    cgrp.create_dataset(
+                        column, data=table[column], chunks=True, compression="gzip",
+                        maxshape=(None,))
+
+    @staticmethod
+    def _merge_region_rows(rgrp, chrom, table):
+        """
+        Adds the existing rows of the region index for a chromosome that the
+        new regions have to be merged with to the new columns. If the uuid
+        column is too narrow for the new uuids all of the rows are taken and
+        the chromosome group is removed to be written again.
+
+        Parameters
+        ----------
+        rgrp : h5py.Group
+            Region index group of the resolution
+        chrom : str
+            Chromosome with existing rows in the region index
+        table : dict
+            Columns of the new regions, updated in place
 
         Returns
         -------
-        json_file_locations : list
-            List of the locations of the files within an extracted archive
+        int
+            Row of the region index from which the rows are rewritten
+        """
+        cgrp = rgrp[chrom]
+        if cgrp['uuid'].dtype.itemsize < table['uuid'].dtype.itemsize:
+            # The uuid column is too narrow so the index is rewritten
+            for column in ('start', 'end', 'offset', 'uuid'):
+                table[column] = np.concatenate((
+                    cgrp[column][:].astype(table[column].dtype), table[column]))
+            del rgrp[chrom]
+            return 0
+
+        # Only the rows from the first new start onwards move
+        first = bisect_left(cgrp['start'], table['start'].min())
+        for column in ('start', 'end', 'offset', 'uuid'):
+            table[column] = np.concatenate((
+                cgrp[column][first:], table[column].astype(cgrp[column].dtype)))
+        return first
+
+    @staticmethod
+    def _unindexed_regions(grp):
+        """
+        Finds the regions that have been completely written but are missing
+        from the region index, as is the case when a load stops part way
+        through before the region index is updated. The number of rows in the
+        region index is compared with the number of regions first, so the
+        uuids are only read when something is missing.
+
+        Parameters
+        ----------
+        grp : h5py.Group
+            Resolution group within the HDF5 file
+
+        Returns
+        -------
+        list
+            List of (chromosome, start, end, offset, uuid) tuples
+        """
+        mpgrp = grp['meta']['model_params']
+        pending = grp.attrs.get('pending_uuid')
+        n_regions = len(mpgrp)
+        if pending is not None and pending in mpgrp:
+            n_regions -= 1
+
+        rgrp = grp.require_group('regions')
+        if sum(len(rgrp[chrom]['uuid']) for chrom in rgrp) == n_regions:
+            return []
+
+        indexed = set()
+        for chrom in rgrp:
+            indexed.update(uuid.decode('utf-8') for uuid in rgrp[chrom]['uuid'][:])
+
+        rows = []
+        for uuid in mpgrp:
+            if uuid != pending and uuid not in indexed:
+                attrs = mpgrp[uuid].attrs
+                rows.append((
+                    attrs['chromosome'], int(attrs['start']), int(attrs['end']),
+                    int(attrs['i']), uuid))
+        return rows
+
+    @staticmethod
+    def _is_indexed(hdf5_in, resolution, uuid):
+        """
+        Checks if a region has been completely written to the index
+        """
+        if str(resolution) not in hdf5_in:
+            return False
+        grp = hdf5_in[str(resolution)]
+        return (
+            str(uuid) in grp['meta']['model_params'] and
+            grp.attrs.get('pending_uuid') != str(uuid))
+
+    @staticmethod
+    def catalog(json_file_gz):
+        """
+        Archive catalog
+
+        Lists the regions in an archive of TADbit JSON files without indexing
+        them. Only the ``metadata`` and ``object`` sections of each file are
+        decoded, with the models counted but not parsed, by
+        :func:`mg_process_files.tool.tadbit_json.scan_region`.
+
+        Parameters
+        ----------
+        json_file_gz : str
+            Location of the tar.gz archive of the JSON 3D model files
+
+        Returns
+        -------
+        list
+            List of dicts with the name of the file in the archive and the
+            uuid, resolution, chromosome, start, end, number of models and
+            number of beads of each region, in the order of the archive
 
         Example
         -------
         .. code-block:: python
            :linenos:
 
-           gz_file = '/home/<user>/test.tar.gz'
-           json_files = unzip(gz_file)
-
+           for region in json3dIndexerTool.catalog(gz_file):
+               print(region["uuid"], region["resolution"], region["models"])
+        """
+        regions = []
+        for name, f_member in archive_files(json_file_gz):
+            summary = scan_region(f_member)
+            objectdata = summary['object']
+            regions.append({
+                "name": name,
+                "uuid": str(objectdata['uuid']),
+                "resolution": objectdata['resolution'],
+                "chrom": objectdata['chrom'][0],
+                "start": int(objectdata['chromStart'][0]),
+                "end": int(objectdata['chromEnd'][0]),
+                "models": summary['models'],
+                "beads": summary['beads']
+            })
+        return regions
+
+    @staticmethod
+    def get_regions(file_hdf5, resolution, chrom, start, end):
         """
-        targz_file_dir = file_targz.split("/")
-        root_dir = '/'.join(targz_file_dir[0:len(targz_file_dir) - 1])
+        Region lookup
 
-        command_line = 'tar -xzf ' + file_targz + ' -C ' + root_dir
-        args = shlex.split(command_line)
-        process = subprocess.Popen(args)
-        process.wait()
+        Finds the regions at a resolution that overlap a location. The region
+        index for the chromosome is binary searched on disk so only the rows
+        around the location are read.
 
-        onlyfiles = []
-        for i in listdir(root_dir):
-            if isdir('/'.join([root_dir, i])):
-                for j in listdir('/'.join([root_dir, i])):
-                    onlyfiles.append('/'.join([root_dir, i, j]))
+        Parameters
+        ----------
+        file_hdf5 : str
+            Location of the HDF5 index file
+        resolution : int
+            Resolution of the models
+        chrom : str
+            Chromosome name
+        start : int
+            Start of the location
+        end : int
+            End of the location
 
-        return onlyfiles
+        Returns
+        -------
+        list
+            List of dicts with the uuid, start, end and first row of the
+            models (offset) of each region, ordered by start
 
-    @task(returns=bool, json_file_gz=FILE_IN, hdf5_file=FILE_OUT)
-    def json2hdf5(self, json_file_gz, hdf5_file):  # pylint: disable=too-many-locals,too-many-statements
+        Example
+        -------
+        .. code-block:: python
+           :linenos:
+
+           regions = json3dIndexerTool.get_regions(
+               hdf5_file, 10000, "chr2R", 20400000, 20500000)
         """
-        Genome Model Indexing
+        with h5py.File(file_hdf5, "r") as hdf5_in:
+            return overlapping_regions(hdf5_in[str(resolution)], chrom, start, end)
 
-        Load the JSON files generated by TADbit into a specified HDF5 file. The
-        file includes the x, y and z coordinates of all the models for each
-        region along with the matching stats, clusters, TADs and adjacency
-        values used during the modelling.
+    @staticmethod
+    def get_contacts(  # pylint: disable=too-many-arguments
+            file_hdf5, resolution, uuid, first_bin, last_bin):
+        """
+        Hi-C contact retrieval
+
+        Reads the Hi-C contacts for a region where both the row and column are
+        within a window of bins. Only the rows of the window are read from
+        the sparse table.
 
         Parameters
         ----------
-        json_files : list
-            Locations of all the JSON 3D model files generated by TADbit for a
-            given dataset
         file_hdf5 : str
-            Location of the HDF5 index file for this dataset.
+            Location of the HDF5 index file
+        resolution : int
+            Resolution of the models
+        uuid : str
+            uuid of the region
+        first_bin : int
+            First bin of the window
+        last_bin : int
+            Bin after the end of the window
+
+        Returns
+        -------
+        tuple
+            rows : numpy.ndarray
+            cols : numpy.ndarray
+            values : numpy.ndarray
 
         Example
         -------
         .. code-block:: python
            :linenos:
 
-           if not self.json2hdf5(json_files, assembly, wig_file, hdf5_file):
-               output_metadata.set_exception(
-                   Exception(
-                       "wig2hdf5: Could not process files {}, {}.".format(*input_files)))
+           rows, cols, values = json3dIndexerTool.get_contacts(
+               hdf5_file, 10000, uuid, 10, 20)
+        """
+        with h5py.File(file_hdf5, "r") as hdf5_in:
+            hicgrp = hdf5_in[str(resolution)]['meta']['hic_data'][str(uuid)]
 
+            first_bin = min(max(int(first_bin), 0), int(hicgrp.attrs['n']))
+            last_bin = min(max(int(last_bin), first_bin), int(hicgrp.attrs['n']))
+            first = int(hicgrp['row_offsets'][first_bin])
+            last = int(hicgrp['row_offsets'][last_bin])
 
-        """
+            rows = hicgrp['row'][first:last]
+            cols = hicgrp['col'][first:last]
+            values = hicgrp['value'][first:last]
 
-        json_files = self.unzipJSON(json_file_gz)
+        in_window = (cols >= first_bin) & (cols < last_bin)
+        return (rows[in_window], cols[in_window], values[in_window])
 
-        for json_file in json_files:
-            models = json.loads(open(json_file).read())
+    @staticmethod
+    def get_model(file_hdf5, resolution, uuid, model_id):
+        """
+        Model retrieval
 
-            metadata = models['metadata']
-            objectdata = models['object']
-            clusters = models['clusters']
+        Reads the coordinates of a single model of a region.
 
-            resolution = objectdata['resolution']
+        Parameters
+        ----------
+        file_hdf5 : str
+            Location of the HDF5 index file
+        resolution : int
+            Resolution of the models
+        uuid : str
+            uuid of the region
+        model_id : int
+            Position of the model within the region
 
-            uuid = objectdata['uuid']
+        Returns
+        -------
+        numpy.ndarray
+            (beads x 3) float32 array of the bead coordinates
 
-            # Edit the HDF5 file
-            hdf5_in = h5py.File(hdf5_file, "a")
+        Example
+        -------
+        .. code-block:: python
+           :linenos:
 
-            if str(resolution) in hdf5_in:
-                grp = hdf5_in[str(resolution)]
-                dset = grp['data']
+           coords = json3dIndexerTool.get_model(hdf5_file, 10000, uuid, 0)
+        """
+        with h5py.File(file_hdf5, "r") as hdf5_in:
+            grp = hdf5_in[str(resolution)]
+            attrs = grp['meta']['model_params'][str(uuid)].attrs
+
+            if model_id < 0 or model_id >= attrs['models']:
+                raise IndexError(
+                    "Model {} is not in region {}".format(model_id, uuid))
+
+            first = int(attrs['i']) + int(model_id) * int(attrs['beads'])
+            dset = grp['models']
+            return decode_coords(dset[first:first + int(attrs['beads']), :], dset.attrs)
+
+    @task(returns=bool, json_file_gz=FILE_IN, hdf5_file=FILE_INOUT, processes=IN,
+          encoding=IN, scale_factor=IN, lod_factors=IN, align_models=IN, contact_threshold=IN)
+    def json2hdf5(  # pylint: disable=too-many-arguments
+            self, json_file_gz, hdf5_file, processes=1, encoding="float32", scale_factor=1000,
+            lod_factors=None, align_models=False, contact_threshold=None):
+        """
+        Genome Model Indexing
 
-                meta = grp['meta']
-                mpgrp = meta['model_params']
-                clustersgrp = meta['clusters']
-                centroidsgrp = meta['centroids']
-            else:
-                # Create the initial dataset with minimum values
-                grp = hdf5_in.create_group(str(resolution))
-                meta = grp.create_group('meta')
-
-                mpgrp = meta.create_group('model_params')
-                clustersgrp = meta.create_group('clusters')
-                centroidsgrp = meta.create_group('centroids')
-
-                dset = grp.create_dataset(
-                    'data', (1, 1000, 3), maxshape=(None, 1000, 3), dtype='int32',
-                    chunks=True, compression="gzip")
-
-                dset.attrs['title'] = objectdata['title']
-                dset.attrs['experimentType'] = objectdata['experimentType']
-                dset.attrs['species'] = objectdata['species']
-                dset.attrs['project'] = objectdata['project']
-                dset.attrs['identifier'] = objectdata['identifier']
-                dset.attrs['assembly'] = objectdata['assembly']
-                dset.attrs['cellType'] = objectdata['cellType']
-                dset.attrs['resolution'] = objectdata['resolution']
-                dset.attrs['datatype'] = objectdata['datatype']
-                dset.attrs['components'] = objectdata['components']
-                dset.attrs['source'] = objectdata['source']
-                dset.attrs['TADbit_meta'] = json.dumps(metadata)
-                dset.attrs['dependencies'] = json.dumps(objectdata['dependencies'])
-                dset.attrs['restraints'] = json.dumps(models['restraints'])
-                if 'hic_data' in models:
-                    dset.attrs['hic_data'] = json.dumps(models['hic_data'])
-
-            clustergrps = clustersgrp.create_group(str(uuid))
-            cluster_size = len(clusters)
-            for cluster_id in range(cluster_size):
-                clustergrps.create_dataset(
-                    str(cluster_id), data=clusters[cluster_id],
-                    chunks=True, compression="gzip")
-
-            centroidsgrp.create_dataset(
-                str(uuid), data=models['centroids'],
-                chunks=True, compression="gzip")
+        Load the JSON files generated by TADbit into a specified HDF5 file. The
+        file includes the x, y and z coordinates of all the models for each
+        region along with the matching stats, clusters, TADs and adjacency
+        values used during the modelling.
+
+        The JSON files are streamed straight out of the tar.gz archive by
+        :func:`mg_process_files.tool.tadbit_json.archive_files`, so nothing
+        gets extracted to disk. Each file is decoded incrementally by
+        :func:`mg_process_files.tool.tadbit_json.stream_region`, with the
+        models copied one at a time into a single block of coordinates, so the
+        whole JSON object tree is never held in memory. With more than one
+        process the files are decoded and converted to numpy arrays in a
+        process pool by :func:`mg_process_files.tool.tadbit_json.decode_regions`
+        while the regions are written, in the order of the archive, through a
+        single open handle to the HDF5 file.
+
+        Once all the regions are loaded the region index for each resolution
+        is updated so that the regions overlapping a location can be found
+        with :meth:`get_regions`.
+
+        Archives can be added to an existing index. The archive is first
+        listed with :meth:`catalog` so that only the regions that are not
+        already in the index are decoded and appended, which makes loading
+        the same archive again a no-op. If a previous load stopped part way
+        through, the regions that it had completely written are added to the
+        region index.
 
-            current_size = len(dset)
-            if current_size == 1:
-                current_size = 0
-            dset.resize((current_size + int(len(models['models'][0]['data']) / 3), 1000, 3))
+        Parameters
+        ----------
+        json_file_gz : str
+            Location of the tar.gz archive of the JSON 3D model files generated
+            by TADbit for a given dataset
+        file_hdf5 : str
+            Location of the HDF5 index file for this dataset.
+        processes : int
+            Number of processes to decode the JSON files with
+        encoding : str
+            Encoding of the coordinates, "float32" or "fixed" for int32 fixed
+            point values
+        scale_factor : int
+            Scale factor for the fixed point encoding, eg 1000 to keep 3
+            decimal places
+        lod_factors : list
+            Factors to store downsampled models for, averaging that many beads
+            into one. Defaults to 2, 4 and 8
+        align_models : bool
+            Superimpose the models onto their cluster centroids and store the
+            aligned coordinates and the RMSD matrix. This stores a second copy
+            of the coordinates, so it is off by default
+        contact_threshold : float
+            Distance below which beads are counted as in contact for the
+            ensemble contact frequency map, in the units of the model
+            coordinates, eg 200.0. The distance and contact maps are only
+            computed and stored when this is set
 
-            dnp = np.zeros([int(len(models['models'][0]['data']) / 3), 1000, 3], dtype='int32')
+        Example
+        -------
+        .. code-block:: python
+           :linenos:
 
-            model_param = []
+           if not self.json2hdf5(json_files, assembly, wig_file, hdf5_file):
+               output_metadata.set_exception(
+                   Exception(
+                       "wig2hdf5: Could not process files {}, {}.".format(*input_files)))
 
-            model_id = 0
-            for model in models['models']:
-                ref = model['ref']
-                model_data = model['data']
 
-                cid = [ind for ind in range(len(clusters)) if ref in clusters[ind]]
-                cid_size = len(cid)
-                if cid_size == 0:
-                    cluster_id = len(clusters)
-                else:
-                    cluster_id = cid[0]
+        """
 
-                model_param.append([int(ref), int(cluster_id)])
+        hdf5_in = h5py.File(hdf5_file, "a")
 
-                j = 0
-                for i in range(0, len(model_data), 3):
-                    xyz = model_data[i:i + 3]
-                    dnp[j][model_id] = xyz
-                    j += 1
+        if lod_factors is None:
+            lod_factors = [2, 4, 8]
 
-                model_id += 1
+        names = None
+        if len(hdf5_in) > 0:
+            names = set(
+                region["name"] for region in self.catalog(json_file_gz)
+                if not self._is_indexed(hdf5_in, region["resolution"], region["uuid"]))
 
-            model_param_ds = mpgrp.create_dataset(
-                str(uuid), data=model_param, chunks=True, compression="gzip")
+        # Regions written by a load that stopped before the region index was
+        # updated are added to the index along with the new regions
+        region_rows = {}
+        for resolution in hdf5_in:
+            rows = self._unindexed_regions(hdf5_in[resolution])
+            if rows:
+                region_rows[resolution] = rows
 
-            model_param_ds.attrs['i'] = current_size
-            model_param_ds.attrs['j'] = current_size + (len(models['models'][0]['data']) / 3)
-            model_param_ds.attrs['chromosome'] = objectdata['chrom'][0]
-            model_param_ds.attrs['start'] = int(objectdata['chromStart'][0])
-            model_param_ds.attrs['end'] = int(objectdata['chromEnd'][0])
+        for region in decode_regions(
+                json_file_gz, processes, lod_factors, align_models, contact_threshold, names):
+            row = self._region2hdf5(hdf5_in, region, encoding, scale_factor)
+            if row is not None:
+                region_rows.setdefault(row[0], []).append(row[1:])
 
-            dset[
-                current_size:current_size + int(len(models['models'][0]['data']) / 3),
-                0:1000,
-                0:3
-            ] += dnp
+        for resolution, rows in region_rows.items():
+            self._update_region_index(hdf5_in[resolution], rows)
 
-            hdf5_in.close()
+        hdf5_in.close()
 
         return True
 
@@ -260,6 +861,16 @@ class json3dIndexerTool(Tool):
         per dataset basis so that they can be easily distributed as part of the
         RESTful API.
 
+        The number of processes used to decode the JSON files is set with
+        "json_processes" in the configuration. The coordinate encoding is set
+        with "coord_encoding", either "float32" (default) or "fixed", and the
+        scale factor for the fixed point encoding with "coord_scale_factor".
+        The factors for the downsampled models are set with "lod_factors" and
+        the superposition onto the cluster centroids is turned on by setting
+        "align_models" to True. The ensemble distance and contact maps
+        are only stored when "contact_threshold" is set to the distance below
+        which beads are in contact.
+
         Parameters
         ----------
         input_files : list
@@ -297,7 +908,13 @@ class json3dIndexerTool(Tool):
         output_metadata = {}
 
         # handle error
-        results = self.json2hdf5(targz_file, h5_file)
+        results = self.json2hdf5(
+            targz_file, h5_file, self.configuration.get("json_processes", 1),
+            self.configuration.get("coord_encoding", "float32"),
+            self.configuration.get("coord_scale_factor", 1000),
+            self.configuration.get("lod_factors", [2, 4, 8]),
+            self.configuration.get("align_models", False),
+            self.configuration.get("contact_threshold"))
         results = compss_wait_on(results)
 
         output_metadata = {
@@ -0,0 +1,437 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+from collections import OrderedDict
+
+import numpy as np
+import h5py
+
+from mg_process_files.tool.index_utils import bisect_left
+from mg_process_files.tool.model_utils import square_map
+from mg_process_files.tool.tadbit_json import decode_coords
+
+# ------------------------------------------------------------------------------
+
+
+def overlapping_regions(grp, chrom, start, end):
+    """
+    Finds the regions at a resolution that overlap a location by binary
+    searching the region index for the chromosome.
+
+    Parameters
+    ----------
+    grp : h5py.Group
+        Resolution group within the HDF5 file
+    chrom : str
+        Chromosome name
+    start : int
+        Start of the location
+    end : int
+        End of the location
+
+    Returns
+    -------
+    list
+        List of dicts with the uuid, start, end and first row of the models
+        (offset) of each region, ordered by start
+    """
+    if 'regions' not in grp or chrom not in grp['regions']:
+        return []
+
+    cgrp = grp['regions'][chrom]
+    first = bisect_left(cgrp['max_end'], start + 1)
+    last = bisect_left(cgrp['start'], end, first)
+
+    columns = dict(
+        (column, cgrp[column][first:last])
+        for column in ('start', 'end', 'offset', 'uuid'))
+
+    return [
+        {
+            "uuid": columns['uuid'][i].decode('utf-8'),
+            "start": int(columns['start'][i]),
+            "end": int(columns['end'][i]),
+            "offset": int(columns['offset'][i])
+        } for i in range(last - first) if columns['end'][i] > start
+    ]
+
+
+class json3dReader(object):
+    """
+    Reader for the 3D model index generated by
+    :class:`mg_process_files.tool.json_3d_indexer.json3dIndexerTool`
+
+    Keeps the HDF5 file open and holds the decoded models of recently used
+    regions in a least recently used cache, so repeated requests for the same
+    regions do not need to read from disk. The cache is limited by the size
+    of the decoded coordinates.
+
+    Example
+    -------
+    .. code-block:: python
+       :linenos:
+
+       with json3dReader(hdf5_file, cache_size=512 * 1024 * 1024) as reader:
+           refs, coords = reader.get_centroids(10000, uuid)
+           for region in reader.get_region_models(10000, "chr1", 1000000, 2000000):
+               print(region["uuid"], region["coords"].shape)
+    """
+
+    def __init__(self, file_hdf5, cache_size=256 * 1024 * 1024):
+        """
+        Parameters
+        ----------
+        file_hdf5 : str
+            Location of the HDF5 index file
+        cache_size : int
+            Maximum size in bytes of the cached model coordinates
+        """
+        self.hdf5_in = h5py.File(file_hdf5, "r")
+        self.cache_size = cache_size
+        self.cache_used = 0
+        self._cache = OrderedDict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Closes the HDF5 file and empties the cache
+        """
+        self._cache.clear()
+        self.cache_used = 0
+        self.hdf5_in.close()
+
+    def _cache_get(self, key):
+        """
+        Returns a cached value, marking it as the most recently used, or None
+        """
+        if key not in self._cache:
+            return None
+        value = self._cache.pop(key)
+        self._cache[key] = value
+        return value
+
+    def _cache_put(self, key, value):
+        """
+        Adds a (refs, coords) value to the cache, removing the least recently
+        used values to keep within the size limit. Values that are larger
+        than the limit are not cached.
+        """
+        size = value[0].nbytes + value[1].nbytes
+        if size > self.cache_size:
+            return
+
+        while self._cache and self.cache_used + size > self.cache_size:
+            _, (old_refs, old_coords) = self._cache.popitem(last=False)
+            self.cache_used -= old_refs.nbytes + old_coords.nbytes
+
+        self._cache[key] = value
+        self.cache_used += size
+
+    def _region(self, resolution, uuid):
+        """
+        Returns the groups and attributes needed to read a region
+        """
+        grp = self.hdf5_in[str(resolution)]
+        mpset = grp['meta']['model_params'][str(uuid)]
+        return (grp, mpset, mpset.attrs)
+
+    @staticmethod
+    def _lod_beads(attrs, lod):
+        """
+        Returns the number of beads in the models of a region at a level of
+        detail, checking that the level is stored
+        """
+        if lod != 1 and lod not in attrs.get('lod_factors', []):
+            raise ValueError("Level of detail not stored: {}".format(lod))
+        return -(-int(attrs['beads']) // int(lod))
+
+    def get_models(self, resolution, uuid, lod=1, aligned=False):
+        """
+        Returns all of the models for a region.
+
+        Parameters
+        ----------
+        resolution : int
+            Resolution of the models
+        uuid : str
+            uuid of the region
+        lod : int
+            Level of detail, the number of beads averaged into each bead. 1 is
+            the full resolution
+        aligned : bool
+            Return the models superimposed onto the centroid of their cluster.
+            These are only stored at the full resolution
+
+        Returns
+        -------
+        tuple
+            refs : numpy.ndarray
+                ref of each model
+            coords : numpy.ndarray
+                (models x beads x 3) float32 array of the coordinates
+        """
+        key = (str(resolution), str(uuid), int(lod)) + (('aligned',) if aligned else ())
+        value = self._cache_get(key)
+        if value is not None:
+            return value
+
+        grp, mpset, attrs = self._region(resolution, uuid)
+        beads = self._lod_beads(attrs, lod)
+        if aligned:
+            if lod != 1 or 'aligned_i' not in attrs:
+                raise ValueError("Aligned models not stored for region: {}".format(uuid))
+            dset = grp['aligned']
+            first = int(attrs['aligned_i'])
+        elif lod == 1:
+            dset = grp['models']
+            first = int(attrs['i'])
+        else:
+            dset = grp['lod'][str(lod)]
+            first = int(attrs['lod_i_' + str(lod)])
+
+        n_models = int(attrs['models'])
+        coords = decode_coords(dset[first:first + n_models * beads, :], dset.attrs)
+
+        value = (mpset[:, 0], coords.reshape(n_models, beads, 3))
+        self._cache_put(key, value)
+        return value
+
+    def _select(  # pylint: disable=too-many-arguments
+            self, resolution, uuid, refs, lod=1, aligned=False):
+        """
+        Returns the models with the given refs, in the order of the refs
+        """
+        all_refs, coords = self.get_models(resolution, uuid, lod, aligned)
+        position = dict((int(ref), i) for i, ref in enumerate(all_refs))
+        selected = [position[int(ref)] for ref in refs if int(ref) in position]
+        return (all_refs[selected], coords[selected])
+
+    def get_cluster(  # pylint: disable=too-many-arguments
+            self, resolution, uuid, cluster_id, lod=1, aligned=False):
+        """
+        Returns the models in a cluster.
+
+        Parameters
+        ----------
+        resolution : int
+            Resolution of the models
+        uuid : str
+            uuid of the region
+        cluster_id : int
+            Position of the cluster
+        lod : int
+            Level of detail
+        aligned : bool
+            Return the models superimposed onto the centroid of the cluster
+
+        Returns
+        -------
+        tuple
+            refs : numpy.ndarray
+            coords : numpy.ndarray
+                (models x beads x 3) float32 array of the coordinates
+        """
+        grp = self.hdf5_in[str(resolution)]
+        refs = grp['meta']['clusters'][str(uuid)][str(cluster_id)][:]
+        return self._select(resolution, uuid, refs, lod, aligned)
+
+    def get_rmsd(self, resolution, uuid):
+        """
+        Returns the RMSD of each model from each of the centroid models after
+        superposition.
+
+        Parameters
+        ----------
+        resolution : int
+            Resolution of the models
+        uuid : str
+            uuid of the region
+
+        Returns
+        -------
+        tuple
+            refs : numpy.ndarray
+                ref of each model
+            centroid_refs : numpy.ndarray
+                ref of each centroid model
+            rmsd : numpy.ndarray
+                (models x centroids) array of the RMSD values
+        """
+        grp, mpset, _ = self._region(resolution, uuid)
+        if 'rmsd' not in grp['meta'] or str(uuid) not in grp['meta']['rmsd']:
+            raise ValueError("RMSD not stored for region: {}".format(uuid))
+
+        refs = mpset[:, 0]
+        position = dict((int(ref), i) for i, ref in enumerate(refs))
+        centroid_refs = np.array([
+            ref for ref in grp['meta']['centroids'][str(uuid)][:] if int(ref) in position
+        ], dtype=refs.dtype)
+        return (refs, centroid_refs, grp['meta']['rmsd'][str(uuid)][:])
+
+    def get_ensemble_maps(self, resolution, uuid):
+        """
+        Returns the mean distance and contact frequency maps of the models of
+        a region.
+
+        Parameters
+        ----------
+        resolution : int
+            Resolution of the models
+        uuid : str
+            uuid of the region
+
+        Returns
+        -------
+        tuple
+            distances : numpy.ndarray
+                (beads x beads) matrix of the mean distance between each pair
+                of beads
+            contacts : numpy.ndarray
+                (beads x beads) matrix of the fraction of the models in which
+                each pair of beads is closer than the contact threshold
+        """
+        meta = self.hdf5_in[str(resolution)]['meta']
+        if 'distances' not in meta or str(uuid) not in meta['distances']:
+            raise ValueError("Ensemble maps not stored for region: {}".format(uuid))
+
+        distances = meta['distances'][str(uuid)]
+        contacts = meta['contacts'][str(uuid)]
+        n_beads = int(distances.attrs['beads'])
+        return (square_map(distances[:], n_beads), square_map(contacts[:], n_beads, 1))
+
+    def get_centroids(self, resolution, uuid, lod=1):
+        """
+        Returns the centroid model of each cluster. If the region is not
+        cached only the rows of the centroid models are read, and these are
+        cached separately from the full region. The centroid models are
+        stored together in the ``lod_centroids`` datasets so they can be read
+        as a single slice.
+
+        Parameters
+        ----------
+        resolution : int
+            Resolution of the models
+        uuid : str
+            uuid of the region
+        lod : int
+            Level of detail
+
+        Returns
+        -------
+        tuple
+            refs : numpy.ndarray
+            coords : numpy.ndarray
+                (centroids x beads x 3) float32 array of the coordinates
+        """
+        grp, mpset, attrs = self._region(resolution, uuid)
+        refs = grp['meta']['centroids'][str(uuid)][:]
+
+        if (str(resolution), str(uuid), int(lod)) in self._cache:
+            return self._select(resolution, uuid, refs, lod)
+
+        key = (str(resolution), str(uuid), int(lod), 'centroids')
+        value = self._cache_get(key)
+        if value is not None:
+            return value
+
+        all_refs = mpset[:, 0]
+        position = dict((int(ref), i) for i, ref in enumerate(all_refs))
+        selected = [position[int(ref)] for ref in refs if int(ref) in position]
+
+        beads = self._lod_beads(attrs, lod)
+        if 'centroids_i_' + str(lod) in attrs:
+            dset = grp['lod_centroids'][str(lod)]
+            first = int(attrs['centroids_i_' + str(lod)])
+            coords = decode_coords(
+                dset[first:first + len(selected) * beads, :], dset.attrs
+            ).reshape(len(selected), beads, 3)
+        else:
+            dset = grp['models']
+            coords = np.empty((len(selected), beads, 3), dtype='f4')
+            for i, model_id in enumerate(selected):
+                first = int(attrs['i']) + model_id * beads
+                coords[i] = decode_coords(dset[first:first + beads, :], dset.attrs)
+
+        value = (all_refs[selected], coords)
+        self._cache_put(key, value)
+        return value
+
+    def get_regions(self, resolution, chrom, start, end):
+        """
+        Returns the regions that overlap a location.
+
+        Parameters
+        ----------
+        resolution : int
+            Resolution of the models
+        chrom : str
+            Chromosome name
+        start : int
+            Start of the location
+        end : int
+            End of the location
+
+        Returns
+        -------
+        list
+            List of dicts with the uuid, start, end and offset of each region
+        """
+        return overlapping_regions(self.hdf5_in[str(resolution)], chrom, start, end)
+
+    def get_region_models(  # pylint: disable=too-many-arguments
+            self, resolution, chrom, start, end, centroids_only=False, lod=1):
+        """
+        Returns the models, or only the centroid models, of each of the
+        regions that overlap a location.
+
+        Parameters
+        ----------
+        resolution : int
+            Resolution of the models
+        chrom : str
+            Chromosome name
+        start : int
+            Start of the location
+        end : int
+            End of the location
+        centroids_only : bool
+            Only return the centroid models
+        lod : int
+            Level of detail
+
+        Returns
+        -------
+        list
+            List of dicts with the uuid, start, end, refs and coords of each
+            region
+        """
+        regions = self.get_regions(resolution, chrom, start, end)
+        for region in regions:
+            if centroids_only:
+                region["refs"], region["coords"] = self.get_centroids(
+                    resolution, region["uuid"], lod)
+            else:
+                region["refs"], region["coords"] = self.get_models(
+                    resolution, region["uuid"], lod)
+        return regions
@@ -0,0 +1,172 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import numpy as np
+
+# ------------------------------------------------------------------------------
+
+
+def downsample_models(coords, factor):
+    """
+    Level of detail models
+
+    Reduces the number of beads in each model by averaging the coordinates of
+    each run of ``factor`` consecutive beads. The last bead of the
+    downsampled model is the average of the remaining beads when the number
+    of beads is not a multiple of the factor.
+
+    Parameters
+    ----------
+    coords : numpy.ndarray
+        (beads x models x 3) array of the coordinates
+    factor : int
+        Number of beads to average into each bead
+
+    Returns
+    -------
+    numpy.ndarray
+        (ceil(beads / factor) x models x 3) array of the coordinates
+    """
+    n_beads = coords.shape[0]
+    firsts = np.arange(0, n_beads, factor)
+    counts = np.diff(np.append(firsts, n_beads))
+
+    sums = np.add.reduceat(coords.astype('f8'), firsts, axis=0)
+    return sums / counts[:, np.newaxis, np.newaxis]
+
+
+def superimpose_models(coords, reference):
+    """
+    Model superposition
+
+    Superimposes each model onto a reference model with the Kabsch
+    algorithm. The models are centred, the optimal rotation for all of the
+    models is found with a single batched SVD of their 3 x 3 covariance
+    matrices, corrected so that none of them are reflections, and the
+    rotated models are moved onto the centre of the reference.
+
+    Parameters
+    ----------
+    coords : numpy.ndarray
+        (beads x models x 3) array of the coordinates
+    reference : numpy.ndarray
+        (beads x 3) array of the coordinates of the reference model
+
+    Returns
+    -------
+    tuple
+        aligned : numpy.ndarray
+            (beads x models x 3) array of the superimposed coordinates
+        rmsd : numpy.ndarray
+            RMSD of each superimposed model from the reference
+    """
+    coords = coords.astype('f8')
+    reference = reference.astype('f8')
+
+    ref_centre = reference.mean(axis=0)
+    centred = coords - coords.mean(axis=0)
+    ref_centred = reference - ref_centre
+
+    covariance = np.einsum('bni,bj->nij', centred, ref_centred)
+    u_mat, _, vt_mat = np.linalg.svd(covariance)
+
+    flip = np.sign(np.linalg.det(np.matmul(u_mat, vt_mat)))
+    flip[flip == 0] = 1
+    u_mat[:, :, 2] *= flip[:, np.newaxis]
+    rotations = np.matmul(u_mat, vt_mat)
+
+    aligned = np.einsum('bni,nij->bnj', centred, rotations)
+    rmsd = np.sqrt(((aligned - ref_centred[:, np.newaxis, :]) ** 2).sum(axis=2).mean(axis=0))
+
+    return (aligned + ref_centre, rmsd)
+
+
+def ensemble_maps(coords, threshold, chunk_size=64 * 1024 * 1024):
+    """
+    Ensemble distance and contact maps
+
+    Calculates the mean distance between each pair of beads across all of
+    the models, and the fraction of the models in which each pair of beads
+    is closer than the threshold. The pairwise distances are calculated for a
+    block of models at a time, with the size of the block chosen so that the
+    intermediate arrays stay within ``chunk_size`` bytes.
+
+    As both maps are symmetric, only the upper triangle above the diagonal is
+    returned, in the row by row order of :func:`numpy.triu_indices`. It can be
+    expanded back into a matrix with :func:`square_map`.
+
+    Parameters
+    ----------
+    coords : numpy.ndarray
+        (beads x models x 3) array of the coordinates
+    threshold : float
+        Distance below which a pair of beads is in contact
+    chunk_size : int
+        Approximate limit in bytes for the pairwise distances of a block of
+        models
+
+    Returns
+    -------
+    tuple
+        distances : numpy.ndarray
+            Mean distance between each pair of beads
+        contacts : numpy.ndarray
+            Fraction of the models with each pair of beads in contact
+    """
+    n_beads, n_models = coords.shape[0:2]
+    rows, cols = np.triu_indices(n_beads, 1)
+
+    distance_sum = np.zeros(len(rows), dtype='f8')
+    contact_count = np.zeros(len(rows), dtype='i8')
+
+    block_size = max(1, chunk_size // max(1, 8 * 4 * len(rows)))
+    for first in range(0, n_models, block_size):
+        block = coords[:, first:first + block_size, :].astype('f8')
+        distances = np.sqrt(((block[rows] - block[cols]) ** 2).sum(axis=2))
+        distance_sum += distances.sum(axis=1)
+        contact_count += (distances < threshold).sum(axis=1)
+
+    n_models = max(n_models, 1)
+    return (distance_sum / n_models, contact_count / float(n_models))
+
+
+def square_map(values, n_beads, diagonal=0):
+    """
+    Expands the upper triangle of a symmetric bead map, as returned by
+    :func:`ensemble_maps`, into the full matrix.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Values above the diagonal, row by row
+    n_beads : int
+        Number of beads
+    diagonal : float
+        Value for the diagonal
+
+    Returns
+    -------
+    numpy.ndarray
+        (beads x beads) matrix
+    """
+    matrix = np.full((n_beads, n_beads), diagonal, dtype=values.dtype)
+    rows, cols = np.triu_indices(n_beads, 1)
+    matrix[rows, cols] = values
+    matrix[cols, rows] = values
+    return matrix
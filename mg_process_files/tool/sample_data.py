@@ -0,0 +1,501 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import gzip
+import io
+import json
+import tarfile
+
+import numpy as np
+
+# ------------------------------------------------------------------------------
+
+# Synthetic input files for each of the formats handled by the tools, generated
+# at a configurable scale. Every generator takes a seed, and the same seed and
+# parameters always give the same file.
+
+
+def make_genome(n_chroms=3, genome_size=10000000, seed=0):
+    """
+    Generates the chromosomes of a synthetic genome, with random lengths that
+    add up to the genome size.
+
+    Parameters
+    ----------
+    n_chroms : int
+        Number of chromosomes
+    genome_size : int
+        Total length of the chromosomes
+    seed : int
+        Seed for the random number generator
+
+    Returns
+    -------
+    list
+        List of (chromosome, length) tuples
+    """
+    rng = np.random.RandomState(seed)
+    weights = rng.uniform(0.5, 1.5, n_chroms)
+    lengths = np.floor(weights / weights.sum() * genome_size).astype('i8')
+    return [("chr" + str(i + 1), int(length)) for i, length in enumerate(lengths)]
+
+
+def write_chrom_sizes(file_out, genome):
+    """
+    Writes the chromosome sizes file used by the BED and WIG indexers.
+
+    Parameters
+    ----------
+    file_out : str
+        Location of the chromosome sizes file
+    genome : list
+        List of (chromosome, length) tuples
+    """
+    with open(file_out, 'w') as f_out:
+        for chrom, length in genome:
+            f_out.write("{}\t{}\n".format(chrom, length))
+
+
+def _feature_starts(rng, length, per_mb, max_width):
+    """
+    Returns the sorted starts of a random number of features along a
+    chromosome, for an average of ``per_mb`` features per megabase
+    """
+    n_features = rng.poisson(per_mb * length / 1e6)
+    return np.sort(rng.randint(0, max(1, length - max_width), n_features))
+
+
+def generate_bed(file_bed, genome, features_per_mb=100, seed=0):
+    """
+    Generates a sorted BED file of peaks in the narrowPeak layout of
+    ``sample.bed``.
+
+    Parameters
+    ----------
+    file_bed : str
+        Location of the BED file to write
+    genome : list
+        List of (chromosome, length) tuples
+    features_per_mb : float
+        Average number of features in each megabase
+    seed : int
+        Seed for the random number generator
+
+    Returns
+    -------
+    int
+        Number of features written
+    """
+    rng = np.random.RandomState(seed)
+    n_written = 0
+
+    with open(file_bed, 'w') as f_out:
+        for chrom, length in genome:
+            starts = _feature_starts(rng, length, features_per_mb, 2000)
+            widths = rng.randint(20, 2000, len(starts))
+            scores = rng.randint(0, 1000, len(starts))
+            strands = rng.choice(['+', '-', '.'], len(starts))
+            signal = np.round(rng.gamma(2.0, 3.0, (len(starts), 3)), 5)
+
+            f_out.write(''.join(
+                "{}\t{}\t{}\tpeak_{}\t{}\t{}\t{}\t{}\t{}\t{}\n".format(
+                    chrom, starts[i], starts[i] + widths[i], n_written + i, scores[i],
+                    strands[i], signal[i, 0], signal[i, 1], signal[i, 2], widths[i] // 2)
+                for i in range(len(starts))))
+            n_written += len(starts)
+
+    return n_written
+
+
+def generate_gff3(  # pylint: disable=too-many-arguments,too-many-locals
+        file_gff3, genome, genes_per_mb=20, max_transcripts=3, max_exons=8, seed=0):
+    """
+    Generates a GFF3 file of gene models, sorted by chromosome and start. Each
+    gene has one or more mRNAs, each with exons and a CDS for each exon,
+    linked by their ID and Parent tags, so that the gene model hierarchy can
+    be indexed.
+
+    Parameters
+    ----------
+    file_gff3 : str
+        Location of the GFF3 file to write
+    genome : list
+        List of (chromosome, length) tuples
+    genes_per_mb : float
+        Average number of genes in each megabase
+    max_transcripts : int
+        Maximum number of mRNAs for each gene
+    max_exons : int
+        Maximum number of exons for each mRNA
+    seed : int
+        Seed for the random number generator
+
+    Returns
+    -------
+    int
+        Number of feature lines written
+    """
+    rng = np.random.RandomState(seed)
+    n_written = 0
+    gene_id = 0
+
+    with open(file_gff3, 'w') as f_out:
+        f_out.write("##gff-version 3\n")
+        for chrom, length in genome:
+            f_out.write("##sequence-region {} 1 {}\n".format(chrom, length))
+
+        for chrom, length in genome:
+            lines = []
+            line_starts = []
+            for start in _feature_starts(rng, length, genes_per_mb, 50000) + 1:
+                gene = "gene{}".format(gene_id)
+                strand = rng.choice(['+', '-'])
+                exon_starts = np.unique(np.append(
+                    rng.randint(1, 50000, rng.randint(max_exons)), 0)) + start
+                n_exons = len(exon_starts)
+                exon_ends = exon_starts + rng.randint(50, 500, n_exons)
+                exon_ends[:-1] = np.minimum(exon_ends[:-1], exon_starts[1:] - 1)
+
+                lines.append(
+                    "{}\tsynthetic\tgene\t{}\t{}\t.\t{}\t.\tID={};Name=GENE{}\n".format(
+                        chrom, exon_starts[0], exon_ends[-1], strand, gene, gene_id))
+                line_starts.append(exon_starts[0])
+
+                for transcript_id in range(rng.randint(1, max_transcripts + 1)):
+                    transcript = "{}.{}".format(gene, transcript_id)
+                    exons = np.flatnonzero(rng.rand(n_exons) < 0.8)
+                    if len(exons) == 0:
+                        exons = np.arange(n_exons)
+                    lines.append(
+                        "{}\tsynthetic\tmRNA\t{}\t{}\t.\t{}\t.\tID={};Parent={}\n".format(
+                            chrom, exon_starts[exons[0]], exon_ends[exons[-1]], strand,
+                            transcript, gene))
+                    line_starts.append(exon_starts[exons[0]])
+                    for exon in exons:
+                        lines.append(
+                            "{chrom}\tsynthetic\texon\t{start}\t{end}\t.\t{strand}\t.\t"
+                            "ID={parent}.exon{exon};Parent={parent}\n".format(
+                                chrom=chrom, start=exon_starts[exon], end=exon_ends[exon],
+                                strand=strand, parent=transcript, exon=exon))
+                        lines.append(
+                            "{}\tsynthetic\tCDS\t{}\t{}\t.\t{}\t0\tParent={}\n".format(
+                                chrom, exon_starts[exon], exon_ends[exon], strand, transcript))
+                        line_starts.extend([exon_starts[exon]] * 2)
+                gene_id += 1
+
+            # A stable sort keeps each parent ahead of children with the same start
+            order = np.argsort(line_starts, kind='mergesort')
+            f_out.write(''.join([lines[i] for i in order]))
+            n_written += len(lines)
+
+    return n_written
+
+
+def _signal_blocks(genome, blocks_per_mb, block_length, span, seed):
+    """
+    Generates the covered blocks of a signal track. Each block is a run of
+    steps of ``span`` bases with values from a random walk, so that
+    neighbouring steps often share the same value.
+
+    Returns
+    -------
+    generator
+        chrom : str
+        start : int
+            0-based start of the block
+        values : numpy.ndarray
+            Value of each step
+    """
+    rng = np.random.RandomState(seed)
+
+    for chrom, length in genome:
+        starts = _feature_starts(rng, length, blocks_per_mb, block_length * 2) // span * span
+        starts = np.unique(starts)
+        lengths = rng.geometric(min(1.0, float(span) / block_length), len(starts))
+        ends = np.minimum(starts + lengths * span, np.append(starts[1:], length))
+
+        for start, end in zip(starts, ends):
+            n_steps = (end - start) // span
+            if n_steps == 0:
+                continue
+            walk = np.cumsum(rng.choice([-1, 0, 0, 0, 1], n_steps))
+            yield (chrom, int(start), np.maximum(walk + rng.randint(0, 100), 0))
+
+
+def generate_wig(  # pylint: disable=too-many-arguments
+        file_wig, genome, step_type="fixed", blocks_per_mb=10, block_length=10000, span=1,
+        seed=0):
+    """
+    Generates a WIG file with fixedStep or variableStep sections. The same
+    seed and parameters give the same signal as :func:`generate_bedgraph`.
+
+    Parameters
+    ----------
+    file_wig : str
+        Location of the WIG file to write
+    genome : list
+        List of (chromosome, length) tuples
+    step_type : str
+        "fixed" for a fixedStep section for each block, or "variable" for a
+        variableStep section for each chromosome
+    blocks_per_mb : float
+        Average number of covered blocks in each megabase
+    block_length : int
+        Average length of the covered blocks
+    span : int
+        Number of bases covered by each value
+    seed : int
+        Seed for the random number generator
+
+    Returns
+    -------
+    int
+        Number of values written
+    """
+    n_written = 0
+    chrom = None
+
+    with open(file_wig, 'w') as f_out:
+        for block_chrom, start, values in _signal_blocks(
+                genome, blocks_per_mb, block_length, span, seed):
+            if step_type == "fixed":
+                f_out.write("fixedStep chrom={0} start={1} step={2} span={2}\n".format(
+                    block_chrom, start + 1, span))
+                f_out.write('\n'.join(map(str, values.tolist())) + '\n')
+            else:
+                if block_chrom != chrom:
+                    f_out.write("variableStep chrom={} span={}\n".format(block_chrom, span))
+                positions = np.arange(len(values)) * span + start + 1
+                f_out.write(''.join(
+                    "{}\t{}\n".format(p, v) for p, v in zip(positions.tolist(), values.tolist())))
+            chrom = block_chrom
+            n_written += len(values)
+
+    return n_written
+
+
+def generate_bedgraph(  # pylint: disable=too-many-arguments
+        file_bedgraph, genome, blocks_per_mb=10, block_length=10000, span=1, seed=0):
+    """
+    Generates a bedGraph file with a line for each step of the signal. The same
+    seed and parameters give the same signal as :func:`generate_wig`.
+
+    Parameters
+    ----------
+    file_bedgraph : str
+        Location of the bedGraph file to write
+    genome : list
+        List of (chromosome, length) tuples
+    blocks_per_mb : float
+        Average number of covered blocks in each megabase
+    block_length : int
+        Average length of the covered blocks
+    span : int
+        Number of bases covered by each value
+    seed : int
+        Seed for the random number generator
+
+    Returns
+    -------
+    int
+        Number of lines written
+    """
+    n_written = 0
+
+    with open(file_bedgraph, 'w') as f_out:
+        f_out.write("track type=bedGraph name=synthetic\n")
+        for chrom, start, values in _signal_blocks(genome, blocks_per_mb, block_length, span, seed):
+            starts = np.arange(len(values)) * span + start
+            f_out.write(''.join(
+                "{}\t{}\t{}\t{}\n".format(chrom, s, s + span, v)
+                for s, v in zip(starts.tolist(), values.tolist())))
+            n_written += len(values)
+
+    return n_written
+
+
+def _random_rotation(rng):
+    """
+    Returns a random 3 x 3 rotation matrix
+    """
+    q_mat, r_mat = np.linalg.qr(rng.randn(3, 3))
+    q_mat = q_mat * np.sign(np.diag(r_mat))
+    if np.linalg.det(q_mat) < 0:
+        q_mat[:, 0] = -q_mat[:, 0]
+    return q_mat
+
+
+def tadbit_region(  # pylint: disable=too-many-arguments,too-many-locals
+        rng, uuid, chrom, start, n_models, n_beads, resolution, n_clusters, contact_density):
+    """
+    Generates the contents of a TADbit JSON file for a single region.
+
+    The models in each cluster are random rotations of a random walk for the
+    cluster, with noise added to each bead, so that they can be superimposed
+    onto the centroid of the cluster.
+
+    Parameters
+    ----------
+    rng : numpy.random.RandomState
+        Random number generator
+    uuid : str
+        uuid of the region
+    chrom : str
+        Chromosome of the region
+    start : int
+        Start of the region
+    n_models : int
+        Number of models
+    n_beads : int
+        Number of beads in each model
+    resolution : int
+        Number of bases for each bead
+    n_clusters : int
+        Number of clusters
+    contact_density : float
+        Fraction of the pairs of bins with a Hi-C contact
+
+    Returns
+    -------
+    dict
+        Contents of the JSON file
+    """
+    n_clusters = max(1, min(n_clusters, n_models))
+    model_cluster = np.arange(n_models) % n_clusters
+    rng.shuffle(model_cluster)
+    walks = np.cumsum(rng.randn(n_clusters, n_beads, 3) * 30.0, axis=1)
+
+    models = []
+    for ref in range(n_models):
+        coords = walks[model_cluster[ref]].dot(_random_rotation(rng))
+        coords += rng.randn(n_beads, 3) * 5.0 + rng.randn(3) * 100.0
+        models.append({"ref": ref, "data": np.round(coords, 3).ravel().tolist()})
+
+    clusters = [np.flatnonzero(model_cluster == i).tolist() for i in range(n_clusters)]
+
+    pairs = np.flatnonzero(rng.rand(n_beads * n_beads) < contact_density)
+    tad_bounds = np.unique(np.append(np.arange(0, n_beads, 10), n_beads))
+    tads = [
+        [i + 1, start + int(first) * resolution, start + int(last) * resolution,
+         int(rng.randint(1, 11))]
+        for i, (first, last) in enumerate(zip(tad_bounds[:-1], tad_bounds[1:]))
+    ]
+
+    restraints = [[i, i + 1, "Harmonic", 50.0, 5.0] for i in range(n_beads - 1)]
+    restraints += [
+        [int(i), int(j), "UpperBound", 200.0, 1.0]
+        for i, j in rng.randint(0, n_beads, (n_beads // 2, 2)) if i < j]
+
+    return {
+        "metadata": {"version": 1.0, "type": "dataset", "generator": "TADbit"},
+        "object": {
+            "uuid": uuid,
+            "title": "Synthetic TADbit data",
+            "experimentType": "Hi-C",
+            "species": "Synthetic",
+            "project": "Synthetic_dataset",
+            "identifier": "SRRnnnnn",
+            "assembly": "synthetic",
+            "cellType": "synthetic",
+            "resolution": resolution,
+            "datatype": "xyz",
+            "components": 3,
+            "source": "local",
+            "chrom": [chrom],
+            "chromStart": [start],
+            "chromEnd": [start + n_beads * resolution],
+            "start": 1,
+            "end": n_beads,
+            "dependencies": {"TADbit": "synthetic"}
+        },
+        "models": models,
+        "clusters": clusters,
+        "centroids": [cluster[0] for cluster in clusters],
+        "restraints": restraints,
+        "hic_data": {
+            "n": n_beads,
+            "data": dict(zip(
+                [str(p) for p in pairs.tolist()], np.round(rng.rand(len(pairs)), 5).tolist())),
+            "tads": [tads]
+        }
+    }
+
+
+def generate_tadbit_archive(  # pylint: disable=too-many-arguments,too-many-locals
+        file_targz, genome, n_regions=4, n_models=100, n_beads=50, resolution=10000,
+        n_clusters=3, contact_density=0.1, seed=0):
+    """
+    Generates a tar.gz archive of TADbit JSON files, one for each region, as
+    loaded by :class:`mg_process_files.tool.json_3d_indexer.json3dIndexerTool`.
+    The archive is written without timestamps so that the same seed and
+    parameters give an identical file.
+
+    Parameters
+    ----------
+    file_targz : str
+        Location of the tar.gz archive to write
+    genome : list
+        List of (chromosome, length) tuples
+    n_regions : int
+        Number of regions
+    n_models : int
+        Number of models for each region
+    n_beads : int
+        Number of beads in each model
+    resolution : int
+        Number of bases for each bead
+    n_clusters : int
+        Number of clusters of models in each region
+    contact_density : float
+        Fraction of the pairs of bins with a Hi-C contact
+    seed : int
+        Seed for the random number generator
+
+    Returns
+    -------
+    list
+        uuid of each region
+    """
+    rng = np.random.RandomState(seed)
+    region_length = n_beads * resolution
+    chroms = [(chrom, length) for chrom, length in genome if length > region_length]
+    if not chroms:
+        raise ValueError(
+            "No chromosomes are longer than a region of {} bases".format(region_length))
+
+    uuids = []
+    with open(file_targz, 'wb') as f_raw:
+        with gzip.GzipFile(filename='', fileobj=f_raw, mode='wb', mtime=0) as f_gz:
+            with tarfile.open(fileobj=f_gz, mode='w') as tar_out:
+                for region_id in range(n_regions):
+                    chrom, length = chroms[rng.randint(len(chroms))]
+                    start = rng.randint((length - region_length) // resolution + 1) * resolution
+                    uuid = "region_{:06d}_{:08x}".format(region_id, rng.randint(2 ** 31))
+
+                    region = tadbit_region(
+                        rng, uuid, chrom, int(start), n_models, n_beads, resolution,
+                        n_clusters, contact_density)
+                    json_data = json.dumps(region).encode('utf-8')
+
+                    tar_info = tarfile.TarInfo("models/" + uuid + ".json")
+                    tar_info.size = len(json_data)
+                    tar_out.addfile(tar_info, io.BytesIO(json_data))
+                    uuids.append(uuid)
+
+    return uuids
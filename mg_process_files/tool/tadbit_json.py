@@ -0,0 +1,766 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import codecs
+import io
+import json
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+
+from collections import deque
+from multiprocessing import Pool
+
+import numpy as np
+
+from mg_process_files.tool.model_utils import downsample_models, ensemble_maps, superimpose_models
+
+# ------------------------------------------------------------------------------
+
+TAD_DTYPE = np.dtype([
+    ('set', 'i4'),
+    ('tad', 'i4'),
+    ('start', 'i8'),
+    ('end', 'i8'),
+    ('score', 'f8')
+])
+
+_STRUCTURE = re.compile(r'["\[\]{}]')
+_STRING_END = re.compile(r'(?:[^"\\]|\\.)*"', re.S)
+
+
+def archive_files(file_targz, names=None):
+    """
+    Opens each of the JSON model files in a tar.gz archive of TADbit models
+    in turn. Each file can only be read until the next one is generated.
+
+    Parameters
+    ----------
+    file_targz : str
+        Location of the tar.gz archive of JSON model files
+    names : set
+        Only open the members with these names. All of the JSON files are
+        opened if this is None
+
+    Returns
+    -------
+    generator
+        name : str
+            Name of the member within the archive
+        f_member : file
+            File object for reading the member as bytes
+    """
+    with tarfile.open(file_targz, 'r|gz') as tar_in:
+        for member in tar_in:
+            if not member.isfile() or not member.name.endswith('.json'):
+                continue
+            if names is not None and member.name not in names:
+                continue
+
+            yield (member.name, tar_in.extractfile(member))
+
+
+def archive_members(file_targz):
+    """
+    TADbit archive reader
+
+    Streams the JSON model files out of a tar.gz archive of TADbit models
+    without extracting them to disk. The archive is read once from start to
+    end, so it can also be a pipe.
+
+    Parameters
+    ----------
+    file_targz : str
+        Location of the tar.gz archive of JSON model files
+
+    Returns
+    -------
+    generator
+        name : str
+            Name of the member within the archive
+        data : bytes
+            Contents of the JSON file
+
+    Example
+    -------
+    .. code-block:: python
+       :linenos:
+
+       for name, data in archive_members(gz_file):
+           models = json.loads(data.decode('utf-8'))
+    """
+    for name, f_member in archive_files(file_targz):
+        yield (name, f_member.read())
+
+
+class _JSONStream(object):
+    """
+    Reads the values of a JSON document from a file a piece at a time. The
+    structure of the document is followed with :meth:`expect` and each value
+    within it is decoded with :meth:`value`, so only the value being decoded
+    needs to be held as text.
+    """
+
+    def __init__(self, f_in, read_size=65536):
+        self.f_in = f_in
+        self.read_size = read_size
+        self.text_decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buf = u''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size):
+        """
+        Reads more of the file into the buffer, dropping the text that has
+        already been decoded. Returns False at the end of the file.
+        """
+        if self.eof:
+            return False
+
+        data = self.f_in.read(size)
+        self.buf = self.buf[self.pos:] + self.text_decoder.decode(data, final=not data)
+        self.pos = 0
+        self.eof = not data
+        return True
+
+    def peek(self):
+        """
+        Skips any whitespace and returns the next character, or an empty
+        string at the end of the file
+        """
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in u' \t\n\r':
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill(self.read_size):
+                return u''
+
+    def expect(self, chars):
+        """
+        Reads the next character, which has to be one of ``chars``
+        """
+        char = self.peek()
+        if char == u'' or char not in chars:
+            raise ValueError("Expected one of {} in JSON, found {!r}".format(chars, char))
+        self.pos += 1
+        return char
+
+    def value(self):
+        """
+        Decodes the next value. If the value runs to the end of the buffer
+        then as much again is read and it is decoded again, so that values
+        that are larger than the read size are decoded in linear time.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buf, self.pos)
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self._fill(max(self.read_size, len(self.buf) - self.pos))
+
+    def skip(self):
+        """
+        Moves past the next value without decoding it. Objects and arrays are
+        skipped by matching up their brackets, so none of the numbers within
+        them are parsed.
+        """
+        if self.peek() not in u'[{':
+            self.value()
+            return
+
+        depth = 0
+        while True:
+            match = _STRUCTURE.search(self.buf, self.pos)
+            if match is None:
+                self.pos = len(self.buf)
+            elif match.group() == u'"':
+                string_end = _STRING_END.match(self.buf, match.end())
+                if string_end is not None:
+                    self.pos = string_end.end()
+                    continue
+                self.pos = match.start()
+            else:
+                self.pos = match.end()
+                depth += 1 if match.group() in u'[{' else -1
+                if depth == 0:
+                    return
+                continue
+
+            if not self._fill(max(self.read_size, len(self.buf) - self.pos)):
+                raise ValueError("Unexpected end of JSON")
+
+
+def _stream_models(stream):
+    """
+    Decodes the ``models`` array one model at a time, copying the
+    coordinates of each into a (models x beads * 3) block. The block is grown
+    in place as needed and trimmed to the number of models at the end.
+    """
+    refs = []
+    block = None
+    n_models = 0
+
+    stream.expect(u'[')
+    if stream.peek() == u']':
+        stream.expect(u']')
+        return (refs, np.zeros((0, 0), dtype='f8'))
+
+    while True:
+        model = stream.value()
+        if block is None:
+            block = np.empty((16, len(model['data'])), dtype='f8')
+        elif n_models == len(block):
+            block.resize((2 * n_models, block.shape[1]), refcheck=False)
+
+        block[n_models] = model['data']
+        refs.append(int(model['ref']))
+        n_models += 1
+
+        if stream.expect(u',]') == u']':
+            break
+
+    block.resize((n_models, block.shape[1]), refcheck=False)
+    return (refs, block)
+
+
+def stream_region(f_in, read_size=65536):
+    """
+    Incremental TADbit JSON reader
+
+    Reads a TADbit JSON file without holding the whole of its text, or the
+    Python lists of the model coordinates, in memory. The sections other than
+    ``models`` are decoded as they are with :mod:`json`. The models are
+    decoded one at a time and their coordinates copied into a single block,
+    so the memory used for the models stays close to the size of the block.
+
+    Parameters
+    ----------
+    f_in : file
+        JSON file opened for reading as bytes
+    read_size : int
+        Number of bytes to read from the file at a time
+
+    Returns
+    -------
+    tuple
+        region : dict
+            The sections of the JSON file other than ``models``
+        refs : list
+            ref of each model
+        block : numpy.ndarray
+            (models x beads * 3) array of the coordinates
+
+    Example
+    -------
+    .. code-block:: python
+       :linenos:
+
+       with open(json_file, 'rb') as f_in:
+           region, refs, block = stream_region(f_in)
+    """
+    stream = _JSONStream(f_in, read_size)
+    region = {}
+    refs = None
+    block = None
+
+    stream.expect(u'{')
+    if stream.peek() == u'}':
+        stream.expect(u'}')
+    else:
+        while True:
+            key = stream.value()
+            stream.expect(u':')
+            if key == 'models':
+                refs, block = _stream_models(stream)
+            else:
+                region[key] = stream.value()
+
+            if stream.expect(u',}') == u'}':
+                break
+
+    if refs is None:
+        raise KeyError('models')
+
+    return (region, refs, block)
+
+
+def cluster_map(clusters):
+    """
+    Builds the lookup from model ref to cluster. Where a ref is listed in more
+    than one cluster the first is used.
+
+    Parameters
+    ----------
+    clusters : list
+        List of the model refs in each cluster
+
+    Returns
+    -------
+    dict
+        ref (int) to cluster id (int)
+    """
+    ref_cluster = {}
+    for cluster_id, refs in enumerate(clusters):
+        for ref in refs:
+            ref_cluster.setdefault(int(ref), cluster_id)
+    return ref_cluster
+
+
+def model_block(models, clusters):
+    """
+    Converts the models from a TADbit JSON file into a single block of
+    coordinates with one reshape, along with the cluster of each model.
+
+    Parameters
+    ----------
+    models : list
+        The ``models`` section of the JSON file, each with a ``ref`` and the
+        flattened x, y, z ``data`` for every bead
+    clusters : list
+        The ``clusters`` section of the JSON file
+
+    Returns
+    -------
+    tuple
+        coords : numpy.ndarray
+            (beads x models x 3) array of the bead coordinates
+        model_params : numpy.ndarray
+            (models x 2) array of the ref and cluster of each model. Models
+            that are not in a cluster are given the id len(clusters)
+    """
+    refs = [int(model['ref']) for model in models]
+    block = np.array([model['data'] for model in models], dtype='f8')
+    return _block_models(refs, block, clusters)
+
+
+def scan_region(f_in, read_size=65536):
+    """
+    TADbit JSON summary reader
+
+    Reads the ``metadata`` and ``object`` sections of a TADbit JSON file and
+    counts the models, without decoding any of the coordinates. The other
+    sections are skipped over, and reading stops as soon as the sections that
+    are needed have been found.
+
+    Parameters
+    ----------
+    f_in : file
+        JSON file opened for reading as bytes
+    read_size : int
+        Number of bytes to read from the file at a time
+
+    Returns
+    -------
+    dict
+        metadata : dict
+            The ``metadata`` section
+        object : dict
+            The ``object`` section
+        models : int
+            Number of models
+        beads : int
+            Number of beads in the first model
+    """
+    stream = _JSONStream(f_in, read_size)
+    summary = {'metadata': {}, 'object': {}, 'models': 0, 'beads': 0}
+    found = set()
+
+    stream.expect(u'{')
+    if stream.peek() == u'}':
+        return summary
+
+    while len(found) < 3:
+        key = stream.value()
+        stream.expect(u':')
+        if key in ('metadata', 'object'):
+            summary[key] = stream.value()
+            found.add(key)
+        elif key == 'models':
+            stream.expect(u'[')
+            if stream.peek() != u']':
+                summary['beads'] = len(stream.value()['data']) // 3
+                summary['models'] = 1
+                while stream.peek() == u',':
+                    stream.expect(u',')
+                    stream.skip()
+                    summary['models'] += 1
+            stream.expect(u']')
+            found.add(key)
+        else:
+            stream.skip()
+
+        if stream.expect(u',}') == u'}':
+            break
+
+    return summary
+
+
+def _block_models(refs, block, clusters):
+    """
+    Converts a (models x beads * 3) block of coordinates into the arrays
+    returned by :func:`model_block`
+    """
+    refs = np.array(refs, dtype='i8')
+    coords = block.reshape(len(refs), -1, 3).transpose(1, 0, 2)
+
+    ref_cluster = cluster_map(clusters)
+    model_params = np.column_stack((
+        refs, [ref_cluster.get(ref, len(clusters)) for ref in refs]))
+
+    return (coords, model_params)
+
+
+def hic_data_table(hic_data):
+    """
+    Converts the ``hic_data`` section of a TADbit JSON file into numeric
+    arrays.
+
+    The contacts are held in ``data`` as a dict from the flattened position
+    in the (n x n) matrix to the value. These are converted to a sparse COO
+    table sorted by row and column, along with the offset of the first entry
+    of each row so that the contacts for a window of rows can be read as a
+    single slice. The TADs are converted into a structured array.
+
+    Parameters
+    ----------
+    hic_data : dict
+        The ``hic_data`` section of the JSON file
+
+    Returns
+    -------
+    dict
+        n : int
+            Size of the matrix
+        row, col : numpy.ndarray
+            Position of each contact
+        value : numpy.ndarray
+            Value of each contact
+        row_offsets : numpy.ndarray
+            Position of the first contact of each row, with a final entry for
+            the number of contacts
+        tads : numpy.ndarray
+            Structured array with the set, tad number, start, end and score of
+            each TAD
+    """
+    n_bins = int(hic_data['n'])
+    contacts = hic_data.get('data', {})
+
+    positions = np.array([int(k) for k in contacts], dtype='i8')
+    values = np.array(list(contacts.values()), dtype='f8')
+    order = np.argsort(positions)
+    positions = positions[order]
+
+    rows = (positions // n_bins).astype('i4')
+
+    tads = [
+        (set_id, tad[0], tad[1], tad[2], tad[3])
+        for set_id, tad_set in enumerate(hic_data.get('tads', []))
+        for tad in tad_set
+    ]
+
+    return {
+        'n': n_bins,
+        'row': rows,
+        'col': (positions % n_bins).astype('i4'),
+        'value': values[order],
+        'row_offsets': np.searchsorted(rows, np.arange(n_bins + 1)).astype('i8'),
+        'tads': np.array(tads, dtype=TAD_DTYPE)
+    }
+
+
+def restraint_table(restraints):
+    """
+    Converts the ``restraints`` section of a TADbit JSON file into a
+    structured array. Each restraint is expected to be the two beads, the
+    type of the restraint and then its numeric parameters. The parameters are
+    padded with NaN to the longest restraint.
+
+    Parameters
+    ----------
+    restraints : list
+        The ``restraints`` section of the JSON file
+
+    Returns
+    -------
+    numpy.ndarray
+        Structured array with ``bead1``, ``bead2``, ``kind`` and ``values``
+        fields
+    """
+    n_values = max([len(r) - 3 for r in restraints] + [1])
+    kinds = np.array([str(r[2]) for r in restraints] + [''], dtype='S')
+
+    table = np.zeros(len(restraints), dtype=[
+        ('bead1', 'i4'), ('bead2', 'i4'), ('kind', kinds.dtype), ('values', 'f8', (n_values,))
+    ])
+    table['values'] = np.nan
+    for i, restraint in enumerate(restraints):
+        table['bead1'][i] = restraint[0]
+        table['bead2'][i] = restraint[1]
+        table['kind'][i] = kinds[i]
+        table['values'][i, 0:len(restraint) - 3] = restraint[3:]
+
+    return table
+
+
+def encode_coords(coords, encoding, scale_factor=1):
+    """
+    Encodes coordinates for storage.
+
+    Parameters
+    ----------
+    coords : numpy.ndarray
+        Coordinates
+    encoding : str
+        "float32", or "fixed" to store the coordinates as int32 after
+        multiplying them by the scale factor
+    scale_factor : int
+        Scale factor for the fixed point encoding
+
+    Returns
+    -------
+    numpy.ndarray
+    """
+    if encoding == 'float32':
+        return coords.astype('f4')
+    if encoding == 'fixed':
+        return np.round(coords * scale_factor).astype('i4')
+    raise ValueError("Unknown coordinate encoding: {}".format(encoding))
+
+
+def decode_coords(values, attrs):
+    """
+    Decodes stored coordinates using the encoding recorded in the attributes
+    of the dataset.
+
+    Parameters
+    ----------
+    values : numpy.ndarray
+        Values read from the models dataset
+    attrs : h5py.AttributeManager
+        Attributes of the models dataset
+
+    Returns
+    -------
+    numpy.ndarray
+        Coordinates as float32
+    """
+    if attrs.get('encoding') == 'fixed':
+        return (values / float(attrs['scale_factor'])).astype('f4')
+    return values.astype('f4')
+
+
+def superimpose_clusters(coords, model_params, centroid_ids):
+    """
+    Superimposes the models onto the centroid models with
+    :func:`mg_process_files.tool.model_utils.superimpose_models`.
+
+    Every model is superimposed onto every centroid to give the RMSD matrix.
+    The aligned coordinates that are kept for each model are those
+    superimposed onto the centroid of its own cluster. Models that are not in
+    a cluster with a centroid keep their original coordinates.
+
+    Parameters
+    ----------
+    coords : numpy.ndarray
+        (beads x models x 3) array of the coordinates
+    model_params : numpy.ndarray
+        (models x 2) array of the ref and cluster of each model
+    centroid_ids : numpy.ndarray
+        Position of each of the centroid models
+
+    Returns
+    -------
+    tuple
+        aligned : numpy.ndarray
+            (beads x models x 3) array of the aligned coordinates
+        rmsd : numpy.ndarray
+            (models x centroids) array of the RMSD of each model from each
+            centroid
+    """
+    aligned = coords.astype('f8')
+    rmsd = np.zeros((coords.shape[1], len(centroid_ids)), dtype='f8')
+
+    for i, centroid_id in enumerate(centroid_ids):
+        centroid_aligned, rmsd[:, i] = superimpose_models(coords, coords[:, centroid_id, :])
+        in_cluster = model_params[:, 1] == model_params[centroid_id, 1]
+        aligned[:, in_cluster, :] = centroid_aligned[:, in_cluster, :]
+
+    return (aligned, rmsd)
+
+
+def decode_region(json_data, lod_factors=(), align=False, contact_threshold=None):
+    """
+    Decodes a TADbit JSON file with :func:`stream_region` and converts the
+    models into coordinate arrays in the same way as :func:`model_block`.
+
+    Parameters
+    ----------
+    json_data : bytes or file
+        Contents of the JSON file, or the file opened for reading as bytes
+    lod_factors : list
+        Factors to downsample the models by with
+        :func:`mg_process_files.tool.model_utils.downsample_models`
+    align : bool
+        Superimpose the models onto the centroids with
+        :func:`superimpose_clusters`
+    contact_threshold : float
+        Distance below which beads are in contact for the ensemble maps from
+        :func:`mg_process_files.tool.model_utils.ensemble_maps`. The maps are
+        not calculated if this is None
+
+    Returns
+    -------
+    dict
+        The sections of the JSON file with the ``models`` section replaced by
+        ``coords`` and ``model_params`` arrays, and the ``hic_data`` and
+        ``restraints`` sections converted by :func:`hic_data_table` and
+        :func:`restraint_table`. ``centroid_ids`` holds the position of each
+        of the centroid models and ``lod`` the downsampled coordinates for
+        each factor. With ``align`` the aligned coordinates are in
+        ``aligned`` and the RMSD matrix in ``rmsd``. With a
+        ``contact_threshold`` the upper triangles of the mean distance and
+        contact frequency maps are in ``distances`` and ``contacts``.
+    """
+    if not hasattr(json_data, 'read'):
+        json_data = io.BytesIO(json_data)
+
+    region, refs, block = stream_region(json_data)
+    region['coords'], region['model_params'] = _block_models(
+        refs, block, region['clusters'])
+    if 'hic_data' in region:
+        region['hic_data'] = hic_data_table(region['hic_data'])
+    region['restraints'] = restraint_table(region.get('restraints', []))
+
+    position = dict((int(ref), i) for i, ref in enumerate(region['model_params'][:, 0]))
+    region['centroid_ids'] = np.array(
+        [position[int(ref)] for ref in region['centroids'] if int(ref) in position], dtype='i8')
+
+    region['lod'] = dict(
+        (int(factor), downsample_models(region['coords'], int(factor))) for factor in lod_factors)
+
+    if align:
+        region['aligned'], region['rmsd'] = superimpose_clusters(
+            region['coords'], region['model_params'], region['centroid_ids'])
+
+    if contact_threshold is not None:
+        region['distances'], region['contacts'] = ensemble_maps(
+            region['coords'], contact_threshold)
+        region['contact_threshold'] = contact_threshold
+
+    return region
+
+
+def _decode_spooled_region(file_json, lod_factors, align, contact_threshold):
+    """
+    Decodes a JSON file spooled from the archive with :func:`decode_region`
+    in a pool process and removes it once it has been read.
+    """
+    try:
+        with open(file_json, 'rb') as f_json:
+            return decode_region(f_json, lod_factors, align, contact_threshold)
+    finally:
+        os.remove(file_json)
+
+
+def decode_regions(  # pylint: disable=too-many-arguments
+        file_targz, processes=1, lod_factors=(), align=False, contact_threshold=None,
+        names=None, tmp_dir=None):
+    """
+    Decoded region generator
+
+    Streams the JSON files from a TADbit archive and decodes each of them with
+    :func:`decode_region`. With more than one process the files are decoded
+    in a process pool while they continue to be read from the archive.
+    Otherwise each file is decoded as it is read from the archive. The
+    regions are generated in the order that they are in the archive.
+
+    In the pool each file is copied from the archive to a temporary file in
+    ``tmp_dir``, which the pool process streams the JSON from, so the files
+    themselves are never held in memory. The number of files waiting to be
+    generated is limited to twice the number of processes, so at most that
+    many decoded regions are held in memory at once and the same number of
+    temporary files is on disk.
+
+    Parameters
+    ----------
+    file_targz : str
+        Location of the tar.gz archive of JSON model files
+    processes : int
+        Number of processes to decode the files with
+    lod_factors : list
+        Factors to downsample the models by
+    align : bool
+        Superimpose the models onto the centroids
+    contact_threshold : float
+        Distance below which beads are in contact for the ensemble maps
+    names : set
+        Only decode the members of the archive with these names
+    tmp_dir : str
+        Directory for the temporary files in the pool, the default temporary
+        directory if None
+
+    Returns
+    -------
+    generator
+        dict as returned by :func:`decode_region`
+
+    Example
+    -------
+    .. code-block:: python
+       :linenos:
+
+       for region in decode_regions(gz_file, processes=4):
+           print(region['object']['uuid'], region['coords'].shape)
+    """
+    if processes <= 1:
+        for _, f_member in archive_files(file_targz, names):
+            yield decode_region(f_member, lod_factors, align, contact_threshold)
+        return
+
+    pool = Pool(processes)
+    pending = deque()
+    try:
+        for _, f_member in archive_files(file_targz, names):
+            with tempfile.NamedTemporaryFile(
+                    suffix='.json', dir=tmp_dir, delete=False) as f_json:
+                shutil.copyfileobj(f_member, f_json)
+            pending.append((f_json.name, pool.apply_async(
+                _decode_spooled_region,
+                (f_json.name, lod_factors, align, contact_threshold))))
+            if len(pending) >= 2 * processes:
+                yield pending.popleft()[1].get()
+
+        while pending:
+            yield pending.popleft()[1].get()
+    finally:
+        pool.terminate()
+        pool.join()
+        # Files left by tasks that did not run
+        for file_json, _ in pending:
+            if os.path.isfile(file_json):
+                os.remove(file_json)
@@ -42,6 +42,12 @@ except ImportError:
 
 from basic_modules.tool import Tool
 
+from mg_process_files.tool.index_utils import add_chromosome, decode_names
+from mg_process_files.tool.index_utils import extend_mask, intervals_to_mask, open_assembly_index
+from mg_process_files.tool.index_utils import read_spans, write_span
+from mg_process_files.tool.wig_reader import bedgraph_runs, wig_runs
+from mg_process_files.tool.wig_reader import runs_to_bins, write_bedgraph
+
 # ------------------------------------------------------------------------------
 
 
@@ -63,23 +69,32 @@ class wigIndexerTool(Tool):
         self.configuration.update(configuration)
 
     @task(returns=bool, file_wig=FILE_IN, file_chrom=FILE_IN, file_bw=FILE_OUT,
-          isModifier=False)
-    def wig2bigwig(self, file_wig, file_chrom, file_bw):  # pylint: disable=no-self-use
+          file_format=IN, isModifier=False)
+    def wig2bigwig(  # pylint: disable=no-self-use
+            self, file_wig, file_chrom, file_bw, file_format="wig"):
         """
         WIG to BigWig converter
 
         This uses the ``wigToBigWig`` program binary provided at
         http://hgdownload.cse.ucsc.edu/admin/exe/linux.x86_64/
-        to perform the conversion from WIG to BigWig.
+        to perform the conversion from WIG to BigWig. ``wigToBigWig`` also
+        accepts bedGraph files so this is used for both input formats.
+
+        WIG files are read as run-length encoded runs by
+        :func:`mg_process_files.tool.wig_reader.wig_runs` and streamed to
+        ``wigToBigWig`` as bedGraph, so consecutive positions with the same
+        value are passed as a single line. bedGraph files are passed directly.
 
         Parameters
         ----------
         file_wig : str
-            Location of the wig file
+            Location of the wig or bedGraph file
         file_chrom : str
             Location of the chrom.size file
         file_bw : str
             Location of the bigWig file
+        file_format : str
+            Format of the input file, either "wig" or "bedgraph"
 
         Example
         -------
@@ -92,16 +107,28 @@ class wigIndexerTool(Tool):
                        "wig2bigWig: Could not process files {}, {}.".format(*input_files)))
 
         """
-        command_line = 'wigToBigWig ' + file_wig + ' ' + file_chrom + ' ' + file_bw + '.tmp.bw'
+        file_source = file_wig
+        if file_format != "bedgraph":
+            file_source = 'stdin'
+
+        command_line = 'wigToBigWig ' + file_source + ' ' + file_chrom + ' ' + file_bw + '.tmp.bw'
         try:
             args = shlex.split(command_line)
-            process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            process.communicate()
+            process = subprocess.Popen(
+                args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            if file_format != "bedgraph":
+                for chrom, starts, ends, values in wig_runs(file_wig):
+                    write_bedgraph(process.stdin, chrom, starts, ends, values)
+            process.stdin.close()
+            err = process.stderr.read()
+            process.wait()
         except (IOError, OSError) as msg:
-            logger.fatal("I/O error({0} - twoBitInfo): {1}\n{2}".format(
+            logger.fatal("I/O error({0} - wigToBigWig): {1}\n{2}".format(
                 msg.errno, msg.strerror, command_line))
-            out, err = process.communicate()  # pylint: disable=unused-variable
-            logger.warn("wigToBigWig: " + err)
+            return False
+
+        if process.returncode != 0:
+            logger.warn("wigToBigWig: " + str(err))
             return False
 
         logger.info('BIGWIG - COMMAND: ' + command_line)
@@ -119,7 +146,7 @@ class wigIndexerTool(Tool):
         return True
 
     @task(returns=bool, file_id=IN, assembly=IN, file_wig=FILE_IN, file_hdf5=FILE_INOUT)
-    def wig2hdf5(self, file_id, assembly, file_wig, file_hdf5):  # pylint: disable=no-self-use,too-many-branches,too-many-locals,too-many-statements
+    def wig2hdf5(self, file_id, assembly, file_wig, file_hdf5):
         """
         WIG to HDF5 converter
 
@@ -128,6 +155,11 @@ class wigIndexerTool(Tool):
         Overlapping regions are condensed into a single feature block rather
         than maintaining all of the detail of the original WIG file.
 
+        The file is read by :func:`mg_process_files.tool.wig_reader.wig_runs`
+        which collapses consecutive positions with the same value into runs,
+        so the work done is proportional to the number of runs rather than
+        the number of positions.
+
         Parameters
         ----------
         file_id : str
@@ -152,173 +184,312 @@ class wigIndexerTool(Tool):
                        "wig2hdf5: Could not process files {}, {}.".format(*input_files)))
 
         """
-        max_files = 1024
-        max_chromosomes = 1024
-        max_chromosome_size = 2000000000
+        return self._runs2hdf5(file_id, assembly, wig_runs(file_wig), file_hdf5)
+
+    def _runs2hdf5(self, file_id, assembly, runs, file_hdf5):  # pylint: disable=no-self-use
+        """
+        Loads the runs generated by one of the readers in
+        :mod:`mg_process_files.tool.wig_reader` into the HDF5 presence index.
+
+        Runs with a non-zero value are merged into blocks of coverage and only
+        the span of the chromosome that is covered by the file is written,
+        after clearing the span written by any previous load of the file. The
+        positions are stored in the same way as the WIG loader so that the
+        index is the same whichever format the data arrived in.
 
+        Parameters
+        ----------
+        file_id : str
+            The file_id as stored by the DMP
+        assembly : str
+            Assembly of the genome that is getting indexed
+        runs : generator
+            Iterator of (chrom, starts, ends, values) tuples with 0-based
+            half-open coordinates
+        file_hdf5 : str
+            Location of the HDF5 index file
+        """
         hdf5_in = h5py.File(file_hdf5, "a")
 
-        if str(assembly) in hdf5_in:
-            grp = hdf5_in[str(assembly)]
-            # Setup the variable in the datastructure
-            meta = hdf5_in['meta']  # pylint: disable=unused-variable
-
-            dset = grp['data']
-            fset = grp['files']
-            cset = grp['chromosomes']
-            file_idx = [i for i in fset if i != '']
-            if file_id not in file_idx:
-                file_idx.append(file_id)
-                # pylint is unable to recognise the resize and shape methods
-                dset.resize((dset.shape[0], dset.shape[1] + 1, max_chromosome_size))  # pylint: disable=no-member
-            chrom_idx = [c for c in cset if c != '']
+        dset, cset, file_idx, chrom_idx = open_assembly_index(hdf5_in, assembly, file_id)
+        grp = hdf5_in[str(assembly)]
+        file_pos = file_idx.index(file_id)
+
+        # The spans written by a previous load of the file are cleared along
+        # with writing the new positions
+        spans = read_spans(grp, file_pos)
+
+        for chrom, starts, ends, values in runs:
+            covered = values != 0
+            if not covered.any():
+                continue
+
+            chrom_pos = add_chromosome(dset, cset, chrom_idx, chrom)
+
+            # Positions are stored 1-based to match the WIG coordinates
+            offset, dnp = intervals_to_mask(starts[covered] + 1, ends[covered] + 1)
+            write_span(grp, chrom_pos, file_pos, offset, offset + len(dnp))
+
+            offset, dnp = extend_mask(offset, dnp, *spans.pop(chrom_pos, (0, 0)))
+            dset[chrom_pos, file_pos, offset:offset + len(dnp)] = dnp
+
+        for chrom_pos, (first, last) in spans.items():
+            dset[chrom_pos, file_pos, first:last] = False
+            write_span(grp, chrom_pos, file_pos, 0, 0)
+
+        hdf5_in.close()
+
+        return True
+
+    @task(returns=bool, file_id=IN, assembly=IN, file_bedgraph=FILE_IN, file_hdf5=FILE_INOUT)
+    def bedgraph2hdf5(self, file_id, assembly, file_bedgraph, file_hdf5):
+        """
+        bedGraph to HDF5 converter
+
+        Loads a bedGraph file directly into the HDF5 index file that gets used
+        by the REST API without first converting it to a WIG file. The file is
+        parsed in blocks by :func:`mg_process_files.tool.wig_reader.bedgraph_runs`.
+
+        Parameters
+        ----------
+        file_id : str
+            The file_id as stored by the DMP so that it can be used for file
+            retrieval later
+        assembly : str
+            Assembly of the genome that is getting indexed so that the
+            chromosomes match
+        file_bedgraph : str
+            Location of the sorted bedGraph file
+        file_hdf5 : str
+            Location of the HDF5 index file
+
+        Example
+        -------
+        .. code-block:: python
+           :linenos:
+
+           if not self.bedgraph2hdf5(file_id, assembly, bedgraph_file, hdf5_file):
+               output_metadata.set_exception(
+                   Exception(
+                       "bedgraph2hdf5: Could not process files {}, {}.".format(*input_files)))
+
+        """
+        return self._runs2hdf5(file_id, assembly, bedgraph_runs(file_bedgraph), file_hdf5)
+
+    @staticmethod
+    def _open_signal_matrix(grp, file_chrom, bin_sizes, max_files):
+        """
+        Opens the cross-sample signal matrices for an assembly, creating them
+        from the chrom.size file if this is the first file to get added.
+
+        The chromosome layout is fixed when the matrices are created. Each
+        matrix has a row for each file in the presence index and a column for
+        each bin across the genome with the chromosomes concatenated in the
+        order of the ``chromosomes`` dataset.
+
+        Parameters
+        ----------
+        grp : h5py.Group
+            Assembly group within the HDF5 index file
+        file_chrom : str
+            Location of the chrom.size file
+        bin_sizes : list
+            Bin sizes that matrices are maintained for
+        max_files : int
+            Maximum number of files in the index
+
+        Returns
+        -------
+        h5py.Group
+            Group holding the signal matrices
+        """
+        if 'signal' in grp:
+            sgrp = grp['signal']
+        else:
+            chroms = []
+            lengths = []
+            with open(file_chrom, 'r') as f_in:
+                for line in f_in:
+                    sline = line.strip().split()
+                    if len(sline) < 2:
+                        continue
+                    chroms.append(sline[0])
+                    lengths.append(int(sline[1]))
+
+            sgrp = grp.create_group('signal')
+            sgrp.create_dataset(
+                'chromosomes', data=chroms, dtype=h5py.special_dtype(vlen=str))
+            sgrp.create_dataset('lengths', data=np.array(lengths, dtype='i8'))
+
+        lengths = sgrp['lengths'][:]
+        for bin_size in bin_sizes:
+            if str(bin_size) in sgrp:
+                continue
+            total_bins = int(np.ceil(lengths.astype('f8') / bin_size).sum())
+            sgrp.create_dataset(
+                str(bin_size), (max_files, total_bins), dtype='float32',
+                chunks=(min(max_files, 64), min(total_bins, 1024)),
+                fillvalue=np.nan, compression="gzip", shuffle=True)
+
+        return sgrp
+
+    @task(returns=bool, file_id=IN, assembly=IN, file_wig=FILE_IN, file_chrom=FILE_IN,
+          file_hdf5=FILE_INOUT, file_format=IN, bin_sizes=IN)
+    def wig2signal(  # pylint: disable=too-many-arguments,too-many-locals
+            self, file_id, assembly, file_wig, file_chrom, file_hdf5, file_format="wig",
+            bin_sizes=None):
+        """
+        WIG to cross-sample signal matrix
+
+        Adds the mean signal per bin for a WIG or bedGraph file to the signal
+        matrices for the assembly within the HDF5 index file. Each file is a
+        row in a (files x bins) dataset for each bin size, so the signal for a
+        region across all of the indexed files can be retrieved with a single
+        slice by :meth:`get_signal_matrix`. The matrices are updated in place
+        as each file is added.
+
+        Parameters
+        ----------
+        file_id : str
+            The file_id as stored by the DMP
+        assembly : str
+            Assembly of the genome that is getting indexed
+        file_wig : str
+            Location of the wig or bedGraph file
+        file_chrom : str
+            Location of the chrom.size file
+        file_hdf5 : str
+            Location of the HDF5 index file
+        file_format : str
+            Format of the input file, either "wig" or "bedgraph"
+        bin_sizes : list
+            Bin sizes to summarise the signal at. Defaults to 10kb and 100kb
 
+        Example
+        -------
+        .. code-block:: python
+           :linenos:
+
+           if not self.wig2signal(file_id, assembly, wig_file, chrom_file, hdf5_file):
+               output_metadata.set_exception(
+                   Exception(
+                       "wig2signal: Could not process files {}, {}.".format(*input_files)))
+
+        """
+        if bin_sizes is None:
+            bin_sizes = [10000, 100000]
+
+        hdf5_in = h5py.File(file_hdf5, "a")
+
+        dset, _, file_idx, _ = open_assembly_index(hdf5_in, assembly, file_id)
+        sgrp = self._open_signal_matrix(
+            hdf5_in[str(assembly)], file_chrom, bin_sizes, dset.maxshape[1])
+
+        chroms = decode_names(sgrp['chromosomes'])
+        lengths = sgrp['lengths'][:]
+        file_row = file_idx.index(file_id)
+
+        if file_format == "bedgraph":
+            runs = bedgraph_runs(file_wig)
         else:
-            # Create the initial dataset with minimum values
-            grp = hdf5_in.create_group(str(assembly))
-            # Setup the variable in the datastructure
-            meta = hdf5_in.create_group('meta')  # pylint: disable=unused-variable
-
-            dtf = h5py.special_dtype(vlen=str)
-            dtc = h5py.special_dtype(vlen=str)
-            fset = grp.create_dataset('files', (max_files,), dtype=dtf)
-            cset = grp.create_dataset('chromosomes', (max_chromosomes,), dtype=dtc)
-
-            file_idx = [file_id]
-            chrom_idx = []
-
-            dset = grp.create_dataset(
-                'data1', (0, 1, max_chromosome_size),
-                maxshape=(max_chromosomes, max_files, max_chromosome_size),
-                dtype='bool', chunks=True, compression="gzip")
-
-        # Save the list of files
-        fset[0:len(file_idx)] = file_idx
-
-        file_chrom_count = 0
-
-        dnp = np.zeros([max_chromosome_size], dtype='bool')
-
-        loaded = False
-
-        start = 0
-        span = 1
-        step = 1
-        step_type = 'variable'
-        previous_chrom = ''
-        previous_start = 0
-        previous_end = 0
-
-        with open(file_wig, 'r') as f_in:
-            for line in f_in:  # pylint: disable=too-many-nested-blocks
-                line = line.strip()
-                if line[0:9] == 'fixedStep' or line[0:12] == 'variableStep':
-                    start = 0
-                    span = 1
-                    step = 1
-                    previous_chrom = ''
-                    step_type = 'variable'
-
-                    sline = line.split(' ')
-
-                    if sline[0][0:9] == 'fixedStep':
-                        step_type = 'fixed'
-
-                    if previous_chrom != '':
-                        dnp[previous_start:previous_end + 1] = 1
-
-                    chrom = ''
-                    for key_value in sline[1:]:
-                        key_value.strip()
-                        if not key_value:
-                            continue
-                        k, i = key_value.split('=')
-                        if k == 'start':
-                            start = int(i)
-                        elif k == 'span':
-                            span = int(i)
-                        elif k == 'step':
-                            step = int(i)
-                        elif k == 'chrom':
-                            chrom = i
-
-                    file_chrom_count += 1
-                    if previous_chrom != '' and previous_chrom != chrom:
-                        if previous_chrom not in chrom_idx:
-                            chrom_idx.append(previous_chrom)
-                            cset[0:len(chrom_idx)] = chrom_idx
-                            dset.resize((dset.shape[0] + 1, dset.shape[1], max_chromosome_size))
-
-                        dset[chrom_idx.index(previous_chrom), file_idx.index(file_id), :] += dnp
-
-                        dnp = np.zeros([max_chromosome_size], dtype='bool')
-                        loaded = True
-
-                    previous_chrom = chrom
-
-                else:
-                    loaded = False
-                    if step_type == 'fixed':
-                        if float(line) == 0.0:
-                            if previous_start != previous_end:
-                                dnp[previous_start:previous_end + 1] = 1
-                                previous_start = 0
-                                previous_end = 0
-                        else:
-                            if previous_start == 0:
-                                previous_start = start
-                                previous_end = start + span - 1
-                            else:
-                                if previous_end == start - 1:
-                                    previous_end += span
-                                else:
-                                    dnp[previous_start:previous_end + 1] = 1
-                                    previous_start = start
-                                    previous_end = start + span - 1
-
-                        start += step
-
-                    elif step_type == 'variable':
-                        sline = line.split("\t")
-                        if float(sline[1]) == 0.0:
-                            if previous_start != previous_end:
-                                dnp[previous_start:previous_end + 1] = 1
-                                previous_start = 0
-                                previous_end = 0
-                        else:
-                            if previous_start == 0:
-                                previous_start = int(sline[0])
-                                previous_end = int(sline[0]) + span - 1
-                            else:
-                                if previous_end == int(sline[0]) - 1:
-                                    previous_end += span
-                                else:
-                                    dnp[previous_start:previous_end + 1] = 1
-                                    previous_start = int(sline[0])
-                                    previous_end = int(sline[0]) + span - 1
-
-            if loaded is False:
-                if previous_chrom not in chrom_idx:
-                    chrom_idx.append(chrom)
-                    cset[0:len(chrom_idx)] = chrom_idx
-                    dset.resize((dset.shape[0] + 1, dset.shape[1], max_chromosome_size))
-
-                dset[chrom_idx.index(previous_chrom), file_idx.index(file_id), :] = dnp
+            runs = wig_runs(file_wig)
+
+        for chrom, starts, ends, values in runs:
+            if chrom not in chroms:
+                logger.warn("wig2signal: " + chrom + " is not in the chrom.size file")
+                continue
+
+            chrom_pos = chroms.index(chrom)
+            for bin_size in bin_sizes:
+                bins = np.ceil(lengths.astype('f8') / bin_size).astype('i8')
+                offset = int(bins[0:chrom_pos].sum())
+                sgrp[str(bin_size)][file_row, offset:offset + bins[chrom_pos]] = runs_to_bins(
+                    starts, ends, values, lengths[chrom_pos], bin_size)
 
         hdf5_in.close()
 
         return True
 
+    @staticmethod
+    def get_signal_matrix(file_hdf5, assembly, chrom, start, end, bin_size=10000):
+        """
+        Cross-sample signal reader
+
+        Reads the mean signal for a region across all of the files that have
+        been indexed for an assembly as a single slice of the signal matrix.
+
+        Parameters
+        ----------
+        file_hdf5 : str
+            Location of the HDF5 index file
+        assembly : str
+            Assembly of the genome
+        chrom : str
+            Chromosome name
+        start : int
+            Start of the region
+        end : int
+            End of the region
+        bin_size : int
+            Resolution of the matrix to read
+
+        Returns
+        -------
+        tuple
+            file_ids : list
+                file_id for each row of the matrix
+            bin_starts : numpy.ndarray
+                Start position of each column of the matrix
+            matrix : numpy.ndarray
+                (files x bins) array of the mean signal. Bins without any
+                signal are NaN
+
+        Example
+        -------
+        .. code-block:: python
+           :linenos:
+
+           file_ids, bins, matrix = wigIndexerTool.get_signal_matrix(
+               hdf5_file, "GRCh38", "chr1", 1000000, 2000000, 10000)
+        """
+        with h5py.File(file_hdf5, "r") as hdf5_in:
+            grp = hdf5_in[str(assembly)]
+            sgrp = grp['signal']
+
+            file_ids = [i for i in decode_names(grp['files']) if i != '']
+            chroms = decode_names(sgrp['chromosomes'])
+            lengths = sgrp['lengths'][:]
+
+            chrom_pos = chroms.index(chrom)
+            bins = np.ceil(lengths.astype('f8') / bin_size).astype('i8')
+            offset = int(bins[0:chrom_pos].sum())
+
+            first_bin = max(int(start) // bin_size, 0)
+            last_bin = min(int(np.ceil(float(end) / bin_size)), int(bins[chrom_pos]))
+
+            matrix = sgrp[str(bin_size)][0:len(file_ids), offset + first_bin:offset + last_bin]
+
+        bin_starts = np.arange(first_bin, last_bin, dtype='i8') * bin_size
+
+        return (file_ids, bin_starts, matrix)
+
     def run(self, input_files, input_metadata, output_files):
         """
         Function to run the WIG file sorter and indexer so that the files can
         get searched as part of the REST API
 
+        bedGraph files are accepted in place of the WIG file when the
+        file_type of the input metadata is "bedgraph".
+
+        If "signal_matrix" is set in the configuration the mean signal per bin
+        is also added to the cross-sample signal matrices. The bin sizes are
+        set with "signal_bin_sizes" and default to 10kb and 100kb.
+
         Parameters
         ----------
         input_files : dict
             wig_file : str
-                Location of the wig file
+                Location of the wig or bedGraph file
             chrom_size : str
                 Location of chrom.size file
             hdf5_file : str
@@ -337,15 +508,30 @@ class wigIndexerTool(Tool):
         logger.info(
             'PIPELINE FILES:', input_files["wig"], input_files["chrom_file"],
             output_files["bw_file"])
+        file_format = "wig"
+        if input_metadata["wig"].file_type.lower() == "bedgraph":
+            file_format = "bedgraph"
+
         results_1 = self.wig2bigwig(
-            input_files["wig"], input_files["chrom_file"], output_files["bw_file"])
+            input_files["wig"], input_files["chrom_file"], output_files["bw_file"], file_format)
         results_1 = compss_wait_on(results_1)
 
-        results_2 = self.wig2hdf5(
-            input_files["wig"], input_metadata["wig"].meta_data["assembly"],
-            input_files["wig"], input_files["hdf5_file"])
+        if file_format == "bedgraph":
+            results_2 = self.bedgraph2hdf5(
+                input_files["wig"], input_metadata["wig"].meta_data["assembly"],
+                input_files["wig"], input_files["hdf5_file"])
+        else:
+            results_2 = self.wig2hdf5(
+                input_files["wig"], input_metadata["wig"].meta_data["assembly"],
+                input_files["wig"], input_files["hdf5_file"])
         results_2 = compss_wait_on(results_2)
 
+        if self.configuration.get("signal_matrix", False):
+            compss_wait_on(self.wig2signal(
+                input_files["wig"], input_metadata["wig"].meta_data["assembly"],
+                input_files["wig"], input_files["chrom_file"], input_files["hdf5_file"],
+                file_format, self.configuration.get("signal_bin_sizes", [10000, 100000])))
+
         output_generated_files = {
             "bw_file": output_files["bw_file"],
             "hdf5_file": input_files["hdf5_file"]
@@ -0,0 +1,374 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+from itertools import islice
+
+import numpy as np
+
+# ------------------------------------------------------------------------------
+
+BEDGRAPH_DTYPE = np.dtype([
+    ('chrom', str, 256),
+    ('start', 'i8'),
+    ('end', 'i8'),
+    ('value', 'f4')
+])
+
+BEDGRAPH_SKIP = ('#', 'track', 'browser')
+
+RUN_DTYPE = np.dtype([
+    ('start', 'i8'),
+    ('end', 'i8'),
+    ('value', 'f4')
+])
+
+WIG_VARIABLE_DTYPE = np.dtype([
+    ('pos', 'i8'),
+    ('value', 'f4')
+])
+
+
+def collapse_runs(starts, ends, values):
+    """
+    Run-length encoding of the signal
+
+    Collapses consecutive runs that are contiguous and have the same value into
+    a single run.
+
+    Parameters
+    ----------
+    starts : numpy.ndarray
+        Start of each run
+    ends : numpy.ndarray
+        End of each run
+    values : numpy.ndarray
+        Value for each run
+
+    Returns
+    -------
+    tuple
+        starts : numpy.ndarray
+        ends : numpy.ndarray
+        values : numpy.ndarray
+    """
+    if len(starts) < 2:
+        return (starts, ends, values)
+
+    breaks = np.flatnonzero(
+        (values[1:] != values[:-1]) | (starts[1:] != ends[:-1])
+    ) + 1
+    first = np.concatenate(([0], breaks))
+    last = np.concatenate((breaks - 1, [len(ends) - 1]))
+
+    return (starts[first], ends[last], values[first])
+
+
+def _concat_runs(chrom, parts):
+    """
+    Join the blocks of runs that were read for a single chromosome into a
+    single set of run arrays, collapsing runs that span the block boundaries.
+
+    Parameters
+    ----------
+    chrom : str
+        Chromosome name
+    parts : list
+        List of structured arrays with ``start``, ``end`` and ``value`` fields
+
+    Returns
+    -------
+    tuple
+        chrom : str
+        starts : numpy.ndarray
+        ends : numpy.ndarray
+        values : numpy.ndarray
+    """
+    block = np.concatenate(parts)
+    starts, ends, values = collapse_runs(block['start'], block['end'], block['value'])
+    return (str(chrom), starts, ends, values)
+
+
+def bedgraph_runs(file_bedgraph, chunk_size=1000000):
+    """
+    bedGraph run reader
+
+    Reads a bedGraph file in blocks of lines with ``numpy.loadtxt`` and yields
+    the runs for each chromosome as a set of numpy arrays. Coordinates are
+    0-based half-open as in the bedGraph file. Contiguous runs with the same
+    value are collapsed. The file needs to be sorted by chromosome and start,
+    as is required by ``wigToBigWig``.
+
+    Parameters
+    ----------
+    file_bedgraph : str
+        Location of the bedGraph file
+    chunk_size : int
+        Number of lines to parse in each block
+
+    Returns
+    -------
+    generator
+        chrom : str
+            Chromosome name
+        starts : numpy.ndarray
+            Start of each run
+        ends : numpy.ndarray
+            End of each run
+        values : numpy.ndarray
+            Value for each run
+
+    Example
+    -------
+    .. code-block:: python
+       :linenos:
+
+       for chrom, starts, ends, values in bedgraph_runs(bedgraph_file):
+           print(chrom, len(starts))
+    """
+    chrom = None
+    parts = []
+
+    with open(file_bedgraph, 'r') as f_in:
+        while True:
+            raw = list(islice(f_in, chunk_size))
+            if not raw:
+                break
+
+            lines = [line for line in raw if line.strip() and not line.startswith(BEDGRAPH_SKIP)]
+            if not lines:
+                continue
+
+            block = np.loadtxt(lines, dtype=BEDGRAPH_DTYPE, usecols=(0, 1, 2, 3), ndmin=1)
+            chroms = block['chrom']
+            bounds = np.flatnonzero(chroms[1:] != chroms[:-1]) + 1
+
+            for sub_block in np.split(block, bounds):
+                if chrom is not None and sub_block['chrom'][0] != chrom:
+                    yield _concat_runs(chrom, parts)
+                    parts = []
+                chrom = sub_block['chrom'][0]
+                parts.append(sub_block)
+
+    if parts:
+        yield _concat_runs(chrom, parts)
+
+
+def _wig_block(section, lines):
+    """
+    Converts a block of data lines from a fixedStep or variableStep section of
+    a WIG file into collapsed runs.
+
+    Parameters
+    ----------
+    section : dict
+        Parameters from the section declaration line. For fixedStep sections
+        the start is moved on past the lines in the block.
+    lines : list
+        Data lines from the section
+
+    Returns
+    -------
+    numpy.ndarray
+        Structured array with ``start``, ``end`` and ``value`` fields
+    """
+    if section['type'] == 'fixed':
+        values = np.loadtxt(lines, dtype='f4', usecols=(0,), ndmin=1)
+        starts = section['start'] - 1 + section['step'] * np.arange(len(values), dtype='i8')
+        section['start'] += section['step'] * len(values)
+    else:
+        block = np.loadtxt(lines, dtype=WIG_VARIABLE_DTYPE, usecols=(0, 1), ndmin=1)
+        starts = block['pos'] - 1
+        values = block['value']
+
+    starts, ends, values = collapse_runs(starts, starts + section['span'], values)
+
+    runs = np.empty(len(starts), dtype=RUN_DTYPE)
+    runs['start'] = starts
+    runs['end'] = ends
+    runs['value'] = values
+
+    return runs
+
+
+def wig_runs(file_wig, chunk_size=1000000):  # pylint: disable=too-many-branches
+    """
+    WIG run reader
+
+    Reads a fixedStep or variableStep WIG file and yields the signal for each
+    chromosome as run-length encoded numpy arrays. Consecutive positions that
+    are contiguous and share the same value are collapsed into a single
+    (start, end, value) run as the file is read, so smooth tracks are reduced
+    to a small number of runs. Coordinates are converted to the 0-based
+    half-open runs that are produced by :func:`bedgraph_runs`.
+
+    Parameters
+    ----------
+    file_wig : str
+        Location of the WIG file
+    chunk_size : int
+        Maximum number of data lines to parse in each block
+
+    Returns
+    -------
+    generator
+        chrom : str
+            Chromosome name
+        starts : numpy.ndarray
+            Start of each run
+        ends : numpy.ndarray
+            End of each run
+        values : numpy.ndarray
+            Value for each run
+
+    Example
+    -------
+    .. code-block:: python
+       :linenos:
+
+       for chrom, starts, ends, values in wig_runs(wig_file):
+           print(chrom, len(starts))
+    """
+    chrom = None
+    parts = []
+    section = None
+    lines = []
+
+    with open(file_wig, 'r') as f_in:
+        for line in f_in:
+            if line[0:9] == 'fixedStep' or line[0:12] == 'variableStep':
+                if lines:
+                    parts.append(_wig_block(section, lines))
+                    lines = []
+
+                section = {'type': 'variable', 'start': 1, 'step': 1, 'span': 1}
+                if line[0:9] == 'fixedStep':
+                    section['type'] = 'fixed'
+
+                section_chrom = None
+                for key_value in line.split()[1:]:
+                    k, i = key_value.split('=')
+                    if k == 'chrom':
+                        section_chrom = i
+                    elif k in ('start', 'step', 'span'):
+                        section[k] = int(i)
+
+                if chrom is not None and section_chrom != chrom and parts:
+                    yield _concat_runs(chrom, parts)
+                    parts = []
+                chrom = section_chrom
+
+            elif line.startswith(BEDGRAPH_SKIP) or not line.strip():
+                continue
+
+            else:
+                lines.append(line)
+                if len(lines) >= chunk_size:
+                    parts.append(_wig_block(section, lines))
+                    lines = []
+
+    if lines:
+        parts.append(_wig_block(section, lines))
+    if parts:
+        yield _concat_runs(chrom, parts)
+
+
+def write_bedgraph(f_out, chrom, starts, ends, values):
+    """
+    Writes a set of runs to an open file handle or pipe in bedGraph format.
+
+    Parameters
+    ----------
+    f_out : file
+        Open file handle
+    chrom : str
+        Chromosome name
+    starts : numpy.ndarray
+        Start of each run
+    ends : numpy.ndarray
+        End of each run
+    values : numpy.ndarray
+        Value for each run
+    """
+    np.savetxt(
+        f_out, np.column_stack((starts, ends, values)),
+        fmt=chrom.replace('%', '%%') + '\t%d\t%d\t%.9g'
+    )
+
+
+def runs_to_bins(starts, ends, values, length, bin_size):
+    """
+    Mean signal per bin
+
+    Summarises the runs for a chromosome as the mean value over the covered
+    positions within each bin. The integral of the signal is calculated at
+    the run boundaries and interpolated at the bin edges, so the cost is
+    proportional to the number of runs and bins rather than the number of
+    positions.
+
+    Parameters
+    ----------
+    starts : numpy.ndarray
+        Start of each run
+    ends : numpy.ndarray
+        End of each run
+    values : numpy.ndarray
+        Value for each run
+    length : int
+        Length of the chromosome
+    bin_size : int
+        Width of each bin
+
+    Returns
+    -------
+    numpy.ndarray
+        Mean value for each bin. Bins without any coverage are NaN.
+    """
+    n_bins = int(np.ceil(float(length) / bin_size))
+    edges = np.minimum(np.arange(n_bins + 1, dtype='i8') * bin_size, length)
+
+    starts = np.clip(starts, 0, length)
+    ends = np.clip(ends, 0, length)
+    widths = (ends - starts).astype('f8')
+
+    cum_signal = np.cumsum(values * widths)
+    cum_coverage = np.cumsum(widths)
+
+    x_points = np.empty(2 * len(starts), dtype='f8')
+    x_points[0::2] = starts
+    x_points[1::2] = ends
+
+    signal = np.empty(len(x_points), dtype='f8')
+    signal[0::2] = cum_signal - values * widths
+    signal[1::2] = cum_signal
+
+    coverage = np.empty(len(x_points), dtype='f8')
+    coverage[0::2] = cum_coverage - widths
+    coverage[1::2] = cum_coverage
+
+    mean = np.full(n_bins, np.nan, dtype='f4')
+    if len(x_points) == 0:
+        return mean
+
+    bin_signal = np.diff(np.interp(edges, x_points, signal))
+    bin_coverage = np.diff(np.interp(edges, x_points, coverage))
+
+    covered = bin_coverage > 0
+    mean[covered] = bin_signal[covered] / bin_coverage[covered]
+
+    return mean
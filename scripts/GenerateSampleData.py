@@ -0,0 +1,81 @@
+"""
+.. See the NOTICE file distributed with this work for additional information
+   regarding copyright ownership.
+
+   Licensed under the Apache License, Version 2.0 (the "License");
+   you may not use this file except in compliance with the License.
+   You may obtain a copy of the License at
+
+       http://www.apache.org/licenses/LICENSE-2.0
+
+   Unless required by applicable law or agreed to in writing, software
+   distributed under the License is distributed on an "AS IS" BASIS,
+   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+   See the License for the specific language governing permissions and
+   limitations under the License.
+"""
+
+from __future__ import print_function
+
+import argparse
+import os.path
+
+from mg_process_files.tool.sample_data import (
+    make_genome, write_chrom_sizes, generate_bed, generate_gff3, generate_wig,
+    generate_bedgraph, generate_tadbit_archive)
+
+# ------------------------------------------------------------------------------
+
+# Writes a synthetic genome and a file in each of the input formats to a
+# directory, eg for performance testing of the tools. With mg_process_files
+# installed, or on the PYTHONPATH:
+#
+#   python scripts/GenerateSampleData.py --output_dir /tmp/synthetic \
+#       --genome_size 100000000 --models 500 --beads 200 --seed 1
+
+
+if __name__ == "__main__":
+    PARSER = argparse.ArgumentParser(description="Generate synthetic input files")
+    PARSER.add_argument("--output_dir", default=".", help="Directory to write the files to")
+    PARSER.add_argument("--seed", type=int, default=0, help="Seed for the random number generator")
+    PARSER.add_argument("--chromosomes", type=int, default=3, help="Number of chromosomes")
+    PARSER.add_argument(
+        "--genome_size", type=int, default=10000000, help="Total length of the genome")
+    PARSER.add_argument("--bed_density", type=float, default=100, help="BED features per Mb")
+    PARSER.add_argument("--gff3_density", type=float, default=20, help="GFF3 genes per Mb")
+    PARSER.add_argument("--wig_density", type=float, default=10, help="Covered WIG blocks per Mb")
+    PARSER.add_argument(
+        "--wig_block_length", type=int, default=10000, help="Mean length of the WIG blocks")
+    PARSER.add_argument("--wig_span", type=int, default=1, help="Bases covered by each WIG value")
+    PARSER.add_argument("--regions", type=int, default=4, help="Number of 3D model regions")
+    PARSER.add_argument("--models", type=int, default=100, help="Number of models for each region")
+    PARSER.add_argument("--beads", type=int, default=50, help="Number of beads in each model")
+    PARSER.add_argument("--resolution", type=int, default=10000, help="Bases for each bead")
+
+    ARGS = PARSER.parse_args()
+
+    def output_path(name):
+        """
+        Location of an output file
+        """
+        return os.path.join(ARGS.output_dir, name)
+
+    GENOME = make_genome(ARGS.chromosomes, ARGS.genome_size, ARGS.seed)
+    write_chrom_sizes(output_path("synthetic.size"), GENOME)
+
+    print("BED features:", generate_bed(
+        output_path("synthetic.bed"), GENOME, ARGS.bed_density, ARGS.seed))
+    print("GFF3 features:", generate_gff3(
+        output_path("synthetic.gff3"), GENOME, ARGS.gff3_density, seed=ARGS.seed))
+
+    for step_type in ("fixed", "variable"):
+        print("WIG {}Step values:".format(step_type), generate_wig(
+            output_path("synthetic." + step_type + ".wig"), GENOME, step_type,
+            ARGS.wig_density, ARGS.wig_block_length, ARGS.wig_span, ARGS.seed))
+    print("bedGraph values:", generate_bedgraph(
+        output_path("synthetic.bedgraph"), GENOME, ARGS.wig_density,
+        ARGS.wig_block_length, ARGS.wig_span, ARGS.seed))
+
+    print("3D model regions:", len(generate_tadbit_archive(
+        output_path("synthetic_3D_models.tar.gz"), GENOME, ARGS.regions, ARGS.models,
+        ARGS.beads, ARGS.resolution, seed=ARGS.seed)))
@@ -35,4 +35,9 @@ tc=$?
 rc=$(($rc + $tc))
 ./tidy_data.sh
 
+pytest mg_process_files/tests/test_sample_data_functions.py
+tc=$?
+rc=$(($rc + $tc))
+./tidy_data.sh
+
 if [[ $rc != 0 ]]; then exit $rc; fi